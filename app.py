@@ -1,7 +1,15 @@
 import streamlit as st
+import os
 import time
 import json
-from orchestrator import Orchestrator
+from orchestrator import Orchestrator, STAT_CATEGORIES
+from worker import GenerationWorker
+from validator import structured_text
+
+RESULTS_DIR = ".app_results"   # every session's results (accepted + rejected) as JSONL
+RECENT_WINDOW = 10             # questions kept on screen; older ones are paged from storage
+PAGE_SIZE = 10
+POLL_INTERVAL = 1.0            # seconds between UI refreshes while the worker is active
 
 st.set_page_config(page_title="Team DeepMind", page_icon="", layout="wide")
 
@@ -24,6 +32,9 @@ if "stats" not in st.session_state:
     st.session_state.stats = st.session_state.orch.stats
 if "research_done" not in st.session_state:
     st.session_state.research_done = False
+if "worker" not in st.session_state:
+    results_path = os.path.join(RESULTS_DIR, f"session-{int(time.time())}.jsonl")
+    st.session_state.worker = GenerationWorker(st.session_state.orch, results_path, recent_size=RECENT_WINDOW)
 
 # --- SIDEBAR (LEFT COLUMN) ---
 with st.sidebar:
@@ -44,102 +55,182 @@ with st.sidebar:
     target_q = st.slider("Target Questions", 1, 50, 3)
     
     if st.button("🧹 Clear Stats"):
-        st.session_state.stats = {
-            "SUCCESS": 0, "HALLUCINATION": 0,
-            "CONSENSUS_FAILURE": 0, "PARSING_ERROR": 0, "DUPLICATE": 0
-        }
+        st.session_state.stats = {k: 0 for k in STAT_CATEGORIES}
         st.session_state.research_done = False
     
     st.divider()
     with st.expander("📊 System Health"):
         metric_ph = st.empty()
         dup_metric = st.empty()
+        cache_ph = st.empty()
+        upload_ph = st.empty()
+        sched_ph = st.empty()
         chart_ph = st.empty()
+        latency_ph = st.empty()
+        topics_ph = st.empty()
 
 # --- MAIN LAYOUT ---
+orch = st.session_state.orch
+worker = st.session_state.worker
+
+# Pull whatever the background worker produced since the last script run
+_, new_stats = worker.poll()
+if new_stats:
+    st.session_state.stats = new_stats
+if orch.research_findings and worker.status != "researching":
+    st.session_state.research_done = True
+
+
+def render_question(result_data, compact=False):
+    cat = result_data.get('category', 'General')
+    diff = result_data.get('difficulty', 'Medium')
+
+    st.markdown(f"### {cat} :grey[[{diff}]]")
+    st.info(f"**Q:** {result_data['story']}")
+    if compact:
+        st.caption(f"Answer: {result_data.get('correct_option', '?')}")
+        return
+
+    st.markdown("#### 🏛️ The Council's Verdict")
+    tab1, tab2, tab3 = st.tabs(["🤖 Solver A (Code)", "🧠 Solver B (Logic)", "🕵️ Solver C (Skeptic)"])
+
+    with tab1:
+        st.code(result_data.get('solver_a_raw', ''), language="python")
+        if result_data.get('equation_visual'):
+            st.latex(result_data['equation_visual'])
+    with tab2:
+        st.markdown(f"> {structured_text(result_data.get('solver_b_raw', ''))}")
+    with tab3:
+        st.warning(structured_text(result_data.get('solver_c_raw', '')))
+
+    st.success("✅ Validated & Deployed")
+
+
 st.subheader("📝 Live Operations")
-start_btn = st.button("🚀 Start Generation Loop")
-q_display = st.container()
+c_start, c_pause, c_stop = st.columns(3)
+start_btn = c_start.button("🚀 Start Generation Loop", disabled=worker.active)
+if worker.status == "paused":
+    pause_btn = c_pause.button("▶️ Resume")
+else:
+    pause_btn = c_pause.button("⏸️ Pause", disabled=worker.status != "running")
+stop_btn = c_stop.button("🛑 Stop", disabled=not worker.active)
 
 if start_btn:
     if source_mode == "Upload Custom PDF" and not uploaded_file:
         st.error("⚠️ Please upload a PDF file first!")
         st.stop()
+    # Research runs in the worker too (an already-analyzed PDF is a cache hit)
+    worker.start(target_q, custom_file=uploaded_file)
+    st.session_state.celebrated = False
+    st.rerun()
+if pause_btn:
+    worker.pause() if worker.status == "running" else worker.resume()
+    st.rerun()
+if stop_btn:
+    worker.stop()
+    st.rerun()
 
-    # --- PHASE 1: RESEARCH ---
-    if not st.session_state.research_done:
-        with st.spinner("🕵️ Agent is analyzing source material..."):
-            # ✅ PASS FILE TO ORCHESTRATOR
-            findings = st.session_state.orch.perform_research(custom_file=uploaded_file)
-            st.session_state.research_done = True
-            with st.expander("View Research Findings"):
-                st.json(findings)
-    
-    # --- PHASE 2: GENERATION ---
-    success_count = 0
-    attempt = 0
-    progress_bar = st.progress(0)
-    
-    while success_count < target_q:
-        attempt += 1
-        with st.spinner(f"Attempt {attempt}: The Council is deliberating..."):
-            if attempt == 1:
-                # ✅ INITIALIZE WITH FILE
-                st.session_state.orch.init_generator(custom_file=uploaded_file)
-
-            result_data = st.session_state.orch.run_loop()
-            st.session_state.stats = st.session_state.orch.stats
-            
-            # Update Metrics
-            with metric_ph.container():
-                c1, c2 = st.columns(2)
-                c1.metric("Success", st.session_state.stats["SUCCESS"])
-                c2.metric("Errors", st.session_state.stats["HALLUCINATION"] + st.session_state.stats["CONSENSUS_FAILURE"])
-            
-            dup_metric.metric("Duplicates Avoided", st.session_state.stats["DUPLICATE"])
-            
-            # --- VISUALIZATION (Standard Bar Chart) ---
-            with chart_ph.container():
-                st.bar_chart(st.session_state.stats)
-
-            # --- RESULT HANDLING ---
-            if result_data and "story" in result_data:
-                success_count += 1
-                progress_bar.progress(success_count / target_q)
-                
-                with q_display:
-                    cat = result_data.get('category', 'General')
-                    diff = result_data.get('difficulty', 'Medium')
-                    color = "green" if diff == "Easy" else "orange" if diff == "Medium" else "red"
-                    
-                    st.markdown(f"### {cat} :grey[[{diff}]]")
-                    st.info(f"**Q:** {result_data['story']}")
-                    
-                    st.markdown("#### 🏛️ The Council's Verdict")
-                    tab1, tab2, tab3 = st.tabs(["🤖 Solver A (Code)", "🧠 Solver B (Logic)", "🕵️ Solver C (Skeptic)"])
-                    
-                    with tab1:
-                        st.code(result_data['solver_a_raw'], language="python")
-                        if result_data.get('equation_visual'):
-                            st.latex(result_data['equation_visual'])
-                    with tab2:
-                        st.markdown(f"> {result_data['solver_b_raw']}")
-                    with tab3:
-                        st.warning(result_data['solver_c_raw'])
-                    
-                    st.success("✅ Validated & Deployed")
-                    st.divider()
-            
-            elif result_data and "failure_type" in result_data:
-                fail_type = result_data["failure_type"]
-                reason = result_data["reason"]
-                st.error(f"❌ Attempt {attempt} Rejected: {fail_type}")
-                if reason:
-                    with st.expander("Details"): st.text(reason)
-            else:
-                st.toast(f"Attempt {attempt} Skipped: {result_data.get('failure_type', 'Unknown')}", icon="⚠️")
-            
-            time.sleep(1)
+# --- STATUS ---
+status_text = {
+    "idle": "Idle", "researching": "🕵️ Agent is analyzing source material...",
+    "running": "The Council is deliberating...", "paused": "⏸️ Paused (questions in flight still finish)",
+    "stopping": "🛑 Stopping: finishing questions in flight...", "done": "Done", "stopped": "Stopped",
+    "error": f"❌ Worker failed: {worker.error}",
+}[worker.status]
+st.caption(f"{status_text} • {worker.accepted} accepted • {worker.rejected} rejected this session")
+if worker.status == "researching" and worker.research_progress:
+    done, total = worker.research_progress
+    st.progress(done / total, text=f"📚 {done}/{total} sections analyzed")
+elif worker.target:
+    st.progress(worker.progress)
+
+if st.session_state.research_done:
+    with st.expander("View Research Findings"):
+        st.json(orch.research_findings)
 
+if worker.status == "done" and not st.session_state.get("celebrated", True):
+    st.session_state.celebrated = True
     st.balloons()
     st.success("🎉 Batch Generation Complete!")
+
+# --- SYSTEM HEALTH ---
+stats = st.session_state.stats
+with metric_ph.container():
+    c1, c2 = st.columns(2)
+    c1.metric("Success", stats["SUCCESS"] + stats.get("REPAIRED", 0))
+    c2.metric("Errors", stats["HALLUCINATION"] + stats["CONSENSUS_FAILURE"])
+
+dup_metric.metric("Duplicates Avoided", stats["DUPLICATE"])
+cache = orch.cache_stats
+cache_ph.caption(f"LLM cache: {cache['hits']} hits / {cache['misses']} misses")
+uploads = orch.upload_stats
+upload_ph.caption(f"Uploads: {uploads['uploaded']} sent • {uploads['backlog'] + uploads['parked']} pending")
+sched = orch.scheduler_stats
+sched_ph.caption(f"Rate limiter: {sched['queued']} queued • {sched['throttled']} throttled • {sched['rate_limited']} × 429")
+
+# --- VISUALIZATION (Standard Bar Chart) ---
+with chart_ph.container():
+    st.bar_chart(stats)
+
+# --- LATENCY (per stage and per model role, from the tracer's histograms) ---
+with latency_ph.container():
+    stage_rows = orch.latency_summary("stage")
+    model_rows = orch.latency_summary("model")
+    if stage_rows:
+        st.caption("Stage latency (ms)")
+        st.dataframe(stage_rows, hide_index=True)
+    if model_rows:
+        st.caption("Model latency by role (ms)")
+        st.dataframe(model_rows, hide_index=True)
+
+# --- TOPIC YIELD (adaptive topic scheduler) ---
+with topics_ph.container():
+    topic_rows = orch.topic_yield
+    if topic_rows:
+        st.caption("Topic yield (accepted per model call)")
+        st.dataframe(topic_rows, hide_index=True)
+
+# --- RECENT RESULTS (bounded window, newest first) ---
+for result_data in reversed(worker.recent):
+    if "story" in result_data and "failure_type" not in result_data:
+        render_question(result_data)
+        st.divider()
+    else:
+        fail_type = result_data.get("failure_type", "Unknown")
+        reason = result_data.get("reason")
+        st.error(f"❌ Attempt Rejected: {fail_type}")
+        if reason:
+            with st.expander("Details"): st.text(reason)
+
+# --- OLDER QUESTIONS (paged from storage) ---
+if worker.accepted > RECENT_WINDOW:
+    with st.expander(f"📚 All accepted questions ({worker.accepted})"):
+        page = st.number_input("Page (newest first)", min_value=1,
+                               max_value=worker.page_count(PAGE_SIZE), value=1) - 1
+        for record in worker.page(page, PAGE_SIZE):
+            render_question(record, compact=True)
+
+# --- QUESTION STORE (every attempt, accepted and rejected; filtered & paged in SQLite) ---
+if orch.store is not None:
+    with st.expander("🗄️ Question Store"):
+        outcomes = orch.store.counts("outcome")
+        st.caption(" • ".join(f"{k}: {v}" for k, v in outcomes.items()) or "Empty")
+        f_outcome, f_category, f_page = st.columns(3)
+        outcome = f_outcome.selectbox("Outcome", ["All", "ACCEPTED", "REJECTED", *[o for o in outcomes if o != "ACCEPTED"]])
+        category = f_category.selectbox("Category", ["All", *orch.store.distinct("category")])
+        filters = {"outcome": None if outcome == "All" else outcome,
+                   "category": None if category == "All" else category}
+        pages = max(1, -(-orch.store.count(**filters) // PAGE_SIZE))
+        page = f_page.number_input("Page", min_value=1, max_value=pages, value=1) - 1
+        rows = orch.store.query(limit=PAGE_SIZE, offset=page * PAGE_SIZE, **filters)
+        st.dataframe([{
+            "id": r["id"], "time": time.strftime("%H:%M:%S", time.localtime(r["ts"])),
+            "outcome": r.get("failure_type", "ACCEPTED"), "category": r.get("category"),
+            "difficulty": r.get("difficulty"), "calls": r.get("model_calls"),
+            "story": (r.get("story") or "")[:120],
+        } for r in rows], hide_index=True)
+
+# Keep polling while the worker is busy (each rerun only redraws the bounded window)
+if worker.active:
+    time.sleep(POLL_INTERVAL)
+    st.rerun()
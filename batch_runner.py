@@ -0,0 +1,210 @@
+"""
+Headless batch runner: generates questions without the Streamlit UI.
+
+Accepted questions are appended to --out and rejected attempts to --rejected
+(JSONL, one record per line, written as they complete). A checkpoint
+(stats, research findings, dedup hashes, progress) is saved next to the
+output every --checkpoint-every results and on exit, so re-running the same
+command after a crash or Ctrl-C resumes where it stopped.
+
+    python batch_runner.py --target 10000 --out questions.jsonl
+    python batch_runner.py --target 500 --topics "Time & Work,Boats & Streams" --workers 8
+    python batch_runner.py --target 200 --pdf syllabus.pdf --out pdf_batch.jsonl
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from pipeline import DISCARDED
+
+
+def repair_jsonl(path):
+    """Drops a half-written last line (killed mid-write). Returns the number of complete records."""
+    if not os.path.exists(path): return 0
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+            print(f"   🩹 Dropped a partial record at the end of {path}")
+    return data[:end].count(b"\n")
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print(f"   ⚠️ Ignoring unreadable checkpoint {path}: {e}")
+        return None
+
+
+def save_checkpoint(path, state):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class BatchRunner:
+    def __init__(self, orch, out_path, rejected_path, checkpoint_path, checkpoint_every=25):
+        self.orch = orch
+        self.out_path = out_path
+        self.rejected_path = rejected_path
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+
+        self.accepted = repair_jsonl(out_path)
+        self.rejected = repair_jsonl(rejected_path)
+        self.attempts = self.accepted + self.rejected
+        self._since_checkpoint = 0
+        self._lock = threading.Lock()
+        self._out = open(out_path, "a", encoding="utf-8")
+        self._rejected = open(rejected_path, "a", encoding="utf-8")
+        self.started = time.monotonic()
+        self.started_accepted = self.accepted
+
+    def resume(self):
+        """Restores orchestrator state from the checkpoint and re-seeds dedup from what was written."""
+        state = load_checkpoint(self.checkpoint_path)
+        if state is not None:
+            self.orch.load_state(state["orchestrator"])
+        if self.accepted:
+            # Covers questions written after the last checkpoint too
+            self.orch.load_question_archive(self.out_path)
+        if state is not None or self.accepted:
+            print(f"   ♻️ Resuming: {self.accepted} accepted, {self.rejected} rejected so far.")
+
+    def checkpoint(self):
+        with self._lock:
+            self._out.flush()
+            self._rejected.flush()
+            state = {
+                "saved_at": time.time(),
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "orchestrator": self.orch.export_state(),
+            }
+            save_checkpoint(self.checkpoint_path, state)
+            self._since_checkpoint = 0
+
+    def on_result(self, result):
+        # Left over when the target was reached: not an attempt (the question store keeps it)
+        if result.get("failure_type") == DISCARDED: return
+        record = {**result, "ts": round(time.time(), 3)}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            # Flushed per record: a killed run keeps every question it already finished (and uploaded),
+            # so a resume never regenerates past the target
+            if "failure_type" in result:
+                self._rejected.write(line)
+                self._rejected.flush()
+                self.rejected += 1
+            else:
+                self._out.write(line)
+                self._out.flush()
+                self.accepted += 1
+            self.attempts += 1
+            self._since_checkpoint += 1
+            due = self._since_checkpoint >= self.checkpoint_every
+        if due:
+            self.checkpoint()
+            self.report()
+
+    def report(self):
+        minutes = (time.monotonic() - self.started) / 60
+        rate = (self.accepted - self.started_accepted) / minutes if minutes else 0.0
+        print(f"   ✅ {self.accepted} accepted • {self.rejected} rejected • {rate:.1f}/min")
+
+    def close(self):
+        self.checkpoint()
+        self._out.close()
+        self._rejected.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate questions headlessly with resumable JSONL output.")
+    parser.add_argument("--target", type=int, required=True, help="total accepted questions (including earlier runs)")
+    parser.add_argument("--out", default="questions.jsonl", help="accepted questions (JSONL)")
+    parser.add_argument("--rejected", help="rejected attempts (default: <out>.rejected.jsonl)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <out>.state.json)")
+    parser.add_argument("--checkpoint-every", type=int, default=25, help="results between checkpoints")
+    parser.add_argument("--topics", help="comma-separated topics (skips research unless --pdf is given)")
+    parser.add_argument("--pdf", help="source PDF for the researcher")
+    parser.add_argument("--archive", action="append", default=[], help="earlier questions to seed dedup with")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent solve workers")
+    parser.add_argument("--generators", type=int, default=None, help="concurrent generate workers")
+    parser.add_argument("--batch-size", type=int, default=None, help="questions requested per generator call")
+    parser.add_argument("--max-attempts", type=int, default=None, help="stop after this many attempts in this run")
+    parser.add_argument("--dedup-store", default=None, help="persistent exact-dedup file (shared across runs)")
+    parser.add_argument("--store", default=None, help="question store (SQLite) for every attempt (default: orchestrator's)")
+    args = parser.parse_args()
+
+    base = args.out[:-len(".jsonl")] if args.out.endswith(".jsonl") else args.out
+    rejected_path = args.rejected or f"{base}.rejected.jsonl"
+    checkpoint_path = args.checkpoint or f"{base}.state.json"
+
+    import orchestrator
+    orch = orchestrator.Orchestrator(dedup_path=args.dedup_store or orchestrator.DEDUP_STORE_PATH,
+                                     store_path=args.store or orchestrator.QUESTION_STORE_PATH)
+    runner = BatchRunner(orch, args.out, rejected_path, checkpoint_path, args.checkpoint_every)
+    runner.resume()
+    for path in args.archive:
+        orch.load_question_archive(path)
+
+    remaining = args.target - runner.accepted
+    if remaining <= 0:
+        print(f"   🎉 Target already reached ({runner.accepted} accepted in {args.out}).")
+        runner.close()
+        orch.shutdown()
+        return
+
+    # --- RESEARCH (restored from the checkpoint when resuming) ---
+    topics = [t.strip() for t in args.topics.split(",") if t.strip()] if args.topics else None
+    if args.pdf:
+        orch.perform_research(custom_file=args.pdf)
+    elif topics and not orch.research_findings:
+        orch.research_findings = {"topics": topics, "difficulty_analysis": "", "style_rules": []}
+    if topics:
+        orch.research_findings["topics"] = topics
+        orch.available_topics = topics
+    orch.init_generator()
+    if args.batch_size: orch.generation_batch_size = args.batch_size
+
+    # First Ctrl-C / SIGTERM: stop starting questions and let in-flight ones finish. Second: abort.
+    def request_stop(signum, frame):
+        if getattr(request_stop, "requested", False):
+            raise KeyboardInterrupt
+        request_stop.requested = True
+        print("\n   🛑 Stopping: finishing questions in flight (press Ctrl-C again to abort)...")
+        orch.stop_pipeline()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    workers = {}
+    if args.workers: workers["solve"] = args.workers
+    if args.generators: workers["generate"] = args.generators
+
+    print(f"   🚀 Generating {remaining} more questions -> {args.out}")
+    try:
+        orch.run_pipeline(remaining, max_attempts=args.max_attempts, workers=workers,
+                          on_result=runner.on_result)
+    except KeyboardInterrupt:
+        print("   ⚠️ Aborted; questions in flight are lost (everything written so far is kept).")
+    finally:
+        runner.close()
+        runner.report()
+        orch.shutdown()
+
+    return 0 if runner.accepted >= args.target else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""
+Offline benchmark for the generation pipeline.
+
+Swaps genai.GenerativeModel for a local fake (configurable latency, failure rate,
+wrong answers, scripted/recorded responses) and drives the real Orchestrator end
+to end, with uploads going to a local stub endpoint. No API keys, no network.
+
+    python benchmark.py --questions 30 --mode pipeline
+    python benchmark.py --questions 10 --mode loop --json bench.json
+"""
+import re
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import collections
+from pipeline import DISCARDED
+
+# --- FAKE GEMINI BACKEND ---
+
+# Median latency (s) and lognormal sigma per role
+DEFAULT_LATENCY = {
+    "generator": (1.2, 0.35), "solver_a": (2.5, 0.5), "solver_b": (1.0, 0.35),
+    "solver_c": (1.0, 0.35), "reviewer": (0.4, 0.3), "researcher": (2.0, 0.3),
+    "solver_a_code": (1.1, 0.35),   # Solver A only writing the code (local execution, no server-side run)
+}
+
+_WORDS = ("market village river factory school garden harbour station library temple bakery "
+          "festival orchard workshop stadium clinic museum bridge canal bazaar farm office "
+          "warehouse hostel theatre airport highway campus island valley forest desert").split()
+_NAMES = "Ravi Suman Asha Kiran Meera Arjun Neha Vikram Priya Rohan Anil Divya".split()
+
+
+def _make_question(rng, topic):
+    """A parametric story with its exact answer, plus enough random context to be non-duplicate."""
+    name1, name2 = rng.sample(_NAMES, 2)
+    context = " ".join(rng.sample(_WORDS, 10))
+    kind = rng.randrange(3)
+    if kind == 0:
+        v1, v2 = rng.randrange(30, 90, 5), rng.randrange(30, 90, 5)
+        d = (v1 + v2) * rng.randrange(2, 6)
+        story = (f"Near the {context}, {name1} and {name2} start {d} km apart and travel toward each other "
+                 f"at {v1} km/h and {v2} km/h. After how many hours will they meet?")
+        answer = d / (v1 + v2)
+    elif kind == 1:
+        a, b = rng.choice([(12, 8), (10, 15), (6, 12), (20, 30), (9, 18)])
+        story = (f"During work at the {context}, {name1} can finish a job in {a} days and {name2} can finish "
+                 f"it in {b} days. Working together, how many days will they take?")
+        answer = a * b / (a + b)
+    else:
+        total, parts = rng.randrange(600, 3000, 60), rng.choice([(2, 3, 4), (1, 2, 3), (3, 4, 5)])
+        story = (f"A sum of {total} collected at the {context} is divided between A, B, and C in the ratio "
+                 f"{parts[0]}:{parts[1]}:{parts[2]}. What is B's share?")
+        answer = total * parts[1] / sum(parts)
+    return story, round(answer, 2)
+
+
+class FakeAPIError(Exception):
+    """Raised by the fake backend to simulate a failed call (e.g. HTTP 500/429)."""
+
+
+class FakeBackend:
+    def __init__(self, latency=None, latency_scale=1.0, failure_rate=0.0, wrong_rate=0.05,
+                 hallucination_rate=0.1, responses=None, seed=0, quota_rpm=None, topic_hallucination=None,
+                 messy_rate=0.0):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.latency_scale = latency_scale
+        self.failure_rate = failure_rate
+        self.wrong_rate = wrong_rate
+        self.hallucination_rate = hallucination_rate
+        self.messy_rate = messy_rate         # free-text solver answers without a clean FINAL ANSWER line
+        self.topic_hallucination = topic_hallucination or {}   # topic -> hallucination rate
+        self.responses = responses or []     # [{"role", "contains", "text"}], checked first
+        self.rng = random.Random(seed)
+        self.answers = {}                    # story -> true answer
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+        # Server-side quota: calls beyond quota_rpm in any (scaled) minute get a 429
+        self.quota_rpm = quota_rpm
+        self.recent = collections.deque()
+        self.rejected = 0
+
+    def role_of(self, system_instruction, prompt):
+        system = system_instruction or ""
+        if "Quant Generator" in system: return "generator"
+        if "Solver A" in system: return "solver_a"
+        if "Solver B" in system: return "solver_b"
+        if "Solver C" in system: return "solver_c"
+        if "Curriculum Researcher" in str(prompt): return "researcher"
+        return "reviewer"
+
+    def _over_quota(self):
+        """Called under self.lock. Returns the retry-after (s) if this call exceeds the quota."""
+        if not self.quota_rpm: return None
+        window = 60 * self.latency_scale
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > window:
+            self.recent.popleft()
+        if len(self.recent) >= self.quota_rpm:
+            self.rejected += 1
+            return window - (now - self.recent[0])
+        self.recent.append(now)
+        return None
+
+    def respond(self, role, prompt, structured=False, code=False):
+        with self.lock:
+            retry = self._over_quota()
+            if retry is not None:
+                raise FakeAPIError(f"429 Resource has been exhausted (e.g. check quota). Please retry in {retry:.2f}s.")
+            self.calls[role] += 1
+            median, sigma = self.latency["solver_a_code" if code else role]
+            delay = median * self.latency_scale * self.rng.lognormvariate(0, sigma)
+            fail = self.rng.random() < self.failure_rate
+        time.sleep(delay)
+        if fail:
+            raise FakeAPIError(f"simulated {role} failure")
+
+        for scripted in self.responses:
+            if scripted.get("role", role) == role and scripted.get("contains", "") in str(prompt):
+                return scripted["text"]
+
+        if role == "researcher":
+            return json.dumps({"topics": ["Time, Speed & Distance", "Work & Time", "Ratio & Sharing"],
+                               "difficulty_analysis": "Medium", "style_rules": ["Story format"]})
+        if role == "reviewer":
+            return "PASS"
+        if role == "generator":
+            if re.match(r"Generate \d+ unique questions", str(prompt)):
+                lines = re.findall(r"^\d+\. (.*)$", str(prompt), re.M)
+                return json.dumps([self._generated_item(line) for line in lines])
+            return json.dumps(self._generated_item(str(prompt).split("specifically about: ", 1)[-1]))
+
+        # Solvers (one "Solve: ..." problem, or a batch of "### PROBLEM k" sections)
+        problems = re.findall(r"### PROBLEM \d+\n(.*?)\n(?:\n|Reply with)", str(prompt), re.S)
+        if problems and structured and role != "solver_a":
+            return json.dumps([{"problem": k, **json.loads(self._solve(role, story, True))}
+                               for k, story in enumerate(problems, 1)])
+        if problems:
+            return "\n".join(f"### ANSWER {k}\n{self._solve(role, story, structured, code)}"
+                             for k, story in enumerate(problems, 1))
+        return self._solve(role, str(prompt).split("Solve: ", 1)[-1], structured, code)
+
+    def _solve(self, role, story, structured=False, code=False):
+        answer = self.answers.get(story.strip(), 0)
+        with self.lock:
+            wrong = self.rng.random() < self.wrong_rate
+            messy = self.rng.random() < self.messy_rate
+        if wrong:
+            answer = round(answer + 3, 2)
+        fields = {"final_answer": answer, "unit": "", "equation": "x = answer"}
+        if role == "solver_a" and code:
+            last = (f"import json\nprint(json.dumps({{**{fields!r}, 'final_answer': final_answer}}))"
+                    if structured else "print(final_answer)")
+            return f"```python\nfinal_answer = {answer}\nprint('EQUATION: x = answer')\n{last}\n```"
+        if role == "solver_a":
+            line = json.dumps(fields) if structured else f"EQUATION: x = answer\n{answer}"
+            return f"print(final_answer)\n{line}"
+        working = "Step by step reasoning."
+        if messy:
+            # No FINAL ANSWER line, and the last number in the prose is not the answer
+            working += f" So the result is {answer}. Checked with {len(story) % 7 + 2} substitutions."
+        if structured:
+            return json.dumps({"working": working, **fields})
+        return working if messy else f"{working}\nFINAL ANSWER: {answer}"
+
+    def _generated_item(self, request):
+        """One question for a request line like 'Work & Time (difficulty: Hard)'."""
+        hint = re.search(r"\(difficulty: (\w+)\)", request)
+        topic = request.split(" (difficulty:")[0].strip()
+        rate = self.topic_hallucination.get(topic, self.hallucination_rate)
+        with self.lock:
+            story, answer = _make_question(self.rng, topic)
+            self.answers[story] = answer
+            roll = self.rng.random()
+        stated = answer if roll >= rate else round(answer * 1.5 + 1, 2)
+        options = [str(stated), str(round(answer + 2, 2)), str(round(answer * 2, 2)), str(round(answer + 7, 2))]
+        return {"category": "x", "story": story, "options": options,
+                "correct_answer_numeric": str(stated), "correct_option": str(stated),
+                "difficulty": hint.group(1) if hint else "Medium"}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+def install_fake_genai(backend):
+    """Points genai.GenerativeModel at the fake backend (works even if google-generativeai isn't installed)."""
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        google = sys.modules.setdefault("google", types.ModuleType("google"))
+        genai = types.ModuleType("google.generativeai")
+        google.generativeai = genai
+        sys.modules["google.generativeai"] = genai
+
+    class FakeGenerativeModel:
+        def __init__(self, model_name=None, system_instruction=None, tools=None, **kwargs):
+            self.model_name = model_name
+            self.system_instruction = system_instruction
+            self.tools = tools
+
+        def generate_content(self, contents, generation_config=None, request_options=None, **kwargs):
+            role = backend.role_of(self.system_instruction, contents)
+            # Structured solver mode: JSON mode for B/C, a JSON last line requested from A
+            structured = ("json" in str((generation_config or {}).get("response_mime_type", ""))
+                          or '"final_answer"' in (self.system_instruction or ""))
+            # Solver A without the code execution tool only writes code (it runs locally)
+            code = role == "solver_a" and self.tools is None
+            return FakeResponse(backend.respond(role, contents, structured, code))
+
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.configure = lambda **kwargs: None
+    return genai
+
+
+# --- MEASUREMENT ---
+STAGES = ["generate_question", "screen_duplicate", "solve_question", "judge_question", "publish_question"]
+
+
+def _pct(values, p):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class StageTimer:
+    """Wraps the Orchestrator's stage methods to time each stage and each question end to end."""
+    def __init__(self, orch):
+        self.timings = collections.defaultdict(list)
+        self.question_latency = []
+        self.started = {}
+        self.lock = threading.Lock()
+        for name in STAGES:
+            setattr(orch, name, self._wrap(name, getattr(orch, name)))
+
+    def _wrap(self, name, fn):
+        first, last = name == STAGES[0], name == STAGES[-1]
+
+        def timed(item):
+            t0 = time.perf_counter()
+            out = fn(item)
+            now = time.perf_counter()
+            with self.lock:
+                self.timings[name].append(now - t0)
+                start = t0 if first else self.started.get(id(item))
+                ended = out is None or "failure_type" in out or last
+                if ended:
+                    self.started.pop(id(item), None)
+                    if start is not None: self.question_latency.append(now - start)
+                elif first:
+                    self.started[id(out)] = t0
+            return out
+        return timed
+
+    def summary(self):
+        rows = {}
+        for name in STAGES:
+            values = self.timings.get(name, [])
+            rows[name] = {"count": len(values), **{f"p{p}": _pct(values, p) for p in (50, 95, 99)}}
+        rows["question"] = {"count": len(self.question_latency),
+                            **{f"p{p}": _pct(self.question_latency, p) for p in (50, 95, 99)}}
+        return rows
+
+
+def run_benchmark(questions=20, mode="pipeline", backend=None, workers=None, max_attempts=None,
+                  batch_size=1, solver_batch=1, cascade=None, structured=None, repair=None,
+                  code_execution=None):
+    backend = backend or FakeBackend()
+    install_fake_genai(backend)
+
+    import orchestrator
+    from uploader import StubFormEndpoint
+
+    scratch = tempfile.mkdtemp(prefix="qs-bench-")
+    orchestrator.UPLOAD_SPOOL_DIR = f"{scratch}/spool"
+    orchestrator.SOLVER_BATCH_SIZE = solver_batch
+    if cascade: orchestrator.CASCADE_MODE = cascade
+    if structured is not None: orchestrator.SOLVER_STRUCTURED_OUTPUT = structured
+    if repair is not None: orchestrator.REPAIR_HALLUCINATIONS = repair
+    if code_execution: orchestrator.SOLVER_CODE_EXECUTION = code_execution
+    # Fake time runs latency_scale x real time, so per-minute quotas are scaled up to match
+    orchestrator.MODEL_LIMITS = {
+        model: {k: v / backend.latency_scale for k, v in limit.items()}
+        for model, limit in orchestrator.MODEL_LIMITS.items()
+    }
+    stub = StubFormEndpoint(delay=0.05)
+
+    tracemalloc.start()
+    orch = orchestrator.Orchestrator(dedup_path=None, cache_dir=None, upload_url=stub.url,
+                                     store_path=f"{scratch}/questions.db")
+    orch.researcher.cache_dir = None
+    orch.generation_batch_size = batch_size
+    if solver_batch > 1:
+        # A batch only fills if that many questions are in the solve stage at once
+        workers = {"solve": max(orchestrator.PIPELINE_WORKERS["solve"], 2 * solver_batch), **(workers or {})}
+    orch.init_generator()
+    timer = StageTimer(orch)
+    research_calls = sum(backend.calls.values())
+
+    started = time.perf_counter()
+    if mode == "pipeline":
+        results = orch.run_pipeline(questions, max_attempts=max_attempts, workers=workers)
+    else:
+        results, attempts = [], 0
+        while sum("failure_type" not in r for r in results) < questions:
+            if max_attempts is not None and attempts >= max_attempts: break
+            results.append(orch.run_loop())
+            attempts += 1
+    elapsed = time.perf_counter() - started
+    orch.uploader.flush(timeout=30)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Questions still in flight at the target are reported separately, not as attempts
+    discarded = sum(r.get("failure_type") == DISCARDED for r in results)
+    results = [r for r in results if r.get("failure_type") != DISCARDED]
+    accepted = sum("failure_type" not in r for r in results)
+    # Model calls each rejected question cost (generator + solvers [+ reviewer]) as tracked by the stages
+    rejected_calls = [r["model_calls"] for r in results if "failure_type" in r and "model_calls" in r]
+    calls = sum(backend.calls.values()) - research_calls
+    report = {
+        "mode": mode,
+        "batch_size": batch_size,
+        "solver_batch": solver_batch,
+        "accepted": accepted,
+        "attempts": len(results),
+        "discarded": discarded,
+        "elapsed_s": round(elapsed, 2),
+        "accepted_per_min": round(accepted / elapsed * 60, 2) if elapsed else None,
+        "model_calls": calls,
+        "calls_per_accepted": round(calls / accepted, 2) if accepted else None,
+        "calls_by_role": dict(backend.calls),
+        "cascade": orchestrator.CASCADE_MODE,
+        "structured": orchestrator.SOLVER_STRUCTURED_OUTPUT,
+        "code_execution": orchestrator.SOLVER_CODE_EXECUTION,
+        "sandbox": orch.sandbox.snapshot(),
+        "calls_per_rejected": round(sum(rejected_calls) / len(rejected_calls), 2) if rejected_calls else None,
+        "peak_memory_mb": round(peak / 1e6, 2),
+        "stats": dict(orch.stats),
+        "uploads": orch.upload_stats,
+        "scheduler": orch.scheduler_stats,
+        "quota_rejections": backend.rejected,
+        "stages": timer.summary(),
+        "topics": orch.topic_yield,
+    }
+    orch.shutdown()
+    stub.close()
+    return report
+
+
+def print_report(report):
+    print(f"\n📈 {report['mode']}: {report['accepted']} accepted / {report['attempts']} attempts "
+          f"({report['discarded']} discarded at the target) "
+          f"in {report['elapsed_s']}s  ->  {report['accepted_per_min']} accepted/min")
+    print(f"   Model calls: {report['model_calls']} ({report['calls_per_accepted']} per accepted question, "
+          f"generator batch {report['batch_size']}, solver batch {report['solver_batch']})")
+    print(f"   Calls per rejected question: {report['calls_per_rejected']} (cascade: {report['cascade']}, structured: {report['structured']})")
+    print(f"   Peak traced memory: {report['peak_memory_mb']} MB")
+    if report["code_execution"] == "local":
+        box = report["sandbox"]
+        print(f"   Sandbox: {box['runs']} local runs, {box['errors']} errors ({box['timeouts']} timeouts)")
+    print(f"   Outcomes: {report['stats']}")
+    sched = report["scheduler"]
+    print(f"   Scheduler: {sched['throttled']} throttled locally, {report['quota_rejections']} 429s, "
+          f"{sched['retries']} retried, {sched['gave_up']} gave up")
+    print(f"\n   {'stage':<18}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report["stages"].items():
+        cells = "".join(f"{row[p] * 1000:>10.1f}" if row[p] is not None else f"{'-':>10}" for p in ("p50", "p95", "p99"))
+        print(f"   {name:<18}{row['count']:>6}{cells}")
+    if report.get("topics"):
+        print(f"\n   {'topic':<26}{'share':>7}{'tries':>7}{'ok':>5}{'ok/call':>9}{'lat s':>7}  top failure")
+        for row in report["topics"]:
+            per_call = f"{row['accepted_per_call']:.3f}" if row["accepted_per_call"] is not None else "-"
+            latency = f"{row['mean_latency_s']:.2f}" if row["mean_latency_s"] is not None else "-"
+            print(f"   {row['topic'][:25]:<26}{row['share']:>7.2f}{row['attempts']:>7}{row['accepted']:>5}"
+                  f"{per_call:>9}{latency:>7}  {row['top_failure'] or ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Orchestrator benchmark (fake Gemini backend).")
+    parser.add_argument("--questions", type=int, default=20, help="accepted questions to produce")
+    parser.add_argument("--mode", choices=["pipeline", "loop"], default="pipeline")
+    parser.add_argument("--max-attempts", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=1, help="questions per generator call")
+    parser.add_argument("--cascade", choices=["off", "confirm", "eager"], default=None,
+                        help="validation cascade mode (default: orchestrator.CASCADE_MODE)")
+    parser.add_argument("--structured", choices=["on", "off"], default=None, help="structured (JSON) solver answers")
+    parser.add_argument("--code-execution", choices=["remote", "local"], default=None,
+                        help="where Solver A's code runs")
+    parser.add_argument("--repair", choices=["on", "off"], default=None, help="repair HALLUCINATION outcomes")
+    parser.add_argument("--messy-rate", type=float, default=0.0,
+                        help="fraction of free-text solver answers with no FINAL ANSWER line")
+    parser.add_argument("--solver-batch", type=int, default=1, help="questions per solver request (in-flight batching)")
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="multiplies every fake latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls that raise")
+    parser.add_argument("--wrong-rate", type=float, default=0.05, help="fraction of solver answers that are wrong")
+    parser.add_argument("--hallucination-rate", type=float, default=0.1, help="fraction of generator answers that are wrong")
+    parser.add_argument("--topic-hallucination", action="append", default=[], metavar="TOPIC=RATE",
+                        help="per-topic generator hallucination rate, e.g. 'Work & Time=0.6'")
+    parser.add_argument("--quota-rpm", type=int, default=None, help="fake server quota: calls per (scaled) minute before 429s")
+    parser.add_argument("--responses", help="JSONL of scripted responses: {role, contains, text}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    responses = []
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = [json.loads(line) for line in f if line.strip()]
+
+    backend = FakeBackend(latency_scale=args.latency_scale, failure_rate=args.failure_rate,
+                          wrong_rate=args.wrong_rate, hallucination_rate=args.hallucination_rate,
+                          responses=responses, seed=args.seed, quota_rpm=args.quota_rpm, messy_rate=args.messy_rate,
+                          topic_hallucination=dict((t.rsplit("=", 1)[0], float(t.rsplit("=", 1)[1]))
+                                                   for t in args.topic_hallucination))
+    report = run_benchmark(args.questions, args.mode, backend, max_attempts=args.max_attempts,
+                           batch_size=args.batch_size, solver_batch=args.solver_batch, cascade=args.cascade,
+                           structured=None if args.structured is None else args.structured == "on",
+                           repair=None if args.repair is None else args.repair == "on",
+                           code_execution=args.code_execution)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+import os
+import re
+import csv
+import mmap
+import struct
+import json
+import random
+import hashlib
+import threading
+from array import array
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python signatures (same values, just slower)
+    np = None
+
+# --- NEAR-DUPLICATE DETECTION (shingling + MinHash + LSH) ---
+# The generator often re-tells the same problem with new names or numbers.
+# Stories are normalised (numbers and names masked), cut into word
+# shingles, and MinHashed. LSH banding turns "find similar stories" into a few
+# dict lookups, so a query costs the same with 1k or 500k stored questions.
+
+# a*h + b stays below 2**63 for 31-bit values, so NumPy uint64 math gives the same result as Python
+_PRIME = (1 << 31) - 1
+_TOKEN = re.compile(r"[A-Za-z]+|\d+(?:\.\d+)?")
+_SENTENCE = re.compile(r"[.?!]+")
+# Capitalised words that commonly open a sentence; any other capitalised first word is taken as a name
+_STARTERS = frozenset("""
+a an the if in on at of for from to by with after before when while during what which who whose how
+find calculate determine compute given suppose assume each every both all some there this that these
+those then now also however but and or so he she they it his her their its we you i one two three
+""".split())
+
+
+def _lsh_params(threshold, num_perm, min_recall=0.99):
+    """
+    Picks (bands, rows) for recall: the fewest bands whose chance of making a story at exactly
+    `threshold` a candidate is at least min_recall. Every candidate is checked against its full
+    signature anyway, so a false positive only costs a comparison, while a miss lets a re-telling
+    through (0.8 / 64 perms gives 16 x 4; 4 x 16 caught only 11% of pairs at s=0.8).
+    """
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands: continue
+        rows = num_perm // bands
+        if 1 - (1 - threshold ** rows) ** bands >= min_recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold=0.8, num_perm=64, shingle_size=3,
+                 mask_numbers=True, mask_names=True, seed=7):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.mask_numbers = mask_numbers
+        self.mask_names = mask_names
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array([a for a, _ in self._perms], dtype=np.uint64)[:, None]
+            self._b = np.array([b for _, b in self._perms], dtype=np.uint64)[:, None]
+
+        # Flat 32-bit signature store (num_perm values per doc) + one dict for all bands
+        self._sigs = array("I")
+        self._buckets = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    # --- SIGNATURES ---
+    def tokens(self, story):
+        sentences = [_TOKEN.findall(sentence) for sentence in _SENTENCE.split(story)]
+        # Names seen mid-sentence are names at the start of a sentence too ("Ravi ... . Ravi ...")
+        names = {tok for toks in sentences for tok in toks[1:] if tok[0].isupper()}
+        out = []
+        for toks in sentences:
+            for i, tok in enumerate(toks):
+                if tok[0].isdigit():
+                    out.append("<num>" if self.mask_numbers else tok)
+                elif self.mask_names and tok[0].isupper() and (
+                        i > 0 or tok in names or tok.lower() not in _STARTERS):
+                    out.append("<name>")
+                else:
+                    out.append(tok.lower())
+        return out
+
+    def shingles(self, story):
+        toks = self.tokens(story)
+        k = self.shingle_size
+        if len(toks) <= k: return {" ".join(toks)}
+        return {" ".join(toks[i:i + k]) for i in range(len(toks) - k + 1)}
+
+    def signature(self, story):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") % _PRIME
+                  for s in self.shingles(story)]
+        if np is not None:
+            h = np.array(hashes, dtype=np.uint64)[None, :]
+            return ((self._a * h + self._b) % _PRIME).min(axis=1).tolist()
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms]
+
+    def _band_keys(self, sig):
+        r = self.rows
+        return [hash((band, tuple(sig[band * r:(band + 1) * r]))) for band in range(self.bands)]
+
+    def _stored(self, doc_id):
+        start = doc_id * self.num_perm
+        return self._sigs[start:start + self.num_perm]
+
+    # --- QUERIES ---
+    def _best_match(self, sig, keys):
+        candidates = set()
+        for key in keys:
+            hit = self._buckets.get(key)
+            if hit is None: continue
+            if isinstance(hit, int): candidates.add(hit)
+            else: candidates.update(hit)
+
+        best = None
+        for doc_id in candidates:
+            other = self._stored(doc_id)
+            similarity = sum(x == y for x, y in zip(sig, other)) / self.num_perm
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (doc_id, similarity)
+        return best
+
+    def _insert(self, sig, keys):
+        doc_id = self._count
+        self._sigs.extend(sig)
+        for key in keys:
+            hit = self._buckets.get(key)
+            if hit is None: self._buckets[key] = doc_id
+            elif isinstance(hit, int): self._buckets[key] = [hit, doc_id]
+            else: hit.append(doc_id)
+        self._count += 1
+        return doc_id
+
+    def query(self, story):
+        """Returns (doc_id, estimated_jaccard) of the closest stored story above threshold, else None."""
+        sig = self.signature(story)
+        with self._lock:
+            return self._best_match(sig, self._band_keys(sig))
+
+    def add(self, story):
+        sig = self.signature(story)
+        with self._lock:
+            return self._insert(sig, self._band_keys(sig))
+
+    def check_and_add(self, story):
+        """Atomic query-then-insert. Returns the match if `story` is a near-duplicate, else stores it."""
+        sig = self.signature(story)
+        keys = self._band_keys(sig)
+        with self._lock:
+            match = self._best_match(sig, keys)
+            if match is None:
+                self._insert(sig, keys)
+            return match
+
+    # --- BULK LOADING ---
+    def add_many(self, stories):
+        # Signatures are the expensive part; compute them outside the lock
+        prepared = [(sig, self._band_keys(sig)) for sig in map(self.signature, stories)]
+        with self._lock:
+            for sig, keys in prepared:
+                self._insert(sig, keys)
+        return len(prepared)
+
+    def load_archive(self, path, batch_size=5000):
+        """Bulk-loads stories from .jsonl / .json / .csv (question or story field) or .txt (one per line)."""
+        total, batch = 0, []
+        for story in iter_archive(path):
+            batch.append(story)
+            if len(batch) >= batch_size:
+                total += self.add_many(batch)
+                batch = []
+        return total + self.add_many(batch)
+
+
+def _story_of(record):
+    if isinstance(record, str): return record
+    if isinstance(record, dict): return record.get("story") or record.get("question")
+    return None
+
+def iter_archive(path):
+    """Yields question texts from an archive file of previously generated questions."""
+    lower = str(path).lower()
+    with open(path, encoding="utf-8", newline="") as f:
+        if lower.endswith(".jsonl"):
+            records = (json.loads(line) for line in f if line.strip())
+        elif lower.endswith(".json"):
+            records = json.load(f)
+        elif lower.endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (line.strip() for line in f)
+        for record in records:
+            story = _story_of(record)
+            if story: yield story
+
+
+# --- PERSISTENT EXACT-DEDUP STORE ---
+# Fixed-width 8-byte digests in an open-addressed table inside a memory-mapped file:
+# 16 bytes/entry on disk at the 50% max load factor, shared by every process that
+# opens the same path, and kept across restarts.
+#   * Readers never lock: a lookup is a few probes in the mapping.
+#   * Writers serialise on an flock'd side file. A digest is one aligned 8-byte slot
+#     write, so readers see either the old empty slot or the whole digest.
+#   * Growing rehashes into a new file that atomically replaces the old one; the old
+#     header is flagged "retired" so other processes remap on their next lookup.
+
+_HEADER = struct.Struct("<8sQQQ")   # magic, capacity, count, retired
+_HEADER_SIZE = 64
+_MAGIC = b"QSDIGST1"
+_BLOOM_MAGIC = b"QSBLOOM1"
+_RETIRED_OFFSET = 8 + 8 + 8
+_MAX_LOAD = 0.5
+
+
+def digest64(story_hash):
+    """8-byte digest from the hex story hash (0 is reserved for empty slots)."""
+    return int(story_hash[:16], 16) or 1
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.local = threading.Lock()
+
+    def __enter__(self):
+        self.local.acquire()
+        if fcntl: fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl: fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.local.release()
+
+
+class BloomFront:
+    """
+    Shared on-disk Bloom filter: a definite "not seen" without probing the table.
+    A new filter file is filled with `existing()` (the digests already in the table)
+    before it is published, so it never answers "not seen" for a stored digest.
+    """
+    def __init__(self, path, bits=1 << 23, hashes=7, existing=None):
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_BLOOM_MAGIC + struct.pack("<QQ", bits, hashes))
+                f.truncate(_HEADER_SIZE + (bits + 7) // 8)
+            if existing is not None:
+                self._map(tmp)
+                for digest in existing(): self.add(digest)
+                self.mm.flush()
+                self.close()
+            os.replace(tmp, path)
+        self._map(path)
+
+    def _map(self, path):
+        self.file = open(path, "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.bits, self.hashes = struct.unpack_from("<QQ", self.mm, 8)
+
+    def _positions(self, digest):
+        # Double hashing from the two halves of the digest
+        h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            i = _HEADER_SIZE + pos // 8
+            self.mm[i] = self.mm[i] | (1 << (pos % 8))
+
+    def might_contain(self, digest):
+        return all(self.mm[_HEADER_SIZE + pos // 8] & (1 << (pos % 8)) for pos in self._positions(digest))
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class DigestStore:
+    def __init__(self, path, capacity=1 << 16, bloom_bits=0, bloom_hashes=7):
+        self.path = path
+        self.lock = _FileLock(path + ".lock")
+        self.bloom = None
+        self.file = self.mm = None
+        with self.lock:
+            if not os.path.exists(path):
+                self._write_table(path, max(16, capacity), [])
+            self._open()
+            if bloom_bits:
+                self.bloom = BloomFront(path + ".bloom", bloom_bits, bloom_hashes, existing=self._digests)
+
+    # --- FILE MANAGEMENT ---
+    def _write_table(self, path, capacity, digests):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, capacity, 0, 0).ljust(_HEADER_SIZE, b"\0"))
+            f.truncate(_HEADER_SIZE + capacity * 8)
+        with open(tmp, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0)
+            for d in digests:
+                self._place(mm, capacity, d)
+            struct.pack_into("<Q", mm, 16, len(digests))
+            mm.flush()
+            mm.close()
+        os.replace(tmp, path)
+
+    def _open(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.file.close()
+        self.file = open(self.path, "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, self.capacity, _, _ = _HEADER.unpack_from(self.mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{self.path} is not a digest store")
+
+    def _refresh(self):
+        # Another process grew the table and replaced the file
+        if self.mm[_RETIRED_OFFSET]:
+            self._open()
+
+    # --- TABLE OPERATIONS ---
+    @staticmethod
+    def _place(mm, capacity, digest):
+        i = digest % capacity
+        while True:
+            off = _HEADER_SIZE + i * 8
+            current = struct.unpack_from("<Q", mm, off)[0]
+            if current == digest: return False
+            if current == 0:
+                struct.pack_into("<Q", mm, off, digest)
+                return True
+            i = (i + 1) % capacity
+
+    def _find(self, digest):
+        mm, capacity = self.mm, self.capacity
+        i = digest % capacity
+        while True:
+            current = struct.unpack_from("<Q", mm, _HEADER_SIZE + i * 8)[0]
+            if current == digest: return True
+            if current == 0: return False
+            i = (i + 1) % capacity
+
+    def __contains__(self, digest):
+        if self.bloom and not self.bloom.might_contain(digest):
+            return False
+        self._refresh()
+        return self._find(digest)
+
+    def __len__(self):
+        self._refresh()
+        return struct.unpack_from("<Q", self.mm, 16)[0]
+
+    def add(self, digest):
+        """Atomic check-and-insert across processes. True if the digest was new."""
+        with self.lock:
+            self._refresh()
+            if self._find(digest): return False
+            if self.bloom: self.bloom.add(digest)   # before the slot: slot visible => bits set
+            self._place(self.mm, self.capacity, digest)
+            count = struct.unpack_from("<Q", self.mm, 16)[0] + 1
+            struct.pack_into("<Q", self.mm, 16, count)
+            if count > self.capacity * _MAX_LOAD:
+                self._grow()
+        return True
+
+    def add_many(self, digests):
+        return sum(self.add(d) for d in digests)
+
+    def _digests(self):
+        """Every stored digest (a scan of the occupied slots)."""
+        return [d for d in struct.unpack_from(f"<{self.capacity}Q", self.mm, _HEADER_SIZE) if d]
+
+    def _grow(self):
+        digests = self._digests()
+        self._write_table(self.path, self.capacity * 2, digests)
+        self.mm[_RETIRED_OFFSET] = 1
+        self._open()
+
+    def flush(self):
+        self.mm.flush()
+        if self.bloom: self.bloom.mm.flush()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+        if self.bloom: self.bloom.close()
@@ -0,0 +1,358 @@
+"""
+Multi-process generation: one coordinator, many worker processes.
+
+The coordinator owns everything that must be global: research, the topic/difficulty
+work units, dedup (exact + near-duplicate), the accepted-question target, uploads,
+the question store and the aggregated stats. Workers run the generate/solve/judge
+pipeline and ask the coordinator for each of those decisions over an authenticated
+multiprocessing.connection socket. Only the coordinator uploads, and only after
+granting a publish ticket, so the target is never overshot and no story is sent twice.
+
+    python fleet.py --target 1000 --workers 4 --out questions.jsonl
+    python fleet.py --target 5000 --workers 8 --listen 0.0.0.0:6001 --expect 16   # + remote workers
+    QUANT_FLEET_KEY=... python fleet.py --connect coordinator-host:6001              # on another host
+"""
+import os
+import sys
+import time
+import signal
+import secrets
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+FLEET_KEY_ENV = "QUANT_FLEET_KEY"
+DEFAULT_LISTEN = ("127.0.0.1", 0)      # port 0 = any free port (local workers are told which)
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+# --- COORDINATOR ---
+class Coordinator:
+    def __init__(self, orch, target, address=DEFAULT_LISTEN, authkey=None, max_attempts=None,
+                 expected_workers=1, on_result=None):
+        """
+        `orch` is a full Orchestrator (research done) whose dedup, topic scheduler, uploader
+        and question store serve the whole fleet. Its stats become the sum over all workers.
+        """
+        self.orch = orch
+        self.target = target
+        self.max_attempts = max_attempts
+        self.expected_workers = expected_workers
+        self.on_result = on_result
+        self.authkey = authkey or secrets.token_bytes(16)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+
+        self.published = 0
+        self.attempts = 0
+        self.results = 0
+        self.published_hashes = set()
+        self.worker_stats = {}          # worker id -> that worker's latest stats
+        # Earlier runs (restored from a checkpoint) + SUCCESS/REPAIRED for each ticket granted here:
+        # acceptance is counted only when a question is actually published
+        self.base_stats = dict(orch.stats)
+        self.connected = 0
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._ids = iter(range(1, 1 << 30))
+        self._threads = []
+        threading.Thread(target=self._accept, name="fleet-accept", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self.listener is None or self.done.is_set(): return
+                continue     # e.g. a client with the wrong authkey
+            t = threading.Thread(target=self._serve, args=(conn,), name="fleet-conn", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _serve(self, conn):
+        worker_id = None
+        with self._lock:
+            self.connected += 1
+        try:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    break
+                if op == "hello":
+                    worker_id = next(self._ids)
+                    value = self.hello(worker_id)
+                elif op == "bye":
+                    conn.send((None, True))
+                    break
+                else:
+                    value = getattr(self, f"op_{op}")(worker_id, *args)
+                conn.send((value, self.done.is_set()))
+        finally:
+            conn.close()
+            with self._lock:
+                self.connected -= 1
+
+    # --- REQUESTS (one per worker call; run on that worker's connection thread) ---
+    def hello(self, worker_id):
+        print(f"   🤝 Worker {worker_id} joined.")
+        return {
+            "worker_id": worker_id,
+            "target": self.target,
+            "research_findings": self.orch.research_findings,
+            "available_topics": list(self.orch.available_topics),
+            "generation_batch_size": self.orch.generation_batch_size,
+            # Model quotas are shared: each worker gets an equal slice of MODEL_LIMITS
+            "quota_share": 1.0 / max(1, self.expected_workers),
+        }
+
+    def op_work(self, worker_id):
+        """Next (topic, difficulty) unit, or None once the run is over."""
+        with self._lock:
+            if self.done.is_set(): return None
+            if self.max_attempts is not None and self.attempts >= self.max_attempts: return None
+            self.attempts += 1
+        return self.orch.next_work()
+
+    def op_dedup(self, worker_id, story):
+        return self.orch.is_duplicate(story)
+
+    def op_publish(self, worker_id, data):
+        """Grants a publish ticket (and uploads) while the target isn't met. False = drop the question."""
+        story_hash = self.orch.story_hash(data["story"])
+        with self._lock:
+            if self.published >= self.target or story_hash in self.published_hashes:
+                return False
+            self.published += 1
+            self.published_hashes.add(story_hash)
+            if self.published >= self.target:
+                self.done.set()
+            outcome = "REPAIRED" if "repaired_from" in data else "SUCCESS"
+            self.base_stats[outcome] = self.base_stats.get(outcome, 0) + 1
+        self.orch.deploy_to_form(data)
+        self._update_stats()
+        return True
+
+    def _update_stats(self):
+        """orch.stats = base_stats + every worker's latest (rejection) stats."""
+        with self._lock:
+            totals = dict(self.base_stats)
+            for worker in self.worker_stats.values():
+                for key, n in worker.items():
+                    totals[key] = totals.get(key, 0) + n
+        with self.orch._stats_lock:
+            self.orch.stats.update(totals)
+
+    def op_result(self, worker_id, result, stats):
+        with self._lock:
+            self.results += 1
+            self.worker_stats[worker_id] = stats
+        self._update_stats()
+        self.orch.record_outcome(result)
+        self.orch.archive(result)
+        if self.on_result: self.on_result(result)
+
+    # --- CONTROL ---
+    def stop(self):
+        """Workers start no new questions; in-flight ones finish (and are dropped at publish)."""
+        self.done.set()
+
+    @property
+    def finished(self):
+        """True once no more work will be handed out and every worker has disconnected."""
+        with self._lock:
+            exhausted = self.max_attempts is not None and self.attempts >= self.max_attempts
+            return (self.done.is_set() or exhausted) and self.connected == 0 and self.results > 0
+
+    def wait(self, processes=(), poll=0.5):
+        """Blocks until every local worker process has exited and every (remote) worker has disconnected."""
+        while True:
+            with self._lock:
+                connected = self.connected
+            if processes and not any(p.is_alive() for p in processes) and connected == 0:
+                break
+            if not processes and self.finished:
+                break
+            time.sleep(poll)
+        for t in self._threads: t.join(timeout=5)
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        listener.close()
+
+
+# --- WORKER ---
+class FleetClient:
+    """Request/response channel to the coordinator, shared by every pipeline thread in a worker."""
+    def __init__(self, address, authkey):
+        self.conn = Client(address, authkey=authkey)
+        self.done = False
+        self._lock = threading.Lock()
+
+    def request(self, op, *args):
+        with self._lock:
+            self.conn.send((op, args))
+            value, done = self.conn.recv()
+        self.done = self.done or done
+        return value
+
+    def close(self):
+        try: self.request("bye")
+        except (EOFError, OSError): pass
+        self.conn.close()
+
+
+def _fleet_orchestrator_class():
+    # Imported lazily: a spawned worker process imports this module before anything else
+    from orchestrator import Orchestrator, traced_stage
+
+    class FleetWorkerOrchestrator(Orchestrator):
+        """An Orchestrator whose global decisions (work, dedup, publish) are made by the coordinator."""
+        def __init__(self, client, **kwargs):
+            super().__init__(upload_url=None, store_path=None, dedup_path=None, **kwargs)
+            self.client = client
+
+        def next_work(self):
+            """The coordinator's next unit; None (which ends the pipeline's feed) once the run is over."""
+            work = self.client.request("work")
+            if work is None or self.client.done:
+                self.stop_pipeline()
+            return tuple(work) if work is not None else None
+
+        def is_duplicate(self, story):
+            return self.client.request("dedup", story)
+
+        @traced_stage("publish")
+        def publish_question(self, data):
+            # Counted as SUCCESS by the coordinator, and only if it grants the ticket
+            if not self.client.request("publish", data):
+                return None
+            if self.client.done: self.stop_pipeline()
+            return data
+
+    return FleetWorkerOrchestrator
+
+
+def run_worker(address, authkey, workers=None):
+    """Worker process entry point: joins the coordinator and runs the pipeline until it says stop."""
+    import orchestrator
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # the coordinator decides when to stop
+
+    client = FleetClient(address, authkey)
+    hello = client.request("hello")
+    orch = _fleet_orchestrator_class()(client, cache_dir=orchestrator.CACHE_DIR)
+
+    share = hello["quota_share"]
+    scheduler = orch.scheduler
+    scheduler.limits = {model: {k: v * share for k, v in limit.items() if v}
+                        for model, limit in scheduler.limits.items()}
+    scheduler.default_rpm *= share
+    scheduler.default_tpm *= share
+
+    orch.research_findings = hello["research_findings"]
+    orch.available_topics = hello["available_topics"]
+    orch.generation_batch_size = hello["generation_batch_size"]
+    orch.init_generator()
+
+    def on_result(result):
+        client.request("result", result, dict(orch.stats))
+
+    try:
+        orch.run_pipeline(hello["target"], workers=workers, on_result=on_result)
+    finally:
+        client.close()
+        orch.shutdown()
+
+
+def start_local_workers(coordinator, count, workers=None):
+    # spawn: the coordinator process has live threads, which fork would copy half-way
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=run_worker, args=(coordinator.address, coordinator.authkey, workers),
+                             name=f"fleet-worker-{i + 1}", daemon=True)
+                 for i in range(count)]
+    for p in processes: p.start()
+    return processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate questions with a coordinator and worker processes.")
+    parser.add_argument("--connect", help="run as a worker for the coordinator at HOST:PORT")
+    parser.add_argument("--target", type=int, help="total accepted questions (including earlier runs)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="local worker processes")
+    parser.add_argument("--expect", type=int, default=None,
+                        help="total workers incl. remote ones (splits the model quota; default --workers)")
+    parser.add_argument("--listen", default=None, help="HOST:PORT for remote workers (default: local only)")
+    parser.add_argument("--solve-threads", type=int, default=None, help="solve workers per process")
+    parser.add_argument("--out", default="questions.jsonl", help="accepted questions (JSONL)")
+    parser.add_argument("--topics", help="comma-separated topics (skips research unless --pdf is given)")
+    parser.add_argument("--pdf", help="source PDF for the researcher")
+    parser.add_argument("--batch-size", type=int, default=None, help="questions requested per generator call")
+    parser.add_argument("--max-attempts", type=int, default=None, help="stop after this many attempts in this run")
+    parser.add_argument("--dedup-store", default=None, help="persistent exact-dedup file (shared across runs)")
+    args = parser.parse_args()
+
+    key = os.environ.get(FLEET_KEY_ENV)
+    workers = {"solve": args.solve_threads} if args.solve_threads else None
+    if args.connect:
+        if not key: parser.error(f"set {FLEET_KEY_ENV} to the coordinator's key")
+        run_worker(parse_address(args.connect), key.encode(), workers)
+        return 0
+    if args.target is None: parser.error("--target is required (or --connect to run a worker)")
+
+    import orchestrator
+    from batch_runner import BatchRunner
+    base = args.out[:-len(".jsonl")] if args.out.endswith(".jsonl") else args.out
+    orch = orchestrator.Orchestrator(dedup_path=args.dedup_store or orchestrator.DEDUP_STORE_PATH)
+    runner = BatchRunner(orch, args.out, f"{base}.rejected.jsonl", f"{base}.state.json")
+    runner.resume()
+    remaining = args.target - runner.accepted
+    if remaining <= 0:
+        print(f"   🎉 Target already reached ({runner.accepted} accepted in {args.out}).")
+        runner.close()
+        orch.shutdown()
+        return 0
+
+    topics = [t.strip() for t in args.topics.split(",") if t.strip()] if args.topics else None
+    if args.pdf or not (topics or orch.research_findings):
+        orch.perform_research(custom_file=args.pdf)
+    if topics:
+        orch.research_findings = {**(orch.research_findings or {"difficulty_analysis": "", "style_rules": []}),
+                                  "topics": topics}
+        orch.available_topics = topics
+    if args.batch_size: orch.generation_batch_size = args.batch_size
+
+    if args.listen and not key:
+        parser.error(f"set {FLEET_KEY_ENV} (shared with remote workers) to use --listen")
+    coordinator = Coordinator(
+        orch, remaining, address=parse_address(args.listen) if args.listen else DEFAULT_LISTEN,
+        authkey=key.encode() if key else None, max_attempts=args.max_attempts,
+        expected_workers=args.expect or args.workers, on_result=runner.on_result,
+    )
+    print(f"   🛰️ Coordinator on {coordinator.address[0]}:{coordinator.address[1]}; "
+          f"{remaining} more questions with {args.workers} local workers -> {args.out}")
+
+    def request_stop(signum, frame):
+        print("\n   🛑 Stopping: workers finish the questions in flight...")
+        coordinator.stop()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    processes = start_local_workers(coordinator, args.workers, workers)
+    try:
+        coordinator.wait(processes)
+    finally:
+        coordinator.close()
+        runner.close()
+        runner.report()
+        orch.shutdown()
+    return 0 if runner.accepted >= args.target else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
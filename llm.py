@@ -0,0 +1,116 @@
+import google.generativeai as genai
+from llm_cache import cache_key
+from ratelimit import OUTPUT_TOKEN_ALLOWANCE
+
+# Every Gemini model in the app is built here, so cross-cutting behaviour
+# (rate limiting, response caching, tracing) is added in one place instead of at each call site.
+# Wrapping order, outermost first: TracedModel -> CachedModel -> ScheduledModel -> genai model,
+# so cache hits never wait for (or spend) quota.
+
+class CachedResponse:
+    """Stand-in for a genai response served from the cache (only .text is kept)."""
+    cached = True
+    usage_metadata = None
+
+    def __init__(self, text):
+        self.text = text
+
+
+class ScheduledModel:
+    """Sends every call through the shared ModelScheduler (quota, priority, 429 retries)."""
+    def __init__(self, model, scheduler, model_name, priority, system_instruction=None):
+        self.model = model
+        self.scheduler = scheduler
+        self.model_name = model_name
+        self.priority = priority
+        self.system_chars = len(system_instruction or "")
+
+    def generate_content(self, contents, *args, **kwargs):
+        # ~4 characters per token, plus room for the answer; corrected from usage_metadata afterwards
+        estimate = (len(str(contents)) + self.system_chars) // 4 + OUTPUT_TOKEN_ALLOWANCE
+        timeout = (kwargs.get("request_options") or {}).get("timeout")
+        response = self.scheduler.run(
+            self.model_name, lambda: self.model.generate_content(contents, *args, **kwargs),
+            priority=self.priority, tokens=estimate, timeout=timeout
+        )
+        usage = getattr(response, "usage_metadata", None)
+        self.scheduler.settle(self.model_name, estimate, getattr(usage, "total_token_count", 0) or 0)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class CachedModel:
+    def __init__(self, model, cache, model_name, system_instruction=None, tools=None):
+        self.model = model
+        self.cache = cache
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.tools = tools
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        # request_options (timeouts etc.) don't change the answer, so they're not part of the key
+        key = cache_key(self.model_name, self.system_instruction, self.tools, contents, generation_config)
+        text = self.cache.get(key)
+        if text is not None:
+            return CachedResponse(text)
+
+        response = self.model.generate_content(contents, generation_config=generation_config, **kwargs)
+        if response.text:
+            self.cache.put(key, response.text)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class TracedModel:
+    """Times every call and records prompt/response sizes and token usage under its role."""
+    def __init__(self, model, tracer, role, model_name):
+        self.model = model
+        self.tracer = tracer
+        self.role = role
+        self.model_name = model_name
+
+    def generate_content(self, contents, *args, **kwargs):
+        with self.tracer.span("model", role=self.role) as span:
+            response = self.model.generate_content(contents, *args, **kwargs)
+            cached = getattr(response, "cached", False)
+            span.update(model=self.model_name, cached=cached,
+                        prompt_chars=len(str(contents)), response_chars=len(response.text or ""))
+
+        labels = {"role": self.role}
+        self.tracer.count("model_calls", cached=cached, **labels)
+        self.tracer.count("prompt_chars", span["prompt_chars"], **labels)
+        self.tracer.count("response_chars", span["response_chars"], **labels)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.tracer.count("prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0, **labels)
+            self.tracer.count("response_tokens", getattr(usage, "candidates_token_count", 0) or 0, **labels)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class ModelFactory:
+    def __init__(self, cache=None, tracer=None, scheduler=None):
+        self.cache = cache
+        self.tracer = tracer
+        self.scheduler = scheduler
+
+    def create(self, model_name, system_instruction=None, tools=None, cacheable=True, role=None,
+               priority="generate"):
+        kwargs = {"model_name": model_name}
+        if system_instruction is not None: kwargs["system_instruction"] = system_instruction
+        if tools is not None: kwargs["tools"] = tools
+        model = genai.GenerativeModel(**kwargs)
+
+        if self.scheduler is not None:
+            model = ScheduledModel(model, self.scheduler, model_name, priority, system_instruction)
+        if self.cache is not None and cacheable:
+            model = CachedModel(model, self.cache, model_name, system_instruction, tools)
+        if self.tracer is not None:
+            model = TracedModel(model, self.tracer, role or model_name, model_name)
+        return model
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import collections
+
+# --- CONTENT-ADDRESSED RESPONSE CACHE ---
+# Key = sha256 of (model name, system instruction, tools, prompt, generation config).
+# Tier 1: in-memory LRU. Tier 2: one small JSON file per response on disk,
+# evicted by TTL (on read) and by total size (oldest-used files first).
+
+def cache_key(model_name, system_instruction, tools, prompt, generation_config):
+    material = json.dumps({
+        "model": model_name,
+        "system": system_instruction,
+        "tools": tools,
+        "prompt": prompt,
+        "config": generation_config,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, directory=".llm_cache", ttl=7 * 24 * 3600,
+                 max_bytes=512 * 1024 * 1024, memory_entries=2048):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+
+        self._memory = collections.OrderedDict()   # key -> (created, text)
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._disk_bytes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            for path in self._disk_files():
+                try: self._disk_bytes += os.path.getsize(path)
+                except OSError: pass
+
+    def _bump(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+        out["hits"] = out["memory_hits"] + out["disk_hits"]
+        return out
+
+    # --- MEMORY TIER ---
+    def _memory_get(self, key):
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is None: return None
+            if time.time() - hit[0] > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return hit[1]
+
+    def _memory_put(self, key, created, text):
+        with self._lock:
+            self._memory[key] = (created, text)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # --- DISK TIER ---
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _disk_files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self._remove(path)
+            return None
+        try: os.utime(path)   # mtime doubles as "last used" for size eviction
+        except OSError: pass
+        return entry["created"], entry["text"]
+
+    def _disk_put(self, key, created, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": created, "text": text}, f)
+        size = os.path.getsize(tmp)
+        with self._lock:
+            # Overwriting a key replaces its old file: only the difference is new
+            try: old = os.path.getsize(path)
+            except OSError: old = 0
+            os.replace(tmp, path)
+            self._disk_bytes += size - old
+            over = self._disk_bytes > self.max_bytes
+        if over: self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+            self.stats["evictions"] += 1
+
+    def _evict(self):
+        # Drop least-recently-used files until we're back under 90% of the budget
+        files = []
+        for path in self._disk_files():
+            try: files.append((os.path.getmtime(path), path))
+            except OSError: pass
+        files.sort()
+        target = self.max_bytes * 0.9
+        for _, path in files:
+            if self._disk_bytes <= target: break
+            self._remove(path)
+
+    # --- PUBLIC API ---
+    def get(self, key):
+        text = self._memory_get(key)
+        if text is not None:
+            self._bump("memory_hits")
+            return text
+        if self.directory:
+            hit = self._disk_get(key)
+            if hit is not None:
+                self._memory_put(key, *hit)
+                self._bump("disk_hits")
+                return hit[1]
+        self._bump("misses")
+        return None
+
+    def put(self, key, text):
+        created = time.time()
+        self._memory_put(key, created, text)
+        if self.directory:
+            try: self._disk_put(key, created, text)
+            except OSError as e: print(f"   ⚠️ Cache write failed: {e}")
+        self._bump("writes")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.directory:
+            for path in list(self._disk_files()):
+                self._remove(path)
@@ -0,0 +1,310 @@
+import re
+import math
+import threading
+from functools import reduce
+
+# Deterministic fast-path for the categories in the embedded reference (researcher.py).
+# Each template recognises one parametric story shape and solves it exactly.
+# A template only answers when every number it needs is found unambiguously;
+# anything unusual returns None and the question goes to the LLM SolverSquad.
+# A template that had to guess part of the reading (who started first, whose
+# age is asked, how many rounds "again" means) lowers its confidence, and so
+# does a match found without a known category; the orchestrator only trusts
+# solutions at or above FASTPATH_MIN_CONFIDENCE.
+
+# Confidence multiplier when the category is unknown and every template was tried
+UNKNOWN_CATEGORY_FACTOR = 0.9
+
+NUM = r"(\d+(?:\.\d+)?)"
+
+# Category hints (matched against the requested topic name) -> template family
+CATEGORY_KEYWORDS = {
+    "tsd": ["speed", "distance", "tsd", "train", "motion"],
+    "work": ["work"],
+    "pipes": ["pipe", "cistern", "tank"],
+    "profit": ["profit", "loss", "discount"],
+    "ratio": ["ratio", "mixture", "sharing", "partnership"],
+    "ages": ["age"],
+    "boats": ["boat", "stream"],
+    "lcm": ["lcm", "schedul", "allocation", "logical"],
+}
+
+class LocalSolution:
+    def __init__(self, value, template, equation, confidence=1.0):
+        self.value = value
+        self.template = template
+        self.equation = equation
+        self.confidence = confidence
+
+    @property
+    def text(self):
+        # Same shape as an LLM solver answer. The equation may hold constants ("60 * d"),
+        # so the answer must stay on the FINAL ANSWER line, which extract_answer reads first.
+        return (f"LOCAL SOLVER ({self.template})\n"
+                f"EQUATION: {self.equation}\n"
+                f"FINAL ANSWER: {round(self.value, 4):g}")
+
+
+def _normalize(story):
+    text = re.sub(r"₹|\brs\.?(?=\s*\d)", " ", story.lower())
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)   # 1,200 -> 1200
+    return re.sub(r"\s+", " ", text)
+
+def _all(pattern, text):
+    return [float(x) for x in re.findall(pattern, text)]
+
+def _one(pattern, text):
+    values = _all(pattern, text)
+    return values[0] if len(values) == 1 else None
+
+def _asks_minutes(text):
+    return bool(re.search(r"how many minutes|in minutes", text))
+
+# What the question asks. The rate templates below compute a duration, so they only answer a
+# question that asks for one: not a distance, a clock time, or a fraction of the job.
+TIME_ASK_RE = re.compile(r"how (?:many|much) (?:more )?(?:hours?|minutes?|days?|time)|how long|\bwhen\b"
+                         r"|time (?:taken|required|needed)|after how")
+OTHER_ASK_RE = re.compile(r"how far|what distance|distance (?:from|covered|travell?ed)|\bwhere\b|what time"
+                          r"|\d(?::\d\d)? ?[ap]\.?m\b|what (?:fraction|part|percentage)")
+# Story details the plain rate formulas ignore (reduced efficiency, part of the job, alternating days)
+MODIFIER_RE = re.compile(r"efficien|\d+/\d+|\bfraction|\bhalf\b|\bthird\b|\bquarter\b|% of the"
+                         r"|per ?cent of the|twice as|times as|alternate")
+
+def _question(text):
+    """The last sentence ending in "?" (decimals like 2.5 don't end a sentence), else the last sentence."""
+    asks = re.findall(r"(?:[^.?!]|\.(?=\d))*\?", text)
+    return asks[-1] if asks else re.split(r"[.!](?!\d)", text.strip(" .!"))[-1]
+
+def _asks_duration(text):
+    question = _question(text)
+    return bool(TIME_ASK_RE.search(question)) and not OTHER_ASK_RE.search(question)
+
+
+# --- CATEGORY 1: TIME, SPEED & DISTANCE ---
+def tsd_meeting(text):
+    if not re.search(r"toward(s)? each other|meet", text): return None
+    if re.search(r"earlier|later|head start|after .* starts", text): return None
+    if not _asks_duration(text): return None
+    distance = _one(NUM + r" ?km apart", text)
+    speeds = _all(NUM + r" ?km/?h", text)
+    if distance is None or len(speeds) != 2: return None
+    t = distance / (speeds[0] + speeds[1])
+    if _asks_minutes(text): return LocalSolution(t * 60, "tsd.meeting", "t = 60 * d / (v1 + v2)")
+    return LocalSolution(t, "tsd.meeting", "t = d / (v1 + v2)")
+
+def tsd_catch_up(text):
+    if not re.search(r"catch up|overtake", text) or not _asks_duration(text): return None
+    speeds = _all(NUM + r" ?km/?h", text)
+    lead_min = _one(NUM + r" ?minutes? (?:earlier|before|head start)", text)
+    lead_hr = _one(NUM + r" ?hours? (?:earlier|before|head start)", text)
+    if len(speeds) != 2 or (lead_min is None) == (lead_hr is None): return None
+    lead = lead_min / 60 if lead_min is not None else lead_hr
+    # Assumes the slower one had the head start (the only way a catch-up happens)
+    slow, fast = sorted(speeds)
+    if fast == slow: return None
+    t = slow * lead / (fast - slow)
+    if _asks_minutes(text): return LocalSolution(t * 60, "tsd.catch_up", "t = 60 * v1 * lead / (v2 - v1)", 0.9)
+    return LocalSolution(t, "tsd.catch_up", "t = v1 * lead / (v2 - v1)", 0.9)
+
+
+# --- CATEGORY 2: WORK & TIME ---
+def work_together(text):
+    if not _asks_duration(text) or MODIFIER_RE.search(text): return None
+    days = _all(r"(?:complete|finish|do)\b[^.]*? in " + NUM + r" days", text)
+    if len(days) != 2: return None
+    a, b = days
+    partial = re.search(r"together for " + NUM + r" days?[^.]*?\b([ab]) leaves", text)
+    if partial:
+        t, leaver = float(partial.group(1)), partial.group(2)
+        if not re.search(r"how many more days", text): return None
+        remaining = 1 - t * (1 / a + 1 / b)
+        stayer = b if leaver == "a" else a
+        if remaining < 0: return None
+        return LocalSolution(remaining * stayer, "work.partial", "x = (1 - t * (1/a + 1/b)) * stayer")
+    if re.search(r"together|both", text) and re.search(r"how (?:many days|long)", text):
+        return LocalSolution(a * b / (a + b), "work.together", "t = a * b / (a + b)")
+    return None
+
+
+# --- CATEGORY 3: PIPES & CISTERNS ---
+def pipes(text):
+    if not _asks_duration(text) or MODIFIER_RE.search(text): return None
+    leak = re.search(r"fill[^.]*? in " + NUM + r" hours?[^.]*?leak[^.]*? takes " + NUM + r" hours?", text)
+    if leak:
+        fill, slow = float(leak.group(1)), float(leak.group(2))
+        if slow <= fill: return None
+        return LocalSolution(fill * slow / (slow - fill), "pipes.leak", "t = f * s / (s - f)")
+
+    fills = _all(r"fills?[^.]*? in " + NUM + r" hours?", text)
+    empties = _all(r"empt(?:y|ies)[^.]*? in " + NUM + r" hours?", text)
+    if len(fills) == 1 and len(empties) == 1:
+        f, e = fills[0], empties[0]
+        if e <= f: return None
+        return LocalSolution(f * e / (e - f), "pipes.fill_empty", "t = f * e / (e - f)")
+    if len(fills) != 2 or empties: return None
+    a, b = fills
+    closed = re.search(r"pipe ([ab]) is closed after " + NUM + r" hours?", text)
+    if closed:
+        t = float(closed.group(2))
+        done = t * (1 / a + 1 / b)
+        if done >= 1: return None
+        stayer = b if closed.group(1) == "a" else a
+        return LocalSolution(t + (1 - done) * stayer, "pipes.close_after", "T = t + (1 - t * (1/a + 1/b)) * stayer")
+    if re.search(r"together|both", text):
+        return LocalSolution(a * b / (a + b), "pipes.together", "t = a * b / (a + b)")
+    return None
+
+
+# --- CATEGORY 4: PROFIT, LOSS & DISCOUNT ---
+def successive_discount(text):
+    marked = _one(r"marked (?:at|price (?:of|is)) " + NUM, text)
+    discounts = _all(NUM + r" ?% discount", text)
+    if marked is None or len(discounts) != 2 or not re.search(r"further|another|then", text): return None
+    if not re.search(r"(?:final )?selling price", text): return None
+    p, q = discounts
+    return LocalSolution(marked * (1 - p / 100) * (1 - q / 100), "profit.double_discount", "sp = m * (1 - p) * (1 - q)")
+
+def cost_to_selling(text):
+    cost = _one(r"(?:buys [^.]*? for|cost price (?:of|is)) " + NUM, text)
+    gain = re.findall(NUM + r" ?% (profit|gain|loss)", text)
+    if cost is None or len(gain) != 1 or "discount" in text: return None
+    if not re.search(r"selling price|sells? it for how much|what (?:is|was) the price", text): return None
+    pct, kind = float(gain[0][0]), gain[0][1]
+    sign = -1 if kind == "loss" else 1
+    return LocalSolution(cost * (1 + sign * pct / 100), "profit.selling_price", "sp = cp * (1 +/- r)")
+
+
+# --- CATEGORY 5: RATIO, MIXTURES & SHARING ---
+def replacement_mixture(text):
+    total = _one(r"(?:has|contains) " + NUM + r" ?(?:liters|litres|l)\b", text)
+    removed = _one(NUM + r" ?(?:liters|litres|l)\b[^.]*? (?:removed|drawn|taken out) and replaced", text)
+    if total is None or removed is None or removed >= total: return None
+    words = {"once more": 2, "again": 2, "twice": 2, "two more times": 3, "three times": 3, "thrice": 3}
+    rounds, confidence = 1, 1.0
+    for phrase, n in words.items():
+        if phrase in text: rounds, confidence = max(rounds, n), 0.8   # round count read from wording
+    more = _one(r"repeated " + NUM + r" more times?", text)
+    if more is not None: rounds, confidence = 1 + int(more), 1.0
+    return LocalSolution(total * (1 - removed / total) ** rounds, "ratio.replacement", "q = v * (1 - r / v) ^ n",
+                         confidence)
+
+def ratio_share(text):
+    total = _one(r"sum of " + NUM, text)
+    ratio = re.search(r"ratio (\d+(?::\d+)+)", text)
+    who = re.findall(r"\b([a-e])'s share", text)
+    if total is None or not ratio or len(set(who)) != 1: return None
+    parts = [float(x) for x in ratio.group(1).split(":")]
+    index = "abcde".index(who[0])
+    if index >= len(parts): return None
+    return LocalSolution(total * parts[index] / sum(parts), "ratio.share", "share = s * p_i / sum(p)")
+
+
+# --- CATEGORY 6: AGES ---
+def ages_ratio(text):
+    ratios = re.findall(r"(\d+):(\d+)", text)
+    shift = re.search(NUM + r" years (ago|hence|from now|later)", text)
+    if len(ratios) != 2 or not shift or not re.search(r"present age|current age|how old", text): return None
+    (a, b), (c, d) = [(float(x), float(y)) for x, y in ratios]
+    n = float(shift.group(1)) * (-1 if shift.group(2) == "ago" else 1)
+    # (a*k + n) / (b*k + n) = c / d
+    if a * d == b * c: return None
+    k = n * (c - d) / (a * d - b * c)
+    if k <= 0: return None
+    # Whose age is asked: the first-named person unless the question names the second
+    people = re.search(r"ages? of (?:a |the )?(\w+) and (?:a |the |his |her )?(\w+)", text)
+    first, confidence = a * k, 0.8   # nobody named in the question: assumed to be the first person
+    if people:
+        for name, age in ((people.group(1), a * k), (people.group(2), b * k)):
+            if re.search(r"what is (?:the )?" + re.escape(name) + r"'s", text):
+                first, confidence = age, 1.0
+    return LocalSolution(first, "ages.ratio_shift", "(a*k + n) / (b*k + n) = c / d", confidence)
+
+
+# --- CATEGORY 7: BOATS & STREAMS ---
+def boats(text):
+    down = re.search(NUM + r" ?km downstream in " + NUM + r" hours?", text)
+    up = re.search(r"(?:" + NUM + r" ?km|same distance) upstream in " + NUM + r" hours?", text)
+    wants_stream = bool(re.search(r"speed of the (?:stream|current)\?|find the (?:stream|current)", text))
+    if down and up:
+        d1, t1 = float(down.group(1)), float(down.group(2))
+        d2 = float(up.group(1)) if up.group(1) else d1
+        v_down, v_up = d1 / t1, d2 / float(up.group(2))
+        if wants_stream:
+            return LocalSolution((v_down - v_up) / 2, "boats.stream", "s = (d1/t1 - d2/t2) / 2")
+        if re.search(r"still water", text):
+            return LocalSolution((v_down + v_up) / 2, "boats.still_water", "b = (d1/t1 + d2/t2) / 2")
+        return None
+    stream = _one(r"speed of the (?:stream|current) is " + NUM, text)
+    if down and stream is not None and re.search(r"still water", text):
+        d1, t1 = float(down.group(1)), float(down.group(2))
+        return LocalSolution(d1 / t1 - stream, "boats.known_stream", "b = d / t - s")
+    return None
+
+
+# --- CATEGORY 8: ALLOCATION & LOGICAL MATH (LCM scheduling) ---
+def lcm_schedule(text):
+    periods = _all(r"every " + NUM + r" minutes", text)
+    if len(periods) < 2 or any(p != int(p) for p in periods): return None
+    if not re.search(r"same time|together again|simultaneously", text): return None
+    # Clock-time answers ("8:00 AM") aren't numeric; only answer "how many minutes"-style asks
+    if not re.search(r"how many minutes|after how long|in how many", text): return None
+    value = reduce(lambda x, y: x * y // math.gcd(x, y), [int(p) for p in periods])
+    if re.search(r"how many hours|in hours", text):
+        return LocalSolution(value / 60, "lcm.schedule", "t = lcm(p1, p2, ...) / 60")
+    return LocalSolution(value, "lcm.schedule", "t = lcm(p1, p2, ...)")
+
+
+TEMPLATES = {
+    "tsd": [tsd_meeting, tsd_catch_up],
+    "work": [work_together],
+    "pipes": [pipes],
+    "profit": [successive_discount, cost_to_selling],
+    "ratio": [replacement_mixture, ratio_share],
+    "ages": [ages_ratio],
+    "boats": [boats],
+    "lcm": [lcm_schedule],
+}
+
+class LocalSolverBank:
+    def __init__(self, templates=None):
+        self.templates = templates or TEMPLATES
+        self.stats = {"attempted": 0, "solved": 0}
+        self._lock = threading.Lock()
+
+    def _bump(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def families_for(self, category):
+        if not category: return []
+        name = category.lower()
+        return [fam for fam, words in CATEGORY_KEYWORDS.items() if any(w in name for w in words)]
+
+    def solve(self, story, category=None):
+        """
+        Returns a LocalSolution, or None when no template recognises the story.
+        With a known category only that category's templates are tried; otherwise
+        every template runs and exactly one must match.
+        """
+        self._bump("attempted")
+        text = _normalize(story)
+        families = self.families_for(category)
+        factor = 1.0 if families else UNKNOWN_CATEGORY_FACTOR
+        families = families or list(self.templates)
+
+        found = []
+        for fam in families:
+            for template in self.templates.get(fam, []):
+                try:
+                    sol = template(text)
+                except (ValueError, ZeroDivisionError):
+                    sol = None
+                if sol is not None and math.isfinite(sol.value):
+                    found.append(sol)
+
+        values = {round(s.value, 4) for s in found}
+        if len(values) != 1: return None
+        self._bump("solved")
+        best = max(found, key=lambda s: s.confidence)
+        best.confidence = round(best.confidence * factor, 4)
+        return best
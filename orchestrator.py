@@ -1,42 +1,225 @@
+import os
 import json
 import time
 import hashlib
-import requests
 import re
 import concurrent.futures
 import random
+import threading
+import functools
+import collections
 import google.generativeai as genai
-from solvers import SolverSquad
-from validator import StrictValidator
+from solvers import SolverSquad, gather
+from sandbox import SandboxPool, stored_code
+from validator import StrictValidator, NUMBER_RE, parse_structured, structured_text
 from researcher import ResearcherAgent
+from local_solvers import LocalSolverBank
+from dedup import NearDuplicateIndex, DigestStore, digest64, iter_archive
+from pipeline import Pipeline, Stage, DISCARDED
+from llm import ModelFactory
+from llm_cache import ResponseCache
+from uploader import FormUploader
+from tracing import Tracer
+from ratelimit import ModelScheduler
+from topic_scheduler import TopicScheduler
+from question_store import QuestionStore, ACCEPTED
 
 # --- CONFIGURATION ---
 API_KEY = ""
 genai.configure(api_key=API_KEY)
 
 GENERATOR_MODEL = "gemini-pro-latest" # Updated model name for better stability
-APPS_SCRIPT_URL = "[https://script.google.com/macros/s/AKfycbwI79TvHGc9shdXx9_Writ1R5s_CiIb6jpQxRcaAFUE0gCvekUYE1ZwVD0y1rIEjd2sUQ/exec](https://script.google.com/macros/s/AKfycbwI79TvHGc9shdXx9_Writ1R5s_CiIb6jpQxRcaAFUE0gCvekUYE1ZwVD0y1rIEjd2sUQ/exec)"
+APPS_SCRIPT_URL = "https://script.google.com/macros/s/AKfycbwI79TvHGc9shdXx9_Writ1R5s_CiIb6jpQxRcaAFUE0gCvekUYE1ZwVD0y1rIEjd2sUQ/exec"
+
+# --- FORM UPLOADS (background, batched, spooled to disk until delivered) ---
+UPLOAD_SPOOL_DIR = ".upload_spool"
+UPLOAD_BATCH_SIZE = 10
+UPLOAD_FLUSH_INTERVAL = 2.0   # seconds
+UPLOAD_MAX_RETRIES = 4
+
+# --- BATCH GENERATION: questions requested per generator call (1 = one JSON object per call) ---
+# Larger batches send the system prompt once for K questions (fewer tokens and round trips per
+# question) but each call takes longer; every item is validated on its own.
+GENERATION_BATCH_SIZE = 1
+QUESTION_FIELDS = ("story", "options", "correct_answer_numeric", "correct_option")
+
+# --- TOPIC SCHEDULING ---
+# "adaptive": bandit over topics by accepted questions per model call (see topic_scheduler.py)
+# "uniform":  random.choice over the researched topics
+TOPIC_SCHEDULING = "adaptive"
+TOPIC_MIN_SHARE = 0.05            # every topic keeps at least this share of attempts
+DIFFICULTY_TARGETS = {"Easy": 0.3, "Medium": 0.5, "Hard": 0.2}   # share of accepted questions (None = off)
+
+# --- PIPELINE MODE: workers per stage (each stage sits behind a bounded queue) ---
+PIPELINE_WORKERS = {"generate": 2, "dedup": 1, "solve": 4, "judge": 2, "publish": 1}
+PIPELINE_QUEUE_SIZE = 4
+
+# Process-wide solver pool: 3 agent calls per question, several questions in flight
+SOLVER_POOL_SIZE = 16
+
+# Batched solving: up to SOLVER_BATCH_SIZE in-flight questions share one request per agent
+# (waiting at most SOLVER_BATCH_WAIT s to fill a batch). Needs that many "solve" workers.
+SOLVER_BATCH_SIZE = 1
+SOLVER_BATCH_WAIT = 0.25
+
+# Structured solver output: JSON answers with final_answer/unit/equation fields, so the
+# validator never has to guess the answer from step-by-step prose (False = free-text answers)
+SOLVER_STRUCTURED_OUTPUT = True
+
+# Where Solver A's Python runs: "remote" (Gemini code execution tool) or "local" (A only
+# writes the code; a pool of pre-spawned, rlimited interpreters runs it, without network).
+# The pool also re-runs stored code in revalidate(), in either mode.
+SOLVER_CODE_EXECUTION = "remote"
+SANDBOX_WORKERS = 4
+SANDBOX_CPU_SECONDS = 5
+SANDBOX_MEMORY_MB = 512
+SANDBOX_TIMEOUT = 10        # wall-clock seconds per run
+
+# Answer agreement: |x - y| < max(ABS_TOL, REL_TOL * max(|x|, |y|))
+VALIDATOR_ABS_TOL = 0.1
+VALIDATOR_REL_TOL = 0.0
+
+# --- LOCAL FAST PATH ---
+# "reduce": a confident local solve that agrees with the generator replaces Solvers A and C
+#           (Solver B still runs, for the written explanation)
+# "skip":   ...and Solver B is skipped too (no remote solver calls at all)
+# "off":    always call the full SolverSquad
+FASTPATH_MODE = "reduce"
+# Clean template matches score 1.0 (0.9 without a category); readings that guessed (0.8, or
+# 0.9 * 0.9 uncategorised) go to the remote solvers instead
+FASTPATH_MIN_CONFIDENCE = 0.9
+
+# --- VALIDATION CASCADE (questions the local fast path didn't solve) ---
+# Solvers run stage by stage, cheapest first, and stop once the verdict is decided.
+# "confirm": reject on two-solver evidence (Logic vs Skeptic); categories match validate()
+#            except that HALLUCINATION is given without Solver A's vote
+# "eager":   also reject as soon as one solver contradicts the generator (fewest calls)
+# "off":     always run all three solvers in parallel
+# "confirm" needs B and C's answers before it can reject, so they run together: an accepted
+# question costs one round trip more than "off" (Solver A, the slowest, runs only if needed),
+# never three. "eager" can stop after one solver, so it tries them one at a time.
+# Trade-off (benchmark.py --questions 60 --hallucination-rate 0.3 --repair off): calls per
+# rejected question are 4.0 with "off", 3.0 with "confirm" (the generator call is always paid)
+# and 2.0 with "eager". Only "eager" halves the cost of a rejection; the default "confirm"
+# saves about a quarter, because it never rejects on one solver's word and keeps validate()'s
+# categories. Switch to "eager" when model calls matter more than those two.
+CASCADE_MODE = "confirm"
+CASCADE_STAGES = {"confirm": [["b", "c"], ["a"]], "eager": [["b"], ["c"], ["a"]]}
+
+# --- HALLUCINATION REPAIR ---
+# All three solvers agreed and only the generator's answer was wrong: adopt the solvers'
+# answer, fix options/correct_option to contain it (no model call), and let the question
+# continue through the remaining checks. Counted as REPAIRED. Solvers the cascade skipped
+# are run first, so a repair always has the full three-solver consensus.
+REPAIR_HALLUCINATIONS = True
+
+# Estimated Jaccard similarity (numbers & names masked) above which a story counts as a re-telling
+NEAR_DUP_THRESHOLD = 0.8
+
+# Exact-dedup store on disk, shared by every process/restart that points here (None = in-memory set)
+DEDUP_STORE_PATH = None          # e.g. "dedup.bin"
+DEDUP_BLOOM_BITS = 1 << 23       # Bloom-filter front for fast "not seen" answers (0 = off)
+
+# --- RESPONSE CACHE (all Gemini calls) ---
+CACHE_DIR = ".llm_cache"          # None = memory-only
+CACHE_TTL = 7 * 24 * 3600         # seconds
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_GENERATOR = False           # the generator must stay novel: never serve it from cache
+
+# --- RATE LIMITS (shared by every Gemini call; per model, requests & tokens per minute) ---
+MODEL_LIMITS = {
+    "gemini-pro-latest": {"rpm": 60, "tpm": 1_000_000},
+    "gemini-flash-latest": {"rpm": 300, "tpm": 2_000_000},
+    "gemini-1.5-flash": {"rpm": 300, "tpm": 2_000_000},
+}
+RATE_LIMIT_RETRIES = 5            # 429s retried (after retry-after / backoff) before a call fails
+
+# --- TRACING: per-stage/per-model latency histograms (always on), optional JSONL span log ---
+TRACE_PATH = None                 # e.g. "trace.jsonl"
+
+# --- QUESTION STORE: every finished attempt, accepted or rejected, with solver outputs (SQLite) ---
+QUESTION_STORE_PATH = "questions.db"   # None = don't keep results locally
+
+STAT_CATEGORIES = ["SUCCESS", "REPAIRED", "HALLUCINATION", "CONSENSUS_FAILURE", "PARSING_ERROR", "DUPLICATE", "TIMEOUT",
+                   "MODEL_ERROR", DISCARDED]
+
+def traced_stage(name):
+    """Runs the stage inside a "stage" span; the span records how the question left it."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(self, *args, **kwargs):
+            with self.tracer.span("stage", stage=name) as span:
+                result = fn(self, *args, **kwargs)
+                if isinstance(result, dict) and "failure_type" in result:
+                    span["outcome"] = result["failure_type"]
+                else:
+                    span["outcome"] = "OK" if result is not None else "DROPPED"
+            self.tracer.count("stage_outcomes", stage=name, outcome=span["outcome"])
+            return result
+        return run
+    return wrap
+
 
 class Orchestrator:
-    def __init__(self):
-        self.squad = SolverSquad()
-        self.judge = StrictValidator()
-        self.researcher = ResearcherAgent(API_KEY)
+    def __init__(self, dedup_path=DEDUP_STORE_PATH, cache_dir=CACHE_DIR, upload_url=APPS_SCRIPT_URL,
+                 trace_path=TRACE_PATH, store_path=QUESTION_STORE_PATH):
+        self.tracer = Tracer(trace_path)
+        self.store = QuestionStore(store_path) if store_path else None
+        self.cache = ResponseCache(cache_dir, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES)
+        self.scheduler = ModelScheduler(MODEL_LIMITS, max_retries=RATE_LIMIT_RETRIES, tracer=self.tracer)
+        self.models = ModelFactory(cache=self.cache, tracer=self.tracer, scheduler=self.scheduler)
+
+        # Long-lived pool reused by every question (and overlapped across questions)
+        self.solver_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=SOLVER_POOL_SIZE, thread_name_prefix="solver"
+        )
+        # Interpreters are only spawned on first use
+        self.sandbox = SandboxPool(size=SANDBOX_WORKERS, cpu_seconds=SANDBOX_CPU_SECONDS,
+                                   memory_mb=SANDBOX_MEMORY_MB, timeout=SANDBOX_TIMEOUT, tracer=self.tracer)
+        self.squad = SolverSquad(executor=self.solver_pool, models=self.models, tracer=self.tracer,
+                                 batch_size=SOLVER_BATCH_SIZE, batch_wait=SOLVER_BATCH_WAIT,
+                                 structured=SOLVER_STRUCTURED_OUTPUT,
+                                 code_execution=SOLVER_CODE_EXECUTION, sandbox=self.sandbox)
+        self.judge = StrictValidator(abs_tol=VALIDATOR_ABS_TOL, rel_tol=VALIDATOR_REL_TOL)
+        self.fastpath = LocalSolverBank()
+        self.fastpath_mode = FASTPATH_MODE
+        self.cascade_mode = CASCADE_MODE
+        self.cascade_stages = CASCADE_STAGES
+        self.repair_hallucinations = REPAIR_HALLUCINATIONS
+        self.researcher = ResearcherAgent(API_KEY, models=self.models)
         
+        # upload_url=None: this instance never uploads (e.g. a fleet worker; the coordinator does)
+        self.uploader = FormUploader(
+            upload_url, spool_dir=UPLOAD_SPOOL_DIR, batch_size=UPLOAD_BATCH_SIZE,
+            flush_interval=UPLOAD_FLUSH_INTERVAL, max_retries=UPLOAD_MAX_RETRIES,
+            tracer=self.tracer
+        ) if upload_url else None
+
         self.history_hashes = set()
-        self.stats = {
-            "SUCCESS": 0, "HALLUCINATION": 0, "CONSENSUS_FAILURE": 0,
-            "PARSING_ERROR": 0, "DUPLICATE": 0
-        }
+        self.dedup_store = DigestStore(dedup_path, bloom_bits=DEDUP_BLOOM_BITS) if dedup_path else None
+        self.near_dups = NearDuplicateIndex(threshold=NEAR_DUP_THRESHOLD)
+        self.stats = {k: 0 for k in STAT_CATEGORIES}
+        # Stages may run on several threads at once (pipeline mode)
+        self._stats_lock = threading.Lock()
+        self._dedup_lock = threading.Lock()
         
         self.research_findings = None
         self.available_topics = []
+        self._pipeline = None
+
+        self.topic_scheduler = TopicScheduler(min_share=TOPIC_MIN_SHARE, difficulty_targets=DIFFICULTY_TARGETS)
+        self.topic_scheduling = TOPIC_SCHEDULING
+
+        self.generation_batch_size = GENERATION_BATCH_SIZE
+        self._generated = collections.deque()   # batch-generated questions not yet handed out
+        self._generated_lock = threading.Lock()
 
-    def perform_research(self, custom_file=None):
+    def perform_research(self, custom_file=None, progress=None):
         # Always re-run research if custom file provided, OR if we have no findings yet
         if custom_file or not self.research_findings:
             print("   🕵️ Researcher is analyzing...")
-            json_text = self.researcher.conduct_research(custom_file)
+            with self.tracer.span("research", source="pdf" if custom_file else "default"):
+                json_text = self.researcher.conduct_research(custom_file, progress=progress)
             
             try:
                 self.research_findings = json.loads(json_text)
@@ -78,11 +261,14 @@ class Orchestrator:
         }}
         """
         
-        self.generator = genai.GenerativeModel(
+        self.generator = self.models.create(
             model_name=GENERATOR_MODEL,
-            system_instruction=system_prompt
+            system_instruction=system_prompt,
+            cacheable=CACHE_GENERATOR,
+            role="generator",
+            priority="generate"
         )
-        self.reviewer = genai.GenerativeModel("gemini-1.5-flash")
+        self.reviewer = self.models.create("gemini-1.5-flash", role="reviewer", priority="review")
 
     def clean_json(self, text):
         try:
@@ -92,12 +278,105 @@ class Orchestrator:
         except:
             return text
 
-    def is_duplicate(self, story):
+    @property
+    def cache_stats(self):
+        """LLM response cache hits/misses (reported next to self.stats)."""
+        return self.cache.snapshot()
+
+    @property
+    def upload_stats(self):
+        """Form upload latency, retries and backlog depth."""
+        return self.uploader.snapshot() if self.uploader is not None else {}
+
+    @property
+    def scheduler_stats(self):
+        """Model-call permits, local throttles, 429s, retries and current queue depth."""
+        return self.scheduler.snapshot()
+
+    def latency_summary(self, name="stage"):
+        """Per-stage (or "model"/"solver"/"upload"/"research") call counts and p50/p95/p99 in ms."""
+        return self.tracer.summary(name)
+
+    def metrics_text(self):
+        """Prometheus text format: latency histograms, counters, plus outcome/cache/upload gauges."""
+        gauges = {
+            "questions": {(("outcome", k),): v for k, v in dict(self.stats).items()},
+            "solver_calls": {(("kind", k),): v for k, v in dict(self.squad.call_stats).items()},
+            "llm_cache": {(("kind", k),): v for k, v in self.cache_stats.items()},
+            "uploads": {(("kind", k),): v for k, v in self.upload_stats.items()},
+            "scheduler": {(("kind", k),): v for k, v in self.scheduler_stats.items()},
+            "scheduler_queue_depth": {(("model", m),): v for m, v in self.scheduler.queue_depth().items()},
+            "sandbox": {(("kind", k),): v for k, v in self.sandbox.snapshot().items()},
+        }
+        return self.tracer.to_prometheus(gauges=gauges)
+
+    def write_metrics(self, path):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.metrics_text())
+        os.replace(path + ".tmp", path)
+
+    def count(self, category):
+        with self._stats_lock:
+            self.stats[category] = self.stats.get(category, 0) + 1
+
+    def story_hash(self, story):
         norm_story = re.sub(r'\s+', ' ', story.strip().lower())
-        story_hash = hashlib.md5(norm_story.encode()).hexdigest()
-        if story_hash in self.history_hashes: return True
+        return hashlib.md5(norm_story.encode()).hexdigest()
+
+    def seen_exact(self, story_hash):
+        if self.dedup_store is not None:
+            return digest64(story_hash) in self.dedup_store
+        return story_hash in self.history_hashes
+
+    def remember(self, story_hash):
+        """Records the hash; False if it was already there (e.g. another worker got it first)."""
+        if self.dedup_store is not None:
+            return self.dedup_store.add(digest64(story_hash))
+        if story_hash in self.history_hashes: return False
         self.history_hashes.add(story_hash)
-        return False
+        return True
+
+    def is_duplicate(self, story):
+        story_hash = self.story_hash(story)
+        with self._dedup_lock:
+            # 1. Exact re-run of a story, 2. same problem with new names/numbers
+            if self.seen_exact(story_hash): return True
+            if self.near_dups.check_and_add(story) is not None: return True
+            return not self.remember(story_hash)
+
+    def load_question_archive(self, path):
+        """Seeds dedup with previously generated questions (.jsonl/.json/.csv/.txt)."""
+        stories = list(iter_archive(path))
+        with self._dedup_lock:
+            for s in stories: self.remember(self.story_hash(s))
+        loaded = self.near_dups.add_many(stories)
+        print(f"   📚 Loaded {loaded} archived questions into dedup.")
+        return loaded
+
+    # --- CHECKPOINTING (batch_runner.py) ---
+    def export_state(self):
+        """JSON-serialisable snapshot of what a resumed run needs: stats, research, dedup hashes."""
+        with self._dedup_lock:
+            hashes = sorted(self.history_hashes)
+        return {
+            "stats": dict(self.stats),
+            "research_findings": self.research_findings,
+            "available_topics": list(self.available_topics),
+            # A DigestStore is already persistent on disk; only the in-memory set needs saving
+            "history_hashes": hashes if self.dedup_store is None else [],
+            "topic_scheduler": self.topic_scheduler.export_state(),
+        }
+
+    def load_state(self, state):
+        with self._stats_lock:
+            self.stats.update(state.get("stats", {}))
+        if state.get("research_findings"):
+            self.research_findings = state["research_findings"]
+            self.available_topics = state.get("available_topics") or self.research_findings.get("topics", [])
+        with self._dedup_lock:
+            for h in state.get("history_hashes", []): self.remember(h)
+        if state.get("topic_scheduler"):
+            self.topic_scheduler.load_state(state["topic_scheduler"])
 
     def quality_check(self, story):
         try:
@@ -115,79 +394,474 @@ class Orchestrator:
             "correct option": data['correct_option'],
             "explanation of option": data.get('explanation', 'Solved by AI.')
         }
-        try: requests.post(APPS_SCRIPT_URL, json=payload)
+        if self.uploader is None: return
+        # Spooled to disk and sent in the background: never on the question's critical path
+        try: self.uploader.submit(payload)
         except Exception as e: print(f"Upload failed: {e}")
 
-    def run_loop(self, custom_file=None):
-        if not hasattr(self, 'generator'):
-            self.init_generator(custom_file)
+    @property
+    def topic_yield(self):
+        """Per-topic attempts, acceptance, accepted per model call and latency (best first)."""
+        return self.topic_scheduler.yield_table()
+
+    def record_outcome(self, result):
+        """Feeds a finished attempt (accepted or failed) back to the topic scheduler."""
+        topic = result.get("category")
+        # A discarded item was never judged: it says nothing about the topic's yield
+        if not topic or result.get("failure_type") == DISCARDED: return
+        started = result.get("started_at")
+        self.topic_scheduler.record(
+            topic, "failure_type" not in result,
+            calls=result.get("model_calls", 0),
+            seconds=time.time() - started if started else 0.0,
+            difficulty=result.get("difficulty"),
+            failure_type=result.get("failure_type"),
+        )
+
+    def archive(self, result):
+        """Keeps a finished attempt in the question store (never fails the attempt)."""
+        if self.store is None: return
+        story = result.get("story")
+        if result.get("failure_type") == DISCARDED and not story: return   # never generated
+        try:
+            self.store.add(result, story_hash=self.story_hash(story) if isinstance(story, str) else None)
+        except Exception as e:
+            print(f"   ⚠️ Question store write failed: {e}")
+
+    # --- STAGES ---
+    # Each stage takes the question dict and returns it for the next stage,
+    # or returns a failure dict ({"failure_type", "reason"}) that ends the attempt.
+    # run_loop chains them serially; run_pipeline runs them as concurrent worker pools.
 
-        # --- FIXED: FORCE RANDOM TOPIC SELECTION ---
-        target_topic = "General Math"
-        if self.available_topics and len(self.available_topics) > 0:
-            target_topic = random.choice(self.available_topics)
-            prompt = f"Generate a unique question specifically about: {target_topic}"
+    def failure(self, data, failure_type, reason):
+        """
+        A failure dict that keeps the attempt's topic and cost (for the topic scheduler)
+        and whatever the question and solvers produced so far (for the question store).
+        """
+        out = {"failure_type": failure_type, "reason": reason}
+        for key in ("category", "difficulty", "model_calls", "started_at", "story", "options",
+                    "correct_answer_numeric", "correct_option", "solver_a_raw", "solver_b_raw", "solver_c_raw"):
+            if data.get(key) is not None: out[key] = data[key]
+        return out
+
+    def pick_topic(self):
+        if not self.available_topics: return None
+        if self.topic_scheduling == "uniform":
+            return random.choice(self.available_topics)
+        if self.topic_scheduler.topics != self.available_topics:
+            self.topic_scheduler.set_topics(self.available_topics)
+        return self.topic_scheduler.pick()
+
+    def pick_difficulty(self):
+        if self.topic_scheduling == "uniform": return None
+        return self.topic_scheduler.pick_difficulty()
+
+    def next_work(self):
+        """The next work unit: (topic, difficulty). Fleet workers get theirs from the coordinator."""
+        return self.pick_topic(), self.pick_difficulty()
+
+    def difficulty_hint(self, difficulty):
+        return f" (difficulty: {difficulty})" if difficulty else ""
+
+    def check_question(self, data):
+        """Reason a generated item can't be used, or None if it has every field the later stages need."""
+        if not isinstance(data, dict): return "item is not a JSON object"
+        missing = [k for k in QUESTION_FIELDS if data.get(k) in (None, "", [])]
+        if missing: return f"missing {', '.join(missing)}"
+        if not isinstance(data["options"], list) or len(data["options"]) < 4: return "needs 4 options"
+        return None
+
+    def generate_batch(self, topics, difficulties=None):
+        """
+        One generator call for len(topics) questions (a JSON array, one item per topic).
+        Returns one entry per item: the question dict, or a failure dict if that item is malformed.
+        """
+        difficulties = difficulties or [None] * len(topics)
+        listing = "\n".join(f"{i + 1}. {t}{self.difficulty_hint(d)}"
+                            for i, (t, d) in enumerate(zip(topics, difficulties)))
+        started = time.time()
+        # The call is shared: each item carries its share of it
+        share = {"started_at": started, "model_calls": 1 / len(topics)}
+        prompt = (f"Generate {len(topics)} unique questions, one per topic below, in this order. "
+                  f"Return a JSON array of {len(topics)} objects in the OUTPUT JSON FORMAT; "
+                  f"no two questions may share a scenario.\n{listing}")
+        try:
+            resp = self.generator.generate_content(
+                prompt,
+                generation_config={"response_mime_type": "application/json"}
+            )
+            text = resp.text
+        except Exception as e:
+            self.count("MODEL_ERROR")
+            return [self.failure({**share, "category": topics[0], "model_calls": 1},
+                                 "MODEL_ERROR", f"Generator call failed: {e}")]
+        try:
+            items = json.loads(self.clean_json(text))
+        except Exception as e:
+            self.count("PARSING_ERROR")
+            return [self.failure({**share, "category": topics[0], "model_calls": 1},
+                                 "PARSING_ERROR", f"Invalid JSON: {e}")]
+
+        if isinstance(items, dict):
+            items = items.get("questions", [items])
+        if not isinstance(items, list):
+            items = [items]
+
+        results = []
+        for i, item in enumerate(items):
+            topic = topics[i % len(topics)]
+            problem = self.check_question(item)
+            if problem:
+                self.count("PARSING_ERROR")
+                results.append(self.failure({**share, "category": topic},
+                                            "PARSING_ERROR", f"Batch item {i + 1}: {problem}"))
+                continue
+            # Items are expected in topic order; extras keep a valid category of their own
+            if i < len(topics) or item.get("category") not in self.available_topics:
+                item["category"] = topic
+            item.update(share)
+            results.append(item)
+        return results
+
+    def next_item(self):
+        """
+        Work source for run_loop/run_pipeline: a buffered batch-generated question if there is one
+        (its topic was picked with its batch), else a new (topic, difficulty) unit from next_work().
+        """
+        with self._generated_lock:
+            if self._generated: return self._generated.popleft()
+        return self.next_work()
+
+    def next_generated(self, target_topic, difficulty=None):
+        """Generates a batch: returns the first question and buffers the rest for next_item()."""
+        work = [(target_topic, difficulty)] + [self.next_work() for _ in range(self.generation_batch_size - 1)]
+        topics = [t or "General Math" for t, _ in work]
+        batch = self.generate_batch(topics, [d for _, d in work])
+        if not batch:
+            self.count("PARSING_ERROR")
+            return self.failure({"category": topics[0], "model_calls": 1},
+                                "PARSING_ERROR", "Generator returned an empty batch")
+        with self._generated_lock:
+            self._generated.extend(batch[1:])
+        return batch[0]
+
+    @traced_stage("generate")
+    def generate_question(self, work=None):
+        """`work` is a (topic, difficulty) unit from next_work(), just a topic, or a buffered question."""
+        if isinstance(work, dict):
+            return work
+        if isinstance(work, tuple):
+            target_topic, difficulty = work
+        else:
+            target_topic, difficulty = work, self.pick_difficulty()
+        if self.generation_batch_size > 1:
+            return self.next_generated(target_topic, difficulty)
+
+        hint = self.difficulty_hint(difficulty)
+        if target_topic:
+            prompt = f"Generate a unique question{hint} specifically about: {target_topic}"
         else:
-            prompt = "Generate a unique math question."
+            target_topic = "General Math"
+            prompt = f"Generate a unique math question{hint}."
+        attempt = {"category": target_topic, "model_calls": 1, "started_at": time.time()}
 
-        # 1. Generate
         try:
             resp = self.generator.generate_content(
                 prompt,
                 generation_config={"response_mime_type": "application/json"}
             )
-            cleaned_text = self.clean_json(resp.text)
+            text = resp.text
+        except Exception as e:
+            self.count("MODEL_ERROR")
+            return self.failure(attempt, "MODEL_ERROR", f"Generator call failed: {e}")
+
+        try:
+            cleaned_text = self.clean_json(text)
             data = json.loads(cleaned_text)
-            
+            problem = self.check_question(data)
+            if problem: raise ValueError(problem)
+
             # Force the category name to match what we requested
-            data["category"] = target_topic
+            data.update(attempt)
 
         except Exception as e:
-            self.stats["PARSING_ERROR"] += 1
-            return {"failure_type": "PARSING_ERROR", "reason": f"Invalid JSON: {e}"}
+            self.count("PARSING_ERROR")
+            return self.failure(attempt, "PARSING_ERROR", f"Invalid JSON: {e}")
+        return data
 
-        # 2. Duplicate Detector
+    @traced_stage("dedup")
+    def screen_duplicate(self, data):
         if self.is_duplicate(data['story']):
-            self.stats["DUPLICATE"] += 1
-            return {"failure_type": "DUPLICATE", "reason": "Similar question exists"}
-
-        # 3. Solve (PARALLEL EXECUTION)
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_a = executor.submit(self.squad.solve_with_code, data['story'])
-            future_b = executor.submit(self.squad.solve_with_logic, data['story'])
-            future_c = executor.submit(self.squad.solve_with_skeptic, data['story'])
-            
-            ans_a = future_a.result()
-            ans_b = future_b.result()
-            ans_c = future_c.result()
-        
+            self.count("DUPLICATE")
+            return self.failure(data, "DUPLICATE", "Similar question exists")
+        return data
+
+    def solve_locally(self, data):
+        """Deterministic template solve, only if it confidently agrees with the generator."""
+        if self.fastpath_mode == "off": return None
+        local = self.fastpath.solve(data['story'], data.get('category'))
+        if local is None or local.confidence < FASTPATH_MIN_CONFIDENCE: return None
+        # On disagreement the local parse may be wrong: let the full squad decide
+        if not self.judge.agrees(local.text, data['correct_answer_numeric']): return None
+        return local
+
+    def solve_cascade(self, data):
+        """
+        Runs the solver stages in order until validate_partial decides. Returns
+        (answers {agent: text}, verdict or None). Agents never run answer "SKIPPED".
+        """
+        answers = {}
+        verdict = None
+        for stage in self.cascade_stages[self.cascade_mode]:
+            results = gather([self.squad.submit(agent, data['story']) for agent in stage]).result()
+            answers.update(zip(stage, results))
+            verdict = self.judge.validate_partial(
+                data['correct_answer_numeric'], answers, eager=self.cascade_mode == "eager"
+            )
+            if verdict is not None: break
+        skipped = 3 - len(answers)
+        if skipped: self.tracer.count("cascade_skipped_calls", skipped)
+        return {agent: answers.get(agent, "SKIPPED (cascade)") for agent in "abc"}, verdict
+
+    @traced_stage("solve")
+    def solve_question(self, data):
+        local = self.solve_locally(data)
+        if local is None and self.cascade_mode != "off":
+            answers, verdict = self.solve_cascade(data)
+            ans_a, ans_b, ans_c = answers["a"], answers["b"], answers["c"]
+            calls = sum(not ans.startswith("SKIPPED") for ans in answers.values())
+            if verdict is not None and not verdict[0]:
+                data['verdict'] = verdict
+        elif local is None:
+            # (PARALLEL EXECUTION on the shared solver pool)
+            ans_a, ans_b, ans_c = self.squad.solve_all(data['story']).result()
+            calls = 3
+        elif self.fastpath_mode == "skip":
+            ans_a = ans_b = ans_c = local.text
+            calls = 0
+        else:
+            ans_a, ans_c = local.text, local.text
+            ans_b = self.squad.submit("b", data['story']).result()
+            calls = 1
+        data['model_calls'] = data.get('model_calls', 0) + calls
+
         data['solver_a_raw'] = ans_a
         data['solver_b_raw'] = ans_b
         data['solver_c_raw'] = ans_c
+        return data
 
-        # 4. Validate
-        is_valid, category, log = self.judge.validate(data['correct_answer_numeric'], ans_a, ans_b, ans_c)
-        
-        # Update stats safely
-        if category in self.stats:
-            self.stats[category] += 1
-        else:
-            # Fallback if validator returns a new category key
-            self.stats["SUCCESS"] += 1
-
-        if is_valid:
-            if self.quality_check(data['story']):
-                eq = "x=y"
-                if "EQUATION:" in ans_a:
-                    try: eq = ans_a.split("EQUATION:")[1].strip().split("\n")[0]
-                    except: pass
-                data['equation_visual'] = eq
-                data['explanation'] = f"**Category:** {data.get('category')}\n**Equation:** {eq}\n\n**Logic:**\n{ans_b[:1500]}"
-                self.deploy_to_form(data)
-                return data
-            else:
-                self.stats["PARSING_ERROR"] += 1
-                return {"failure_type": "QUALITY_CHECK", "reason": "Grammar check failed"}
+    def format_answer(self, value):
+        if abs(value - round(value)) < 1e-9: return str(int(round(value)))
+        return f"{value:.4f}".rstrip("0").rstrip(".")
+
+    def option_value(self, option):
+        """An option's number ("Rs. 1,200" -> 1200), or None unless it holds exactly one number."""
+        numbers = NUMBER_RE.findall(str(option).replace(",", ""))
+        return float(numbers[0]) if len(numbers) == 1 else None
+
+    def repair_options(self, data, answer):
+        """
+        Points correct_option at `answer`: an option that already holds it, else the option
+        that held the generator's wrong answer (or the closest one) with its number replaced.
+        Returns False if no option can carry it. Options with several numbers ("3 hours 15
+        minutes") are never rewritten.
+        """
+        options = list(data.get('options') or [])
+        values = [self.option_value(o) for o in options]
+        for option, value in zip(options, values):
+            if value is not None and self.judge.close(value, answer):
+                data['correct_option'] = option
+                return True
+
+        numeric = [i for i, v in enumerate(values) if v is not None]
+        if not numeric: return False
+        if data.get('correct_option') in options and values[options.index(data['correct_option'])] is not None:
+            i = options.index(data['correct_option'])
         else:
-            return {"failure_type": category, "reason": log}
+            wrong = self.judge.extract_answer(data.get('correct_answer_numeric'))
+            i = min(numeric, key=lambda j: abs(values[j] - wrong) if wrong is not None else 0)
+        # Keep the option's own wording/units: only its (single) number changes
+        old = str(options[i]).replace(",", "")
+        match = NUMBER_RE.search(old)
+        options[i] = old[:match.start()] + self.format_answer(answer) + old[match.end():]
+        data['options'] = options
+        data['correct_option'] = options[i]
+        return True
+
+    def repair_question(self, data):
+        """
+        HALLUCINATION with full solver consensus: adopts the solvers' answer. Runs any solvers
+        the cascade skipped first. Returns the consensus answer, or None if it can't be repaired.
+        """
+        skipped = [agent for agent in "abc" if data[f'solver_{agent}_raw'].startswith("SKIPPED")]
+        if skipped:
+            answers = gather([self.squad.submit(agent, data['story']) for agent in skipped]).result()
+            for agent, answer in zip(skipped, answers):
+                data[f'solver_{agent}_raw'] = answer
+            data['model_calls'] = data.get('model_calls', 0) + len(skipped)
+
+        answer = self.judge.consensus(data['solver_a_raw'], data['solver_b_raw'], data['solver_c_raw'])
+        if answer is None: return None
+        old_answer = data['correct_answer_numeric']
+        if not self.repair_options(data, answer): return None
+        data['repaired_from'] = old_answer
+        data['correct_answer_numeric'] = self.format_answer(answer)
+        return answer
+
+    @traced_stage("judge")
+    def judge_question(self, data):
+        # A cascade that stopped early already holds the (rejecting) verdict
+        is_valid, category, log = data.pop('verdict', None) or self.judge.validate(
+            data['correct_answer_numeric'], data['solver_a_raw'], data['solver_b_raw'], data['solver_c_raw']
+        )
+        if category == "HALLUCINATION" and self.repair_hallucinations:
+            answer = self.repair_question(data)
+            if answer is not None:
+                is_valid, category = True, "REPAIRED"
+                self.tracer.count("repairs")
+        ans_a, ans_b = data['solver_a_raw'], data['solver_b_raw']
+
+        if not is_valid:
+            # Update stats safely (fallback if validator returns a new category key)
+            self.count(category if category in self.stats else "PARSING_ERROR")
+            return self.failure(data, category, log)
+
+        data['model_calls'] = data.get('model_calls', 0) + 1   # reviewer
+        if not self.quality_check(data['story']):
+            self.count("PARSING_ERROR")
+            return self.failure(data, "QUALITY_CHECK", "Grammar check failed")
+
+        eq = "x=y"
+        structured = parse_structured(ans_a) or parse_structured(ans_b)
+        if structured and structured.get("equation"):
+            eq = str(structured["equation"])
+        elif "EQUATION:" in ans_a:
+            # The last one is the printed output (earlier ones can be inside the code itself)
+            try: eq = ans_a.split("EQUATION:")[-1].strip().split("\n")[0]
+            except: pass
+        data['equation_visual'] = eq
+        data['explanation'] = f"**Category:** {data.get('category')}\n**Equation:** {eq}\n\n**Logic:**\n{structured_text(ans_b)[:1500]}"
+        return data
+
+    def revalidate(self, result, rerun_code=True):
+        """
+        Re-judges a stored result (question store / JSONL record) with the current validator.
+        With rerun_code, code that ran in the local sandbox is executed there again instead of
+        asking the model; other answers (e.g. Gemini code execution output) are judged as stored.
+        Returns validate()'s (is_valid, category, log), or None if the attempt never had all
+        three solver answers (it failed earlier, or the cascade stopped before every solver ran).
+        """
+        answers = [result.get(f'solver_{agent}_raw') for agent in "abc"]
+        if result.get('correct_answer_numeric') is None: return None
+        if any(ans is None or str(ans).startswith("SKIPPED") for ans in answers): return None
+        ans_a, ans_b, ans_c = answers
+        if rerun_code and stored_code(ans_a):
+            ans_a = self.sandbox.run_answer(ans_a, stored=True) or "Error"
+        return self.judge.validate(result['correct_answer_numeric'], ans_a, ans_b, ans_c)
+
+    def revalidate_store(self, store=None, workers=SANDBOX_WORKERS, **filters):
+        """
+        revalidate() over every matching question store row (QuestionStore filters), with up to
+        `workers` sandbox runs at once. Returns a Counter of (stored outcome, new outcome).
+        """
+        store = store or self.store
+        if store is None: raise ValueError("no question store to revalidate")
+
+        def rejudge(record):
+            verdict = self.revalidate(record)
+            if verdict is None: return None
+            _, category, _ = verdict
+            return record.get('failure_type') or ACCEPTED, ACCEPTED if category == "SUCCESS" else category
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="revalidate") as ex:
+            return collections.Counter(c for c in ex.map(rejudge, store.iter_records(**filters)) if c)
+
+    @traced_stage("publish")
+    def publish_question(self, data):
+        self.deploy_to_form(data)
+        # Accepted questions count once published (the pipeline drops any past its target)
+        self.count("REPAIRED" if 'repaired_from' in data else "SUCCESS")
+        return data
+
+    def run_loop(self, custom_file=None):
+        if not hasattr(self, 'generator'):
+            self.init_generator(custom_file)
+
+        data = self.generate_question(self.next_item())
+        for stage in (self.screen_duplicate, self.solve_question,
+                      self.judge_question, self.publish_question):
+            if "failure_type" in data:
+                break
+            data = stage(data)
+        self.record_outcome(data)
+        self.archive(data)
+        return data
+
+    def run_pipeline(self, target_count, max_attempts=None, custom_file=None,
+                     workers=None, queue_size=PIPELINE_QUEUE_SIZE, on_result=None):
+        """
+        Pipelined batch mode: keeps many questions in flight at once.
+        Returns the same result dicts as run_loop (in completion order) and updates self.stats;
+        questions still in flight when the target is reached come back as DISCARDED.
+        Stops once target_count questions are accepted or max_attempts questions were started.
+        """
+        if not hasattr(self, 'generator'):
+            self.init_generator(custom_file)
+
+        workers = {**PIPELINE_WORKERS, **(workers or {})}
+        published = [0]
+        publish_lock = threading.Lock()
+
+        def publish(data):
+            # Never upload more than the target, even with several questions in flight
+            with publish_lock:
+                free = published[0] < target_count
+                if free: published[0] += 1
+            out = self.publish_question(data) if free else None
+            # Past the target (or refused by a fleet coordinator): reported, not dropped silently
+            return out if out is not None else {**data, "failure_type": DISCARDED, "reason": "Target already met"}
+
+        def finished(result):
+            if result.get("failure_type") == DISCARDED: self.count(DISCARDED)
+            self.record_outcome(result)
+            self.archive(result)
+            if on_result: on_result(result)
+
+        pipeline = Pipeline(
+            source=self.next_item,
+            stages=[
+                Stage("generate", self.generate_question, workers["generate"]),
+                Stage("dedup", self.screen_duplicate, workers["dedup"]),
+                Stage("solve", self.solve_question, workers["solve"]),
+                Stage("judge", self.judge_question, workers["judge"]),
+                Stage("publish", publish, workers["publish"]),
+            ],
+            queue_size=queue_size,
+            on_result=finished,
+        )
+        self._pipeline = pipeline
+        try:
+            return pipeline.run(target_count, max_attempts=max_attempts)
+        finally:
+            self._pipeline = None
+
+    def stop_pipeline(self):
+        """Asks a running run_pipeline to start no new questions; in-flight ones still finish."""
+        pipeline = self._pipeline
+        if pipeline is not None: pipeline.stop()
+
+    def pause_pipeline(self):
+        pipeline = self._pipeline
+        if pipeline is not None: pipeline.pause()
+        return pipeline is not None
+
+    def resume_pipeline(self):
+        pipeline = self._pipeline
+        if pipeline is not None: pipeline.resume()
 
+    def shutdown(self):
+        self.solver_pool.shutdown(wait=False, cancel_futures=True)
+        self.sandbox.close()
+        if self.uploader is not None: self.uploader.close()
+        self.tracer.close()
+        if self.store is not None: self.store.close()
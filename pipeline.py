@@ -0,0 +1,162 @@
+import queue
+import threading
+import traceback
+
+# Marks the end of the stream for a stage's workers
+_DONE = object()
+
+# failure_type of items the run no longer needed (target reached, or stopped before they were started)
+DISCARDED = "DISCARDED"
+
+
+class Stage:
+    """
+    One step of the pipeline. `fn(item)` returns the item for the next stage,
+    a failure dict (ends the item), or None (drops the item silently).
+    """
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+
+
+class Pipeline:
+    """
+    Runs a chain of stages, each as its own pool of worker threads behind a bounded queue
+    (fed by `source()` until it returns None).
+    A full queue blocks the stage feeding it, so a slow stage throttles everything upstream
+    (backpressure) instead of piling up generated-but-unsolved questions.
+    Items still queued when the target is reached are reported as DISCARDED results, not dropped.
+    """
+    def __init__(self, source, stages, queue_size=4, on_result=None):
+        self.source = source
+        self.stages = stages
+        self.on_result = on_result
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+        self.results = []
+        self.accepted = 0
+        self.attempts = 0
+        self._lock = threading.Lock()
+        self._halt = threading.Event()   # target reached: discard queued work
+        self._stop = threading.Event()   # no more new work: drain what's in flight
+        self._running = threading.Event()   # cleared while paused
+        self._running.set()
+
+    def stop(self):
+        """Stop starting new attempts; questions already in flight still finish."""
+        self._stop.set()
+        self._running.set()
+
+    def pause(self):
+        """Stop feeding new attempts until resume(); questions already in flight still finish."""
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def _emit(self, result):
+        if result is None:
+            return
+        with self._lock:
+            self.results.append(result)
+            if "failure_type" not in result:
+                self.accepted += 1
+                if self.accepted >= self.target:
+                    self._halt.set()
+                    self._stop.set()
+        if self.on_result:
+            # A failing callback must not take the worker thread (and run()) down with it
+            try: self.on_result(result)
+            except Exception:
+                traceback.print_exc()
+
+    def _discard(self, item, stage_name):
+        out = dict(item) if isinstance(item, dict) else {"work": item}
+        out.update(failure_type=DISCARDED, reason=f"Run ended before the {stage_name} stage")
+        self._emit(out)
+
+    def _feed(self, max_attempts):
+        first = self.queues[0]
+        n_workers = self.stages[0].workers
+        try:
+            while not self._stop.is_set():
+                if not self._running.wait(timeout=0.2):
+                    continue
+                if max_attempts is not None and self.attempts >= max_attempts:
+                    break
+                seed = self.source()
+                if seed is None:     # the source has no more work
+                    break
+                # Blocks while the first stage is saturated
+                while not self._stop.is_set():
+                    try:
+                        first.put(seed, timeout=0.2)
+                        break
+                    except queue.Full:
+                        continue
+                else:
+                    self._discard(seed, self.stages[0].name)
+                    break
+                with self._lock:
+                    self.attempts += 1
+        finally:
+            for _ in range(n_workers):
+                first.put(_DONE)
+
+    def _work(self, index, remaining):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+
+        try:
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    break
+                if self._halt.is_set():
+                    self._discard(item, stage.name)
+                    continue
+
+                try:
+                    out = stage.fn(item)
+                except Exception as e:
+                    traceback.print_exc()
+                    out = {"failure_type": "ERROR", "reason": f"{stage.name}: {e}"}
+
+                if out is None:
+                    continue
+                if outbox is None or "failure_type" in out:
+                    self._emit(out)
+                else:
+                    outbox.put(out)
+        finally:
+            # Last worker of this stage closes the next one (even if this thread is dying)
+            with self._lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and outbox is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    outbox.put(_DONE)
+
+    def run(self, target, max_attempts=None):
+        """Blocks until `target` items are accepted (or attempts run out); returns all results."""
+        self.target = target
+        if target <= 0: return self.results
+        remaining = [s.workers for s in self.stages]
+
+        threads = [threading.Thread(target=self._feed, args=(max_attempts,), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(i, remaining),
+                    name=f"pipeline-{stage.name}-{n}", daemon=True
+                ))
+
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return self.results
@@ -0,0 +1,298 @@
+"""
+Persistent store of every finished attempt, accepted or rejected (SQLite).
+
+Each row keeps the full result (story, options, solver outputs, validator log)
+as JSON next to indexed columns for category, difficulty, outcome, story hash
+and timestamp, so the dashboard and re-scoring tools can filter and page
+without loading the whole history into memory.
+
+    python question_store.py questions.db                              # counts by outcome
+    python question_store.py questions.db --export accepted.jsonl --outcome ACCEPTED
+    python question_store.py questions.db --export all.parquet --since 2024-05-01
+    python question_store.py questions.db --revalidate --outcome ACCEPTED      # re-judge, re-running Solver A's code locally
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import datetime
+
+ACCEPTED = "ACCEPTED"
+REJECTED = "REJECTED"      # query filter only: any failure_type
+
+# Columns of the columnar (Parquet) export, in order
+EXPORT_FIELDS = ("id", "ts", "outcome", "category", "difficulty", "story_hash", "model_calls", "latency_s",
+                 "reason", "story", "options", "correct_answer_numeric", "correct_option",
+                 "solver_a_raw", "solver_b_raw", "solver_c_raw")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    category TEXT,
+    difficulty TEXT,
+    story_hash TEXT,
+    model_calls INTEGER,
+    latency_s REAL,
+    reason TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_questions_category ON questions(category);
+CREATE INDEX IF NOT EXISTS idx_questions_difficulty ON questions(difficulty);
+CREATE INDEX IF NOT EXISTS idx_questions_outcome ON questions(outcome);
+CREATE INDEX IF NOT EXISTS idx_questions_story_hash ON questions(story_hash);
+CREATE INDEX IF NOT EXISTS idx_questions_ts ON questions(ts);
+"""
+
+GROUP_COLUMNS = ("outcome", "category", "difficulty")
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    # WAL: readers (dashboard, exports) never block the writer and see a consistent snapshot
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _timestamp(value):
+    """Epoch seconds from a number, a datetime or an ISO date string."""
+    if value is None or isinstance(value, (int, float)): return value
+    if isinstance(value, str): value = datetime.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class QuestionStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = _connect(path)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    # --- WRITES ---
+    def _row(self, result, story_hash, ts):
+        started = result.get("started_at")
+        ts = ts or time.time()
+        return (
+            ts,
+            result.get("failure_type") or ACCEPTED,
+            result.get("category"),
+            result.get("difficulty"),
+            story_hash,
+            result.get("model_calls"),
+            round(ts - started, 3) if started else None,
+            result.get("reason"),
+            json.dumps(result, ensure_ascii=False, default=str),
+        )
+
+    def add(self, result, story_hash=None, ts=None):
+        """Stores one finished attempt (a run_loop / run_pipeline result dict). Returns its id."""
+        row = self._row(result, story_hash, ts)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO questions (ts, outcome, category, difficulty, story_hash, model_calls,"
+                " latency_s, reason, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def add_many(self, results, story_hash=None):
+        """Bulk insert in one transaction. `story_hash` is an optional fn(story) -> hash."""
+        rows = [self._row(r, story_hash(r["story"]) if story_hash and r.get("story") else None, r.get("ts"))
+                for r in results]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO questions (ts, outcome, category, difficulty, story_hash, model_calls,"
+                " latency_s, reason, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def import_jsonl(self, path, story_hash=None, batch=5000):
+        """Loads results written by batch_runner.py / the dashboard worker. Returns the row count."""
+        total, pending = 0, []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try: pending.append(json.loads(line))
+                except ValueError: continue
+                if len(pending) >= batch:
+                    total += self.add_many(pending, story_hash)
+                    pending = []
+        return total + self.add_many(pending, story_hash)
+
+    # --- QUERIES ---
+    def _where(self, outcome=None, category=None, difficulty=None, story_hash=None, since=None, until=None):
+        clauses, args = [], []
+        if outcome == REJECTED:
+            clauses.append("outcome != ?")
+            args.append(ACCEPTED)
+        elif outcome is not None:
+            clauses.append("outcome = ?")
+            args.append(outcome)
+        for column, value in (("category", category), ("difficulty", difficulty), ("story_hash", story_hash)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            args.append(_timestamp(since))
+        if until is not None:
+            clauses.append("ts < ?")
+            args.append(_timestamp(until))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def iter_records(self, newest_first=False, batch=1000, **filters):
+        """
+        Streams matching results (dicts, with "id" and "ts") without materialising them.
+        Runs on its own connection, so a long export never holds up writers.
+        """
+        where, args = self._where(**filters)
+        order = "DESC" if newest_first else "ASC"
+        conn = _connect(self.path)
+        try:
+            cur = conn.execute(f"SELECT id, ts, record FROM questions{where} ORDER BY id {order}", args)
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows: break
+                for row_id, ts, record in rows:
+                    yield {"id": row_id, "ts": ts, **json.loads(record)}
+        finally:
+            conn.close()
+
+    def query(self, limit=100, offset=0, newest_first=True, **filters):
+        """One page of matching results (filters: outcome, category, difficulty, story_hash, since, until)."""
+        where, args = self._where(**filters)
+        order = "DESC" if newest_first else "ASC"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, ts, record FROM questions{where} ORDER BY id {order} LIMIT ? OFFSET ?",
+                args + [limit, offset]
+            ).fetchall()
+        return [{"id": row_id, "ts": ts, **json.loads(record)} for row_id, ts, record in rows]
+
+    def count(self, **filters):
+        where, args = self._where(**filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM questions{where}", args).fetchone()[0]
+
+    def counts(self, by="outcome", **filters):
+        """{value: rows} grouped by outcome, category or difficulty."""
+        if by not in GROUP_COLUMNS: raise ValueError(f"can't group by {by!r}")
+        where, args = self._where(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {by}, COUNT(*) FROM questions{where} GROUP BY {by} ORDER BY COUNT(*) DESC", args
+            ).fetchall()
+        return dict(rows)
+
+    def distinct(self, column):
+        if column not in GROUP_COLUMNS: raise ValueError(f"no index on {column!r}")
+        with self._lock:
+            rows = self._conn.execute(f"SELECT DISTINCT {column} FROM questions WHERE {column} IS NOT NULL").fetchall()
+        return sorted(r[0] for r in rows)
+
+    # --- EXPORT ---
+    def export_jsonl(self, path, **filters):
+        """Writes matching results as JSONL (oldest first). Returns the row count."""
+        where, args = self._where(**filters)
+        n = 0
+        conn = _connect(self.path)
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                # The stored JSON is written as-is: no decode/encode round trip per row
+                for record, in conn.execute(f"SELECT record FROM questions{where} ORDER BY id", args):
+                    f.write(record)
+                    f.write("\n")
+                    n += 1
+        finally:
+            conn.close()
+        os.replace(path + ".tmp", path)
+        return n
+
+    def export_parquet(self, path, row_group=10000, **filters):
+        """Columnar export (EXPORT_FIELDS), written one row group at a time. Needs pyarrow."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow); use export_jsonl instead")
+
+        schema = pa.schema([(name, pa.float64() if name in ("ts", "latency_s")
+                             else pa.int64() if name in ("id", "model_calls") else pa.string())
+                            for name in EXPORT_FIELDS])
+        writer = pq.ParquetWriter(path + ".tmp", schema)
+        n = 0
+        try:
+            columns = {name: [] for name in EXPORT_FIELDS}
+            for record in self.iter_records(**filters):
+                for name in EXPORT_FIELDS:
+                    value = record.get(name)
+                    if name == "outcome": value = record.get("failure_type") or ACCEPTED
+                    elif name == "options" and value is not None: value = json.dumps(value, ensure_ascii=False)
+                    elif value is not None and schema.field(name).type == pa.string(): value = str(value)
+                    columns[name].append(value)
+                n += 1
+                if len(columns["id"]) >= row_group:
+                    writer.write_table(pa.table(columns, schema=schema))
+                    columns = {name: [] for name in EXPORT_FIELDS}
+            if columns["id"]:
+                writer.write_table(pa.table(columns, schema=schema))
+        finally:
+            writer.close()
+        os.replace(path + ".tmp", path)
+        return n
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or export the question store.")
+    parser.add_argument("db", help="store file (orchestrator.QUESTION_STORE_PATH)")
+    parser.add_argument("--export", help="output file: .jsonl, or .parquet for columnar output")
+    parser.add_argument("--outcome", help=f"{ACCEPTED}, {REJECTED} or a failure type (e.g. HALLUCINATION)")
+    parser.add_argument("--category")
+    parser.add_argument("--difficulty")
+    parser.add_argument("--since", help="ISO date/time")
+    parser.add_argument("--until", help="ISO date/time")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="re-judge matching rows, re-running Solver A's stored code locally")
+    parser.add_argument("--import-jsonl", action="append", default=[], help="load an earlier JSONL output first")
+    args = parser.parse_args()
+
+    store = QuestionStore(args.db)
+    for path in args.import_jsonl:
+        print(f"   📥 Imported {store.import_jsonl(path):,} rows from {path}")
+    filters = {"outcome": args.outcome, "category": args.category, "difficulty": args.difficulty,
+               "since": args.since, "until": args.until}
+
+    if args.export:
+        started = time.perf_counter()
+        export = store.export_parquet if args.export.endswith(".parquet") else store.export_jsonl
+        n = export(args.export, **filters)
+        print(f"   📦 Exported {n:,} rows to {args.export} in {time.perf_counter() - started:.2f}s")
+    elif args.revalidate:
+        started = time.perf_counter()
+        # The orchestrator's validator (configured tolerances) and sandbox pool; no model calls
+        from orchestrator import Orchestrator
+        orch = Orchestrator(dedup_path=None, cache_dir=None, upload_url=None, trace_path=None, store_path=None)
+        try: changes = orch.revalidate_store(store, **filters)
+        finally: orch.shutdown()
+        print(f"   🔁 Re-judged {sum(changes.values()):,} rows in {time.perf_counter() - started:.2f}s")
+        for (old, new), n in changes.most_common():
+            print(f"   {old:<20} -> {new:<20} {n:>8,}" + ("" if old == new else "   ⚠️ changed"))
+    else:
+        for outcome, n in store.counts("outcome", **filters).items():
+            print(f"   {outcome:<20} {n:>8,}")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
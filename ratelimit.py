@@ -0,0 +1,219 @@
+import re
+import time
+import heapq
+import random
+import itertools
+import threading
+import collections
+
+# --- QUOTA-AWARE SCHEDULER FOR MODEL CALLS ---
+# One ModelScheduler sits in front of every Gemini call. Per model it keeps two
+# token buckets (requests/min and tokens/min); callers wait for a permit in
+# priority order, so solver calls for questions already in flight go ahead of
+# new generations. Priority holds across models too: while a higher-priority
+# call waits on any model (solvers backed up on flash), lower-priority calls
+# (the generator, on pro) wait as well, instead of adding more work. A 429
+# pauses the whole model for its retry-after (or a jittered exponential
+# backoff) and the call is retried instead of becoming "Error".
+
+# Lower number = served first
+PRIORITIES = {"solver": 0, "review": 1, "research": 1, "generate": 2}
+
+# Output tokens reserved per call before the real usage is known (reconciled afterwards)
+OUTPUT_TOKEN_ALLOWANCE = 512
+
+
+class RateLimited(Exception):
+    """Raised when a call is still throttled after all retries (or waited past its timeout)."""
+
+
+def is_rate_limit(exc):
+    """True for HTTP 429 / quota errors, however the client library surfaced them."""
+    if getattr(exc, "code", None) == 429 or getattr(exc, "status_code", None) == 429:
+        return True
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    text = str(exc).lower()
+    return "429" in text or "resource has been exhausted" in text or "quota" in text or "rate limit" in text
+
+
+def retry_after(exc):
+    """Server-suggested wait in seconds (Retry-After header, RetryInfo, or 'retry in Ns'), else None."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("Retry-After"): return float(headers["Retry-After"])
+    except (TypeError, ValueError):
+        pass
+    text = str(exc)
+    match = (re.search(r"retry in (\d+(?:\.\d+)?)\s*s", text, re.I)
+             or re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", text))
+    return float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else per_minute
+        self.level = self.capacity
+
+    def refill(self, now, last):
+        self.level = min(self.capacity, self.level + (now - last) * self.rate)
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (amount is capped at capacity so huge prompts still pass)."""
+        need = min(amount, self.capacity) - self.level
+        return 0.0 if need <= 0 else need / self.rate
+
+    def take(self, amount):
+        self.level -= amount   # may go negative: later callers pay the debt
+
+
+class _ModelState:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiters = []    # heap of (priority, seq)
+
+
+class ModelScheduler:
+    def __init__(self, limits=None, default_rpm=60, default_tpm=1_000_000,
+                 max_retries=5, backoff=2.0, max_backoff=60.0, tracer=None):
+        """
+        `limits` = {model_name: {"rpm": ..., "tpm": ...}}; models not listed get the defaults.
+        A limit of None/0 disables that bucket.
+        """
+        self.limits = limits or {}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.tracer = tracer
+
+        self._models = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queued = collections.Counter()   # rank -> callers waiting for a permit (all models)
+        self.stats = {"calls": 0, "throttled": 0, "rate_limited": 0, "retries": 0, "gave_up": 0}
+
+    def _state(self, model_name):
+        state = self._models.get(model_name)
+        if state is None:
+            limit = self.limits.get(model_name, {})
+            state = self._models[model_name] = _ModelState(
+                limit.get("rpm", self.default_rpm), limit.get("tpm", self.default_tpm)
+            )
+        return state
+
+    def _bump(self, key, **labels):
+        self.stats[key] += 1   # callers hold self._cond
+        if self.tracer: self.tracer.count(f"scheduler_{key}", **labels)
+
+    # --- PERMITS ---
+    def acquire(self, model_name, priority="generate", tokens=0, timeout=None):
+        """
+        Blocks until this call may be sent. Higher-priority waiters on the same model go first,
+        and no call is sent while a higher-priority one is still waiting on any model.
+        """
+        rank = PRIORITIES.get(priority, priority)
+        entry = (rank, next(self._seq))
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        started = time.monotonic()
+        waited = False
+
+        with self._cond:
+            state = self._state(model_name)
+            heapq.heappush(state.waiters, entry)
+            self._queued[rank] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    for bucket in (state.requests, state.tokens):
+                        if bucket: bucket.refill(now, state.updated)
+                    state.updated = now
+
+                    if state.waiters[0] != entry or self._backlog_ahead(rank):
+                        wait = None          # not our turn: woken when a waiter ahead leaves
+                    else:
+                        wait = max(0.0, state.blocked_until - now,
+                                   state.requests.wait_time(1) if state.requests else 0.0,
+                                   state.tokens.wait_time(tokens) if state.tokens else 0.0)
+                    if wait == 0.0:
+                        if state.requests: state.requests.take(1)
+                        if state.tokens: state.tokens.take(tokens)
+                        self._bump("calls", model=model_name)
+                        break
+
+                    if not waited:
+                        waited = True
+                        self._bump("throttled", model=model_name)
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise RateLimited(f"{model_name}: no permit within {timeout}s")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._queued[rank] -= 1
+                state.waiters.remove(entry)
+                heapq.heapify(state.waiters)
+                self._cond.notify_all()
+
+        if self.tracer and waited:
+            self.tracer.observe("scheduler_wait", time.monotonic() - started, model=model_name, priority=priority)
+
+    def _backlog_ahead(self, rank):
+        return any(n > 0 for r, n in self._queued.items() if r < rank)
+
+    def settle(self, model_name, estimated, actual):
+        """Charges (or refunds) the difference between the reserved and the reported token usage."""
+        if not actual: return
+        with self._cond:
+            state = self._state(model_name)
+            if state.tokens: state.tokens.take(actual - estimated)
+
+    def penalize(self, model_name, attempt, exc):
+        """After a 429: pause every caller of this model, for retry-after or a jittered backoff."""
+        delay = retry_after(exc)
+        if delay is None:
+            delay = min(self.max_backoff, self.backoff * (2 ** attempt)) * (0.5 + random.random())
+        with self._cond:
+            state = self._state(model_name)
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+            self._bump("rate_limited", model=model_name)
+            self._cond.notify_all()
+        return delay
+
+    # --- CALLS ---
+    def run(self, model_name, fn, priority="generate", tokens=0, timeout=None):
+        """
+        Runs fn() under the model's quota, retrying 429s. `timeout` bounds the total
+        time spent waiting for permits (e.g. the caller's own request deadline).
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for attempt in range(self.max_retries + 1):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            self.acquire(model_name, priority, tokens, timeout=remaining)
+            try:
+                return fn()
+            except Exception as e:
+                if not is_rate_limit(e): raise
+                self.penalize(model_name, attempt, e)
+                if attempt == self.max_retries:
+                    with self._cond: self._bump("gave_up", model=model_name)
+                    raise
+                with self._cond: self._bump("retries", model=model_name)
+
+    def queue_depth(self):
+        with self._cond:
+            return {name: len(state.waiters) for name, state in self._models.items()}
+
+    def snapshot(self):
+        with self._cond:
+            out = dict(self.stats)
+            out["queued"] = sum(len(state.waiters) for state in self._models.values())
+        return out
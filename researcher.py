@@ -1,7 +1,33 @@
 import google.generativeai as genai
+import io
 import os
 import re
 import json
+import hashlib
+import difflib
+import concurrent.futures
+from llm import ModelFactory
+
+# --- PDF EXTRACTION ---
+PDF_CHAR_BUDGET = 25000          # "single" mode: only this much text is ever sent to the model
+MAX_DOCUMENT_CHARS = 2_000_000   # "chunked" mode: extraction stops here (~800 textbook pages)
+PARALLEL_PAGE_THRESHOLD = 60     # PDFs with more pages are extracted in a process pool
+PAGES_PER_TASK = 8
+
+# --- RESEARCH CACHE (keyed by the source document's content hash and the research settings) ---
+RESEARCH_CACHE_DIR = ".research_cache"
+RESEARCH_VERSION = "2"           # bump when the prompt changes to invalidate old results
+
+# --- MAP-REDUCE RESEARCH ---
+# "chunked": the whole document is split into sections, each section is analyzed
+# by its own (concurrent) model call and the findings are merged.
+# "single": one call on the first PDF_CHAR_BUDGET characters (the old behaviour).
+RESEARCH_MODE = "chunked"
+RESEARCH_CHUNK_CHARS = 12000
+RESEARCH_WORKERS = 6
+TOPIC_MERGE_THRESHOLD = 0.85     # name similarity above which two categories are the same one
+RULE_MERGE_THRESHOLD = 0.75      # wording similarity above which two style rules are the same rule
+MAX_STYLE_RULES = 12             # the generator's STYLE: prompt gets the most widely seen rules
 
 EMBEDDED_PDF_CONTENT = """
 HYDRAHACKS – SAMPLE QUANT WORD PROBLEMS (REFERENCE ONLY)
@@ -79,40 +105,283 @@ FINAL NOTE:
 These examples are NOT the questions you will generate tomorrow. They simply illustrate: story format, real-world math, multiple steps, solvable scenarios, clear variables, no contradictions, MCQ structure.
 """
 
+def read_source_bytes(source):
+    """Raw bytes of an uploaded file (Streamlit UploadedFile / file object), path, or bytes."""
+    if isinstance(source, (bytes, bytearray)): return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f: return f.read()
+    if hasattr(source, "getvalue"): return source.getvalue()
+    data = source.read()
+    if hasattr(source, "seek"): source.seek(0)
+    return data
+
+# Each pool worker parses the PDF once and keeps the reader for all its page ranges
+_worker_reader = None
+
+def _init_page_worker(pdf_bytes):
+    global _worker_reader
+    import pypdf
+    _worker_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+
+def _extract_page_range(start, stop):
+    return "".join((_worker_reader.pages[i].extract_text() or "") + "\n" for i in range(start, stop))
+
+def extract_pdf_text(pdf_bytes, char_budget=PDF_CHAR_BUDGET, workers=None):
+    """
+    Streams page text and stops as soon as `char_budget` characters are collected
+    (char_budget=None reads the whole document). Big scans are extracted in a
+    process pool, in page order, a few ranges ahead of what's been consumed.
+    """
+    import pypdf
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    n_pages = len(reader.pages)
+    parts, size = [], 0
+
+    if n_pages < PARALLEL_PAGE_THRESHOLD or workers == 1:
+        for page in reader.pages:
+            parts.append((page.extract_text() or "") + "\n")
+            size += len(parts[-1])
+            if char_budget and size >= char_budget: break
+        text = "".join(parts)
+        return text[:char_budget] if char_budget else text
+
+    workers = workers or min(8, os.cpu_count() or 1)
+    ranges = [(i, min(i + PAGES_PER_TASK, n_pages)) for i in range(0, n_pages, PAGES_PER_TASK)]
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_page_worker, initargs=(pdf_bytes,)
+    )
+    try:
+        pending = [pool.submit(_extract_page_range, *r) for r in ranges[:workers * 2]]
+        next_range = len(pending)
+        while pending:
+            parts.append(pending.pop(0).result())
+            size += len(parts[-1])
+            if char_budget and size >= char_budget: break
+            if next_range < len(ranges):
+                pending.append(pool.submit(_extract_page_range, *ranges[next_range]))
+                next_range += 1
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    text = "".join(parts)
+    return text[:char_budget] if char_budget else text
+
+
+# --- CHUNKING ---
+# A line that starts a new chapter/category/section is a preferred place to cut
+SECTION_RE = re.compile(r"^\s*(?:chapter|category|section|unit|part|topic)\b|^\s*\d+(?:\.\d+)*\s+[A-Z]", re.I)
+
+def split_sections(text, chunk_chars=RESEARCH_CHUNK_CHARS):
+    """
+    Splits text into chunks of at most `chunk_chars`, cutting at section headings
+    where possible, then at blank lines, and only mid-paragraph as a last resort.
+    """
+    blocks, current = [], []
+    for line in text.splitlines(keepends=True):
+        if current and (SECTION_RE.match(line) or not line.strip()):
+            blocks.append(("".join(current), bool(SECTION_RE.match(current[0]))))
+            current = []
+        if line.strip() or current:
+            current.append(line)
+    if current:
+        blocks.append(("".join(current), bool(SECTION_RE.match(current[0]))))
+
+    chunks, parts, size = [], [], 0
+    for block, is_heading in blocks:
+        # Start a new chunk at a heading once the current one is at least half full
+        if parts and (size + len(block) > chunk_chars or (is_heading and size >= chunk_chars // 2)):
+            chunks.append("".join(parts))
+            parts, size = [], 0
+        while len(block) > chunk_chars:
+            chunks.append(block[:chunk_chars])
+            block = block[chunk_chars:]
+        parts.append(block)
+        size += len(block)
+    if parts:
+        chunks.append("".join(parts))
+    return [c for c in chunks if c.strip()]
+
+
+# --- MERGING ---
+def topic_key(name):
+    """'Time, Speed & Distance (TSD)' and 'time speed and distance' both become 'distance speed time'."""
+    name = re.sub(r"\([^)]*\)", " ", str(name).lower()).replace("&", " and ")
+    words = [w for w in re.findall(r"[a-z0-9]+", name) if w not in ("and", "the", "of", "problems", "questions")]
+    return " ".join(sorted(set(words)))
+
+def same_topic(a, b, threshold=TOPIC_MERGE_THRESHOLD):
+    return a == b or difflib.SequenceMatcher(None, a, b).ratio() >= threshold
+
+def rule_key(rule):
+    return " ".join(re.findall(r"[a-z0-9]+", str(rule).lower()))
+
+def same_rule(a, b, threshold=RULE_MERGE_THRESHOLD):
+    if a == b: return True
+    matcher = difflib.SequenceMatcher(None, a, b)
+    # The cheap upper bounds rule out most pairs before the full comparison
+    return matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold \
+        and matcher.ratio() >= threshold
+
+def merge_findings(findings, threshold=TOPIC_MERGE_THRESHOLD, max_rules=MAX_STYLE_RULES):
+    """
+    Reduces per-chunk findings (in document order) into one result. Near-identical
+    category names and style rules are merged, keeping the wording that appeared first;
+    only the `max_rules` rules reported by the most sections are kept.
+    """
+    topics, keys = [], []
+    rules, rule_keys, support = [], [], []
+    analyses = []
+    for data in findings:
+        for topic in data.get("topics") or []:
+            key = topic_key(topic)
+            if not key: continue
+            if not any(same_topic(key, seen, threshold) for seen in keys):
+                keys.append(key)
+                topics.append(str(topic).strip())
+        for rule in data.get("style_rules") or []:
+            key = rule_key(rule)
+            if not key: continue
+            match = next((i for i, seen in enumerate(rule_keys) if same_rule(key, seen)), None)
+            if match is None:
+                rule_keys.append(key)
+                rules.append(rule)
+                support.append(1)
+            else:
+                support[match] += 1
+        analysis = str(data.get("difficulty_analysis") or "").strip()
+        if analysis and analysis not in analyses:
+            analyses.append(analysis)
+    keep = sorted(sorted(range(len(rules)), key=lambda i: -support[i])[:max_rules])
+    return {"topics": topics, "difficulty_analysis": " ".join(analyses), "style_rules": [rules[i] for i in keep]}
+
+
 class ResearcherAgent:
-    def __init__(self, api_key):
+    def __init__(self, api_key, models=None, cache_dir=RESEARCH_CACHE_DIR):
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-flash")
+        self.model = (models or ModelFactory()).create("gemini-1.5-flash", role="researcher", priority="research")
+        self.cache_dir = cache_dir
+        self.memory_cache = {}
 
     def read_pdf_content(self):
         return EMBEDDED_PDF_CONTENT
 
-    def conduct_research(self, custom_pdf_file=None):
+    def source_hash(self, source_bytes):
+        # The settings are read at call time: switching RESEARCH_MODE must not return the other mode's result
+        budget = MAX_DOCUMENT_CHARS if RESEARCH_MODE == "chunked" else PDF_CHAR_BUDGET
+        settings = f"{RESEARCH_VERSION}|{RESEARCH_MODE}|{RESEARCH_CHUNK_CHARS}|{budget}"
+        return hashlib.sha256(settings.encode() + b"\0" + source_bytes).hexdigest()
+
+    def cached_research(self, key):
+        if key in self.memory_cache: return self.memory_cache[key]
+        if not self.cache_dir: return None
+        try:
+            with open(os.path.join(self.cache_dir, key + ".json"), encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        self.memory_cache[key] = text
+        return text
+
+    def store_research(self, key, json_text):
+        self.memory_cache[key] = json_text
+        if not self.cache_dir: return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, key + ".json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f: f.write(json_text)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"   ⚠️ Research cache write failed: {e}")
+
+    def conduct_research(self, custom_pdf_file=None, progress=None):
         """
         Analyzes reference material. 
+        Results are cached by the document's content hash, so re-uploading the same PDF is instant.
+        `progress(done, total)` is called as each chunk finishes (chunked mode).
         """
-        raw_text = ""
-        
         if custom_pdf_file:
             try:
-                import pypdf
-                pdf_reader = pypdf.PdfReader(custom_pdf_file)
-                for page in pdf_reader.pages:
-                    raw_text += page.extract_text() + "\n"
+                source = read_source_bytes(custom_pdf_file)
+            except Exception as e:
+                return json.dumps({"error": f"Failed to read PDF: {str(e)}", "topics": ["General Math"]})
+        else:
+            source = self.read_pdf_content().encode()
+
+        key = self.source_hash(source)
+        cached = self.cached_research(key)
+        if cached is not None:
+            print("   ⚡ Research cache hit (same document as before).")
+            return cached
+
+        if custom_pdf_file:
+            try:
+                budget = MAX_DOCUMENT_CHARS if RESEARCH_MODE == "chunked" else PDF_CHAR_BUDGET
+                raw_text = extract_pdf_text(source, budget)
                 print("   📄 Successfully read custom PDF.")
             except Exception as e:
                 return json.dumps({"error": f"Failed to read PDF: {str(e)}", "topics": ["General Math"]})
         else:
             print("   📄 Using Embedded Reference Material.")
             raw_text = self.read_pdf_content()
-        
+
+        if RESEARCH_MODE == "chunked":
+            json_text = self.analyze_chunked(raw_text, progress)
+        else:
+            json_text = self.analyze(raw_text)
+        try:
+            # Only cache real answers, never the fallback/error payloads
+            data = json.loads(json_text)
+            if isinstance(data.get("topics"), list) and "error" not in data:
+                self.store_research(key, json_text)
+        except (ValueError, AttributeError):
+            pass
+        return json_text
+
+    def analyze_chunked(self, raw_text, progress=None):
+        """Map: analyze every section concurrently. Reduce: merge the findings in document order."""
+        chunks = split_sections(raw_text, RESEARCH_CHUNK_CHARS)
+        if len(chunks) <= 1:
+            return self.analyze(raw_text)
+
+        print(f"   📚 Analyzing {len(chunks)} sections ({len(raw_text):,} chars) with {RESEARCH_WORKERS} workers...")
+        findings = [None] * len(chunks)
+        errors = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=RESEARCH_WORKERS) as pool:
+            futures = {pool.submit(self.analyze, chunk, (i + 1, len(chunks))): i for i, chunk in enumerate(chunks)}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                try:
+                    data = json.loads(future.result())
+                except (ValueError, TypeError):
+                    data = {"error": "unparseable research output"}
+                if isinstance(data, dict) and isinstance(data.get("topics"), list) and "error" not in data:
+                    findings[futures[future]] = data
+                else:
+                    errors.append(data.get("error") if isinstance(data, dict) else str(data))
+                print(f"   📖 Section {done}/{len(chunks)} analyzed.")
+                if progress: progress(done, len(chunks))
+
+        findings = [f for f in findings if f is not None]
+        if not findings:
+            return json.dumps({"topics": ["Time, Speed & Distance", "Work & Time", "Profit & Loss"],
+                               "error": errors[0] if errors else "no sections analyzed"})
+        merged = merge_findings(findings)
+        merged["sections"] = len(chunks)
+        if errors:
+            # Partial results are still used, but flagged so they are not cached
+            merged["error"] = f"{len(errors)}/{len(chunks)} sections failed: {errors[0]}"
+        print(f"   🧩 Merged {sum(len(f['topics']) for f in findings)} section topics into {len(merged['topics'])} categories.")
+        return json.dumps(merged)
+
+    def analyze(self, raw_text, part=None):
         # --- UPDATED PROMPT FOR STRICT JSON ---
+        scope = (f"This is section {part[0]} of {part[1]} of a longer document; "
+                 "report only the categories that appear in this section.") if part else ""
         prompt = f"""
         You are an Expert Curriculum Researcher.
         Analyze the following reference material to extract specific Math Categories.
+        {scope}
         
         REFERENCE MATERIAL:
-        {raw_text[:25000]} 
+        {raw_text[:PDF_CHAR_BUDGET]} 
         
         TASK:
         1. Identify ALL unique Categories/Domains listed (e.g., "Time Speed Distance", "Work & Time").
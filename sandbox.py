@@ -0,0 +1,181 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+
+# --- LOCAL CODE EXECUTION FOR SOLVER A ---
+# A pool of pre-spawned interpreter processes. Each one is already started (and has the
+# usual math modules imported) before it gets a job, runs exactly one snippet, and is
+# replaced, so no state leaks from one run into the next. CPU time, address space and
+# file writes are capped with rlimits, sockets are disabled, and stdout is captured.
+# These limits contain runaway or careless code from our own model; they are not a
+# security boundary for hostile code (use a container for that).
+
+# Only blocks tagged python/py: Gemini's code execution replies put their output in untagged blocks
+CODE_FENCE_RE = re.compile(r"```(?:python|py)[ \t]*\n(.*?)```", re.S | re.I)
+OUTPUT_MARKER = "OUTPUT:"
+# An answer format_answer() produced: the code this pool ran, then its output
+STORED_RE = re.compile(r"\A```python\n(.*)\n```\n" + OUTPUT_MARKER + r"\n", re.S)
+
+# Runs inside each sandbox process (python -I: no site-packages paths, no PYTHON* env)
+_RUNNER = r"""
+import sys, io, json, contextlib
+limits = json.loads(sys.argv[1])
+import math, cmath, fractions, decimal, itertools, functools, statistics, collections   # warm imports
+try:
+    import resource
+    mem = limits["memory_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (mem, mem))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+except (ImportError, ValueError, OSError):
+    resource = None
+import socket
+def _no_network(*args, **kwargs):
+    raise OSError("network access is disabled in the sandbox")
+socket.socket = socket.create_connection = socket.getaddrinfo = _no_network
+
+code = sys.stdin.read()
+if resource is not None:
+    cpu = limits["cpu_seconds"]
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+out = io.StringIO()
+error = None
+try:
+    with contextlib.redirect_stdout(out):
+        exec(compile(code, "<solver_a>", "exec"), {"__name__": "__main__"})
+except BaseException as e:
+    error = f"{type(e).__name__}: {e}"
+sys.__stdout__.write(json.dumps({"stdout": out.getvalue()[-limits["max_output"]:], "error": error}))
+sys.__stdout__.flush()
+"""
+
+
+class SandboxResult:
+    def __init__(self, stdout="", error=None, seconds=0.0):
+        self.stdout = stdout
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def extract_code(text):
+    """The Python code in a model reply (fenced blocks joined in order), or None."""
+    if not text: return None
+    blocks = CODE_FENCE_RE.findall(text)
+    if blocks: return "\n".join(b.strip("\n") for b in blocks)
+    # A bare reply without fences: only if it plainly is code
+    if "print(" in text and "```" not in text and OUTPUT_MARKER not in text: return text.strip()
+    return None
+
+
+def stored_code(text):
+    """
+    The code of a stored answer that can be re-run: only answers this pool produced
+    (format_answer). Replies that already carry someone else's execution output (Gemini's
+    code execution tool) are judged as stored, since their code may rely on that environment.
+    """
+    match = STORED_RE.match(text or "")
+    return match.group(1) if match else None
+
+
+def format_answer(code, stdout):
+    """Solver A's answer text: the code, then its output (parsers read the output, which comes last)."""
+    return f"```python\n{code}\n```\n{OUTPUT_MARKER}\n{stdout.strip()}"
+
+
+class SandboxPool:
+    def __init__(self, size=4, cpu_seconds=5, memory_mb=512, timeout=10.0, max_output=20000, tracer=None):
+        """Processes are spawned on first use, so an unused pool costs nothing."""
+        self.size = size
+        self.timeout = timeout
+        self.tracer = tracer
+        self.limits = json.dumps({"cpu_seconds": cpu_seconds, "memory_mb": memory_mb, "max_output": max_output})
+        self.workdir = None
+        self.stats = {"runs": 0, "errors": 0, "timeouts": 0, "killed": 0}
+        self._idle = queue.Queue()
+        self._started = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _spawn(self):
+        return subprocess.Popen(
+            [sys.executable, "-I", "-c", _RUNNER, self.limits],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=self.workdir, env={"PATH": os.environ.get("PATH", "")},
+        )
+
+    def start(self):
+        with self._lock:
+            if self._started: return
+            self._started = True
+            self.workdir = tempfile.mkdtemp(prefix="solver-sandbox-")
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+
+    def _bump(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def run(self, code):
+        """Executes `code` in a fresh sandbox process. Never raises for errors in the code itself."""
+        if self._closed: raise RuntimeError("sandbox pool is closed")
+        self.start()
+        proc = self._idle.get()
+        # The replacement warms up while this one runs
+        if not self._closed: self._idle.put(self._spawn())
+
+        started = time.monotonic()
+        self._bump("runs")
+        try:
+            out, _ = proc.communicate(code.encode("utf-8"), timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            self._bump("timeouts")
+            result = SandboxResult(error=f"timed out after {self.timeout}s")
+        else:
+            try:
+                data = json.loads(out or b"")
+                result = SandboxResult(data["stdout"], data["error"])
+            except (ValueError, KeyError):
+                # No report: killed by an rlimit (e.g. SIGXCPU) or crashed outright
+                self._bump("killed")
+                result = SandboxResult(error=f"sandbox process died (exit {proc.returncode})")
+        result.seconds = time.monotonic() - started
+        if result.error: self._bump("errors")
+        if self.tracer: self.tracer.observe("sandbox", result.seconds, ok=result.ok)
+        return result
+
+    def run_answer(self, text, stored=False):
+        """
+        Runs the code in a model reply (or, with stored=True, in a stored format_answer text) and
+        returns Solver A's answer text (None if there's no code or it failed).
+        """
+        code = stored_code(text) if stored else extract_code(text)
+        if code is None: return None
+        result = self.run(code)
+        if not result.ok: return None
+        return format_answer(code, result.stdout)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try: proc = self._idle.get_nowait()
+            except queue.Empty: break
+            proc.kill()
+            proc.communicate()
+        if self.workdir: shutil.rmtree(self.workdir, ignore_errors=True)
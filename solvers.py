@@ -1,5 +1,16 @@
 import google.generativeai as genai
 import os
+import re
+import json
+import time
+import heapq
+import itertools
+import threading
+import collections
+import concurrent.futures
+from llm import ModelFactory
+from validator import parse_structured, structured_number, MODEL_ERROR
+from sandbox import SandboxPool
 
 # CONFIGURATION
 # API_KEY = "AIzaSy...PASTE_YOUR_KEY_HERE..."
@@ -8,23 +19,286 @@ import os
 # Use the stable model alias
 MODEL_NAME = "gemini-flash-latest"
 
-class SolverSquad:
+# --- DEADLINES & HEDGING ---
+# Hard per-agent deadline (seconds). A call still running at its deadline answers TIMEOUT.
+AGENT_DEADLINES = {"a": 120, "b": 60, "c": 60}
+# Fire one duplicate request once a call is slower than this percentile of recent calls
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20   # don't hedge until we have a latency history
+LATENCY_WINDOW = 200
+
+TIMEOUT = "TIMEOUT"
+# MODEL_ERROR (validator.py): the request itself failed (quota, transport, safety block).
+# "Error" is kept for answers that came back unusable (e.g. Solver A's code didn't run).
+
+# --- BATCHED SOLVING ---
+# Several labelled problems per agent request. A batch's deadline grows by this fraction
+# of the agent deadline for every extra problem.
+BATCH_DEADLINE_STEP = 0.5
+BATCH_HEADER_RE = re.compile(r"^[ \t*#]*ANSWER\s+(\d+)\b[ \t*#]*[:.)-]?[ \t*#]*", re.I | re.M)
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+# --- STRUCTURED OUTPUT ---
+# B and C answer in JSON mode against this schema; A (code execution can't be combined
+# with JSON mode) prints the same object as its last output line.
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "working": {"type": "string"},
+        "final_answer": {"type": "number"},
+        "unit": {"type": "string"},
+        "equation": {"type": "string"},
+    },
+    "required": ["working", "final_answer", "unit", "equation"],
+}
+BATCH_ANSWER_SCHEMA = {
+    "type": "array",
+    "items": {**ANSWER_SCHEMA,
+              "properties": {"problem": {"type": "integer"}, **ANSWER_SCHEMA["properties"]},
+              "required": ["problem", *ANSWER_SCHEMA["required"]]},
+}
+STRUCTURED_RULES = """
+            OUTPUT (JSON): "working" = your full reasoning in plain text, "final_answer" = the bare
+            number only (no units, no commas), "unit" = its unit ("" if none), "equation" = the core equation.
+            """
+STRUCTURED_RULES_CODE = """
+            4. As the LAST line of output, print one JSON object:
+               {"final_answer": <number>, "unit": "<unit>", "equation": "<core equation>"}
+               (final_answer is the bare number: no units, no commas).
+            """
+
+# --- SOLVER A CODE EXECUTION ---
+# "remote": Gemini's code_execution tool runs A's code server-side (an extra round trip)
+# "local":  A only writes the code, which runs here in a sandbox.SandboxPool
+CODE_EXECUTION = "remote"
+LOCAL_CODE_RULES = """
+            You cannot run code yourself: reply with ONE ```python code block and nothing else.
+            Standard library only (math, fractions, decimal, itertools, statistics); no input(), files or network.
+            """
+
+
+def batch_prompt(problems, structured=False):
+    parts = [f"Solve each of the following {len(problems)} problems independently.", ""]
+    for i, problem in enumerate(problems, 1):
+        parts += [f"### PROBLEM {i}", problem.strip(), ""]
+    if structured:
+        parts.append(f"Reply with a JSON array of {len(problems)} answer objects, one per problem, "
+                     f'each with "problem" set to its problem number.')
+        return "\n".join(parts)
+    parts.append(
+        f"Answer all {len(problems)} problems in order. Start each answer with its own header line "
+        f'"### ANSWER k" (k = the problem number) and follow your usual output rules inside every '
+        f"section, so each section is complete on its own."
+    )
+    return "\n".join(parts)
+
+
+def parse_structured_batch(text, count):
+    """Per-problem answers (each as its own JSON object text) from a JSON-array reply."""
+    try:
+        items = json.loads(text or "")
+    except ValueError:
+        return [None] * count
+    answers = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or structured_number(item) is None: continue
+        k = item.pop("problem", None)
+        if isinstance(k, int) and 1 <= k <= count and k not in answers:
+            answers[k] = json.dumps(item, ensure_ascii=False)
+    return [answers.get(k) for k in range(1, count + 1)]
+
+
+def parse_batch(text, count, agent, structured=False):
+    """
+    Splits a batched reply into per-problem answers (by "### ANSWER k" headers, or the
+    "problem" field of a structured reply). Returns a list with None wherever a problem's
+    answer can't be matched reliably.
+    """
+    if structured and agent != "a":
+        return parse_structured_batch(text, count)
+    sections = {}
+    matches = list(BATCH_HEADER_RE.finditer(text or ""))
+    for m, nxt in zip(matches, matches[1:] + [None]):
+        k = int(m.group(1))
+        body = text[m.end():nxt.start() if nxt else len(text)].strip()
+        if 1 <= k <= count and k not in sections:
+            sections[k] = body
+
+    answers = []
+    for k in range(1, count + 1):
+        body = sections.get(k)
+        data = parse_structured(body) if structured and body else None
+        if data is not None:
+            if structured_number(data) is None: body = None
+        elif body and agent != "a":
+            # B and C must end the section with their FINAL ANSWER line
+            tail = body.upper().rsplit("FINAL ANSWER", 1)
+            if len(tail) < 2 or not NUMBER_RE.search(tail[1]): body = None
+        elif body and not NUMBER_RE.search(body):
+            body = None
+        answers.append(body or None)
+    return answers
+
+
+def _chain(source, target):
+    source.add_done_callback(lambda f: target.done() or target.set_result(f.result()))
+
+
+class _Batcher:
+    """Collects single-problem requests for one agent (across in-flight questions) into batches."""
+    def __init__(self, squad, agent, max_size, max_wait):
+        self.squad = squad
+        self.agent = agent
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.pending = []
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def submit(self, problem):
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.pending.append((problem, future))
+            if len(self.pending) >= self.max_size:
+                batch = self._take()
+            else:
+                batch = None
+                if len(self.pending) == 1:
+                    generation = self.generation
+                    self.squad._timers.call_later(self.max_wait, lambda: self._flush(generation))
+        if batch: self._send(batch)
+        return future
+
+    def _take(self):
+        batch, self.pending = self.pending, []
+        self.generation += 1
+        return batch
+
+    def _flush(self, generation):
+        with self.lock:
+            # The batch this timer was armed for may already have gone out full
+            if generation != self.generation or not self.pending: return
+            batch = self._take()
+        self._send(batch)
+
+    def _send(self, batch):
+        problems = [p for p, _ in batch]
+        for result, (_, future) in zip(self.squad.call_batch(self.agent, problems), batch):
+            _chain(result, future)
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies for one agent."""
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct, min_samples=HEDGE_MIN_SAMPLES):
+        with self.lock:
+            if len(self.samples) < min_samples: return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class _Timers:
+    """One daemon thread firing delayed callbacks (hedges, deadlines) for every call."""
     def __init__(self):
+        self.heap = []
+        self.cond = threading.Condition()
+        self.seq = itertools.count()
+        threading.Thread(target=self._run, name="solver-timers", daemon=True).start()
+
+    def call_later(self, delay, fn):
+        with self.cond:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.seq), fn))
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                when, _, fn = self.heap[0]
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+            try: fn()
+            except Exception as e: print(f"   ⚠️ Solver timer failed: {e}")
+
+def gather(futures):
+    """Combines several futures into one that resolves to a tuple of their results."""
+    combined = concurrent.futures.Future()
+    results = [None] * len(futures)
+    pending = [len(futures)]
+    lock = threading.Lock()
+
+    def done(i, fut):
+        try:
+            results[i] = fut.result()
+        except Exception as e:
+            if not combined.done(): combined.set_exception(e)
+            return
+        with lock:
+            pending[0] -= 1
+            finished = pending[0] == 0
+        if finished and not combined.done():
+            combined.set_result(tuple(results))
+
+    for i, fut in enumerate(futures):
+        fut.add_done_callback(lambda f, i=i: done(i, f))
+    return combined
+
+class SolverSquad:
+    def __init__(self, executor=None, deadlines=None, hedge_percentile=HEDGE_PERCENTILE, models=None,
+                 tracer=None, batch_size=1, batch_wait=0.25, structured=True,
+                 code_execution=CODE_EXECUTION, sandbox=None):
+        # One long-lived pool shared by every question (owned by the Orchestrator)
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=12, thread_name_prefix="solver"
+        )
+        self.deadlines = {**AGENT_DEADLINES, **(deadlines or {})}
+        self.hedge_percentile = hedge_percentile  # None disables hedging
+        self.latency = {agent: LatencyTracker() for agent in "abc"}
+        self.call_stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0,
+                           "batches": 0, "batched_items": 0, "batch_fallbacks": 0, "model_errors": 0}
+        self._stats_lock = threading.Lock()
+        self._timers = _Timers()
+        self.tracer = tracer
+        # batch_size > 1: submit() groups requests from in-flight questions (waiting up to batch_wait s)
+        self.batch_size = batch_size
+        self._batchers = {agent: _Batcher(self, agent, batch_size, batch_wait) for agent in "abc"}
+        # structured: JSON answers (final_answer/unit/equation) instead of free-text FINAL ANSWER lines
+        self.structured = structured
+        # code_execution="local": A's code runs in this sandbox pool instead of on Gemini's side
+        # (the pool is also used to re-run stored code, so it's created in either mode)
+        self.code_execution = code_execution
+        self.sandbox = sandbox or SandboxPool(tracer=tracer)
+        local = code_execution == "local"
+        models = models or ModelFactory()
+
         # --- AGENT A: PYTHON ENGINEER (Calculates + Extracts Equation) ---
-        self.agent_a = genai.GenerativeModel(
+        self.agent_a = models.create(
+            role="solver_a",
             model_name=MODEL_NAME,
-            tools="code_execution",
+            priority="solver",
+            tools=None if local else "code_execution",
             system_instruction="""
             You are Solver A (Python). 
             1. Write Python code to solve the problem.
             2. Ends with `print(final_answer)`.
             3. ALSO, write the core algebraic equation used as a comment or print it with prefix "EQUATION:".
-            """
+            """ + (STRUCTURED_RULES_CODE if structured else "") + (LOCAL_CODE_RULES if local else "")
         )
 
         # --- AGENT B: LOGICIAN (Updated: NO LaTeX) ---
-        self.agent_b = genai.GenerativeModel(
+        self.agent_b = models.create(
+            role="solver_b",
             model_name=MODEL_NAME,
+            priority="solver",
             system_instruction="""
             You are Solver B (Logician). Solve using step-by-step deduction.
             
@@ -36,12 +310,14 @@ class SolverSquad:
                - Use "^" for exponents.
             3. Keep the explanation clean and readable for a general audience.
             4. End your response with exactly: "FINAL ANSWER: [Number]"
-            """
+            """ + (STRUCTURED_RULES if structured else "")
         )
 
         # --- AGENT C: THE ADVERSARY (Updated: NO LaTeX) ---
-        self.agent_c = genai.GenerativeModel(
+        self.agent_c = models.create(
+            role="solver_c",
             model_name=MODEL_NAME,
+            priority="solver",
             system_instruction="""
             You are Solver C (The Adversary). 
             Your goal is to find edge cases where the problem fails.
@@ -50,20 +326,187 @@ class SolverSquad:
             FORMATTING RULES:
             1. No LaTeX formatting. Use plain text.
             2. End with "FINAL ANSWER: [Number]"
-            """
+            """ + (STRUCTURED_RULES if structured else "")
         )
 
-    def solve_with_code(self, problem):
+    def _generation_config(self, agent, batch=False):
+        """JSON mode + answer schema for B and C in structured mode (None = free text)."""
+        if not self.structured or agent == "a": return None
+        return {"response_mime_type": "application/json",
+                "response_schema": BATCH_ANSWER_SCHEMA if batch else ANSWER_SCHEMA}
+
+    def _ask(self, agent, model, problem):
+        # The transport timeout frees the pool thread shortly after the deadline fires
+        options = {"timeout": self.deadlines[agent]}
         try:
-            return self.agent_a.generate_content(f"Solve: {problem}").text.strip()
-        except: return "Error"
+            text = model.generate_content(f"Solve: {problem}", generation_config=self._generation_config(agent),
+                                          request_options=options).text.strip()
+        except Exception as e:
+            # Not a parsing problem: reported as its own category (MODEL_ERROR)
+            self._bump("model_errors", agent)
+            print(f"   ⚠️ Solver {agent.upper()} call failed: {e}")
+            return MODEL_ERROR
+        if agent == "a" and self.code_execution == "local": return self.run_code(text)
+        return text
 
-    def solve_with_logic(self, problem):
+    def run_code(self, text):
+        """Runs the code in Solver A's reply locally: its code + output, or "Error" if it didn't run."""
+        return self.sandbox.run_answer(text) or "Error"
+
+    def _model(self, agent):
+        return {"a": self.agent_a, "b": self.agent_b, "c": self.agent_c}[agent]
+
+    def ask_batch(self, agent, problems, timeout=None):
+        """One request with every problem. Returns per-problem answers (None = not matched)."""
+        options = {"timeout": timeout or self.deadlines[agent]}
         try:
-            return self.agent_b.generate_content(f"Solve: {problem}").text.strip()
-        except: return "Error"
-        
+            text = self._model(agent).generate_content(
+                batch_prompt(problems, self.structured and agent != "a"),
+                generation_config=self._generation_config(agent, batch=True), request_options=options
+            ).text
+        except Exception:
+            return [None] * len(problems)
+        if agent == "a" and self.code_execution == "local":
+            # Unrun sections are code, not answers; one that fails to run falls back to a single call
+            return [self.sandbox.run_answer(section) if section else None
+                    for section in parse_batch(text, len(problems), agent)]
+        return parse_batch(text, len(problems), agent, self.structured)
+
+    def solve_with_code(self, problem):
+        return self._ask("a", self.agent_a, problem)
+
+    def solve_with_logic(self, problem):
+        return self._ask("b", self.agent_b, problem)
+
     def solve_with_skeptic(self, problem):
-        try:
-            return self.agent_c.generate_content(f"Solve: {problem}").text.strip()
-        except: return "Error"
+        return self._ask("c", self.agent_c, problem)
+
+    def _bump(self, key, agent=None):
+        with self._stats_lock:
+            self.call_stats[key] += 1
+        if self.tracer and agent: self.tracer.count(f"solver_{key}", agent=agent)
+
+    def call(self, agent, problem):
+        """
+        One agent call on the shared pool, with a deadline and hedging.
+        If the call is slower than the learned latency percentile, a duplicate request is
+        fired and whichever answers first wins. Returns a Future of the answer text
+        (TIMEOUT if nothing answered before the agent's deadline).
+        """
+        fn = {"a": self.solve_with_code, "b": self.solve_with_logic, "c": self.solve_with_skeptic}[agent]
+        out = concurrent.futures.Future()
+        lock = threading.Lock()
+        attempts = []
+        sent = []
+        self._bump("calls", agent)
+
+        def finish(value):
+            with lock:
+                if out.done(): return False
+                out.set_result(value)
+            if self.tracer and sent:
+                # Whole logical call: first request sent -> answer (hedges and timeouts included)
+                self.tracer.observe("solver", time.monotonic() - sent[0], agent=agent)
+            # Only queued attempts can be cancelled; running ones end at their transport timeout
+            for f in attempts: f.cancel()
+            return True
+
+        def launch(hedge=False):
+            with lock:
+                if out.done(): return
+                f = self.executor.submit(run, hedge)
+                attempts.append(f)
+            if hedge: self._bump("hedged", agent)
+
+        def run(hedge):
+            # Clocks start when the request is actually sent, not while it waits for a pool thread
+            started = time.monotonic()
+            if not hedge:
+                sent.append(started)
+                arm_timers()
+            value = fn(problem)
+            on_done(value, started, hedge)
+            return value
+
+        def on_done(value, started, hedge):
+            with lock:
+                others_pending = sum(not a.done() for a in attempts) > 1
+            # An error only counts once no other attempt can still succeed
+            failed = value in ("Error", MODEL_ERROR)
+            if failed and others_pending: return
+            if not failed: self.latency[agent].record(time.monotonic() - started)
+            if finish(value) and hedge: self._bump("hedge_wins", agent)
+
+        def deadline():
+            if finish(TIMEOUT): self._bump("timeouts", agent)
+
+        def arm_timers():
+            if self.hedge_percentile is not None:
+                hedge_after = self.latency[agent].percentile(self.hedge_percentile)
+                if hedge_after is not None and hedge_after < self.deadlines[agent]:
+                    self._timers.call_later(hedge_after, lambda: launch(hedge=True))
+            self._timers.call_later(self.deadlines[agent], deadline)
+
+        launch()
+        return out
+
+    def call_batch(self, agent, problems):
+        """
+        One request to `agent` for all `problems`. Returns one Future per problem.
+        Problems whose answer can't be matched in the reply (or a failed request) fall back
+        to a single call(); a batch past its deadline answers TIMEOUT for every problem.
+        """
+        if len(problems) == 1: return [self.call(agent, problems[0])]
+        outs = [concurrent.futures.Future() for _ in problems]
+        lock = threading.Lock()
+        settled = []
+        deadline = self.deadlines[agent] * (1 + BATCH_DEADLINE_STEP * (len(problems) - 1))
+        with self._stats_lock:
+            self.call_stats["batches"] += 1
+            self.call_stats["batched_items"] += len(problems)
+
+        def settle(answers, started):
+            with lock:
+                if settled: return False
+                settled.append(True)
+            if self.tracer:
+                self.tracer.observe("solver_batch", time.monotonic() - started, agent=agent)
+            for out, problem, answer in zip(outs, problems, answers):
+                if answer is None:
+                    self._bump("batch_fallbacks", agent)
+                    _chain(self.call(agent, problem), out)
+                else:
+                    out.set_result(answer)
+            return True
+
+        def run():
+            started = time.monotonic()
+            def expire():
+                if settle([TIMEOUT] * len(problems), started): self._bump("timeouts", agent)
+            self._timers.call_later(deadline, expire)
+            settle(self.ask_batch(agent, problems, timeout=deadline), started)
+
+        self.executor.submit(run)
+        return outs
+
+    def submit(self, agent, problem):
+        """Like call(), but grouped with other in-flight problems when batch_size > 1."""
+        if self.batch_size <= 1: return self.call(agent, problem)
+        return self._batchers[agent].submit(problem)
+
+    # --- POOLED INTERFACE ---
+    def solve_all(self, problem):
+        """Runs all three agents on the shared pool. Returns a Future of (ans_a, ans_b, ans_c)."""
+        return gather([self.submit(agent, problem) for agent in "abc"])
+
+    def solve_many(self, problems):
+        """Starts solving every problem at once. Returns one solve_all Future per problem."""
+        return [self.solve_all(p) for p in problems]
+
+    def solve_batch(self, problems, agents="abc"):
+        """
+        Batched solve of several problems: one request per agent for all of them.
+        Returns one Future per problem, resolving to a tuple of answers in `agents` order.
+        """
+        per_agent = [self.call_batch(agent, list(problems)) for agent in agents]
+        return [gather([futures[i] for futures in per_agent]) for i in range(len(problems))]
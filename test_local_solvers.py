@@ -0,0 +1,40 @@
+from local_solvers import LocalSolverBank
+
+bank = LocalSolverBank()
+
+
+def solve(story, category):
+    sol = bank.solve(story, category)
+    return None if sol is None else round(sol.value, 4)
+
+
+def test_plain_rate_stories():
+    assert solve("Two trains start from stations 360 km apart and move towards each other at 60 km/h "
+                 "and 80 km/h. After how many hours will they meet?", "Time, Speed & Distance") == 2.5714
+    assert solve("A can complete a work in 10 days and B can complete it in 15 days. "
+                 "How many days will they take working together?", "Work & Time") == 6.0
+    assert solve("Pipe A fills a tank in 6 hours and pipe B fills it in 12 hours. "
+                 "If both are opened together, how long will it take to fill the tank?", "Pipes & Cisterns") == 4.0
+    assert solve("A can complete a job in 12 days and B can complete it in 18 days. They work together "
+                 "for 3 days and then A leaves. How many more days will B take to finish the job?", "Work & Time") == 10.5
+
+
+def test_other_questions_are_left_to_the_solvers():
+    # A distance, not a time
+    assert solve("Two trains start from stations 360 km apart and move towards each other at 60 km/h "
+                 "and 80 km/h. How far from the first station will they meet?", "Time, Speed & Distance") is None
+    # A clock time
+    assert solve("Two trains 360 km apart leave at 9 am towards each other at 60 km/h and 80 km/h. "
+                 "At what time do they meet?", "Time, Speed & Distance") is None
+    # A fraction of the tank
+    assert solve("Pipe A fills a tank in 6 hours and pipe B fills it in 12 hours. If both are opened "
+                 "together, what fraction of the tank is filled in 2 hours?", "Pipes & Cisterns") is None
+
+
+def test_modifiers_are_left_to_the_solvers():
+    # 7.5 days: B's rate is halved
+    assert solve("A can complete a work in 10 days and B can complete it in 15 days. B works at half "
+                 "efficiency. Working together, how many days will they take?", "Work & Time") is None
+    # 4.5 days: only 3/4 of the work
+    assert solve("A can complete a work in 10 days and B can complete it in 15 days. How many days will "
+                 "they take together to finish 3/4 of the work?", "Work & Time") is None
@@ -0,0 +1,50 @@
+from sandbox import SandboxPool, extract_code, stored_code, format_answer
+from validator import StrictValidator
+
+# Solver A answers as they are stored, one per execution mode
+LOCAL = format_answer("s = 120 / 2\nprint('EQUATION: s = d / t')\nprint(s)", "EQUATION: s = d / t\n60.0")
+GEMINI_REMOTE = (
+    "```python\nd = 120\nt = 2\ns = d / t\nprint('EQUATION: s = d / t')\n"
+    "print('{\"final_answer\": %s, \"unit\": \"km/h\", \"equation\": \"s = d / t\"}' % s)\n```\n"
+    "```\nEQUATION: s = d / t\n{\"final_answer\": 60.0, \"unit\": \"km/h\", \"equation\": \"s = d / t\"}\n```"
+)
+BENCHMARK_REMOTE = 'print(final_answer)\n{"final_answer": 60, "unit": "", "equation": "x = answer"}'
+
+
+def test_extract_code_ignores_output_blocks():
+    assert extract_code(GEMINI_REMOTE).endswith("% s)")
+    assert "EQUATION: s = d / t\n{" not in extract_code(GEMINI_REMOTE)
+    assert extract_code("x = 2\nprint(x)") == "x = 2\nprint(x)"
+
+
+def test_only_local_answers_are_rerun():
+    assert stored_code(LOCAL).startswith("s = 120 / 2")
+    assert stored_code(GEMINI_REMOTE) is None
+    assert stored_code(BENCHMARK_REMOTE) is None
+    assert stored_code("Error") is None
+
+
+def test_rerun_reproduces_local_answer():
+    pool = SandboxPool(size=1)
+    try:
+        assert pool.run_answer(LOCAL, stored=True) == LOCAL
+        assert pool.run_answer(GEMINI_REMOTE, stored=True) is None
+    finally:
+        pool.close()
+
+
+def test_every_stored_format_still_judges():
+    judge = StrictValidator()
+    for ans_a in (LOCAL, GEMINI_REMOTE, BENCHMARK_REMOTE):
+        assert judge.validate("60", ans_a, "FINAL ANSWER: 60", "FINAL ANSWER: 60")[1] == "SUCCESS"
+
+
+def test_limits():
+    pool = SandboxPool(size=1, cpu_seconds=1, timeout=3)
+    try:
+        assert pool.run("print(2 + 3)").stdout == "5\n"
+        assert "network" in pool.run("import socket; socket.socket()").error
+        assert not pool.run("while True: pass").ok
+        assert "timed out" in pool.run("import time; time.sleep(10)").error
+    finally:
+        pool.close()
@@ -0,0 +1,44 @@
+from validator import StrictValidator, TIMEOUT, MODEL_ERROR
+
+FA = "FINAL ANSWER: {}".format
+
+# (generator, solver A, solver B, solver C) -> validate()'s category
+ROWS = [
+    ("60", FA(60), FA(60), FA(60)),                                    # SUCCESS
+    ("60", TIMEOUT, FA(60), FA(60)),                                   # TIMEOUT
+    ("60", FA(60), MODEL_ERROR, TIMEOUT),                              # TIMEOUT wins over MODEL_ERROR
+    ("60", FA(60), FA(60), MODEL_ERROR),                               # MODEL_ERROR
+    ("60", "Error", FA(60), FA(60)),                                   # unparsed solver
+    ("no number here", FA(60), FA(60), FA(60)),                        # unparsed generator
+    (None, FA(60), FA(60), FA(60)),                                    # missing generator answer
+    (60, '{"final_answer": 60, "unit": "km/h"}', FA("60.0"), FA(60)),   # JSON number + structured
+    ("60", FA(50), FA(50), FA(50)),                                    # HALLUCINATION
+    ("60", FA(60), FA(61), FA(60)),                                    # CONSENSUS_FAILURE
+    # Tolerance boundary (|x - y| < 0.1)
+    ("10", FA(10.05), FA(10.05), FA(10.05)),
+    ("10", FA(10.1), FA(10.1), FA(10.1)),
+    ("10", FA(10.2), FA(10.2), FA(10.2)),
+    ("10", FA(10), FA(10.09), FA(10.18)),
+    ("5000", FA(5040), FA(5040), FA(5040)),
+]
+
+
+def assert_parity(judge, rows):
+    batch = judge.validate_batch(*zip(*rows))
+    for i, row in enumerate(rows):
+        is_valid, category, _ = judge.validate(*row)
+        assert (batch["category"][i], bool(batch["is_valid"][i])) == (category, is_valid), row
+
+
+def test_batch_matches_validate():
+    assert_parity(StrictValidator(), ROWS)
+
+
+def test_batch_matches_validate_with_relative_tolerance():
+    assert_parity(StrictValidator(rel_tol=0.01), ROWS)
+
+
+def test_batch_counts():
+    counts = StrictValidator().validate_batch(*zip(*ROWS))["counts"]
+    assert sum(counts.values()) == len(ROWS)
+    assert counts["TIMEOUT"] == 2 and counts["MODEL_ERROR"] == 1 and counts["PARSING_ERROR"] == 3
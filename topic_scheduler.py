@@ -0,0 +1,126 @@
+import random
+import threading
+import collections
+
+# --- ADAPTIVE TOPIC SCHEDULER ---
+# Thompson-sampling bandit over topics. Each topic's acceptance rate has a
+# Beta(accepted + 1, rejected + 1) posterior; a pick samples every posterior and
+# divides by the topic's mean model calls per attempt, so budget drifts toward
+# topics that yield the most accepted questions per call. Every topic still gets
+# at least `min_share` of the picks (so a topic can recover from a bad start),
+# and difficulties are requested to track `difficulty_targets` among accepted questions.
+
+DEFAULT_DIFFICULTY_TARGETS = {"Easy": 0.3, "Medium": 0.5, "Hard": 0.2}
+
+
+class TopicStats:
+    def __init__(self):
+        self.picks = 0
+        self.attempts = 0
+        self.accepted = 0
+        self.calls = 0.0
+        self.seconds = 0.0
+        self.failures = collections.Counter()
+
+    @property
+    def rejected(self):
+        return self.attempts - self.accepted
+
+
+class TopicScheduler:
+    def __init__(self, topics=(), min_share=0.05, difficulty_targets=DEFAULT_DIFFICULTY_TARGETS,
+                 prior_calls=5.0, seed=None):
+        self.min_share = min_share
+        self.difficulty_targets = dict(difficulty_targets or {})   # None/{}: no difficulty targeting
+        self.prior_calls = prior_calls     # assumed calls/attempt before a topic has history
+        self.rng = random.Random(seed)
+        self.topics = []
+        self.stats = {}
+        self.difficulty_accepted = collections.Counter()
+        self._lock = threading.Lock()
+        self.set_topics(topics)
+
+    def set_topics(self, topics):
+        """New research results: keeps the history of topics that are still offered."""
+        with self._lock:
+            self.topics = list(dict.fromkeys(topics))
+            for topic in self.topics:
+                self.stats.setdefault(topic, TopicStats())
+
+    # --- PICKING ---
+    def _score(self, stats):
+        p = self.rng.betavariate(stats.accepted + 1, stats.rejected + 1)
+        calls = (stats.calls + self.prior_calls) / (stats.attempts + 1)
+        return p / calls
+
+    def pick(self):
+        with self._lock:
+            if not self.topics: return None
+            total = sum(self.stats[t].picks for t in self.topics)
+            # Minimum quota first: the most under-served topic below its floor
+            floor = min(self.min_share, 1.0 / len(self.topics)) * total
+            starved = [t for t in self.topics if self.stats[t].picks < floor]
+            if starved:
+                topic = min(starved, key=lambda t: self.stats[t].picks)
+            else:
+                topic = max(self.topics, key=lambda t: self._score(self.stats[t]))
+            self.stats[topic].picks += 1
+            return topic
+
+    def pick_difficulty(self):
+        """The difficulty furthest below its target share of accepted questions."""
+        with self._lock:
+            if not self.difficulty_targets: return None
+            total = sum(self.difficulty_accepted.values()) + 1
+            return max(self.difficulty_targets,
+                       key=lambda d: self.difficulty_targets[d] * total - self.difficulty_accepted[d])
+
+    # --- FEEDBACK ---
+    def record(self, topic, accepted, calls=0, seconds=0.0, difficulty=None, failure_type=None):
+        with self._lock:
+            stats = self.stats.setdefault(topic, TopicStats())
+            stats.attempts += 1
+            stats.calls += calls
+            stats.seconds += seconds
+            if accepted:
+                stats.accepted += 1
+                if difficulty: self.difficulty_accepted[difficulty] += 1
+            elif failure_type:
+                stats.failures[failure_type] += 1
+
+    # --- REPORTING ---
+    def yield_table(self):
+        """One row per topic, best accepted-per-call first."""
+        with self._lock:
+            total_picks = sum(s.picks for s in self.stats.values()) or 1
+            rows = []
+            for topic, s in self.stats.items():
+                rows.append({
+                    "topic": topic,
+                    "share": round(s.picks / total_picks, 3),
+                    "attempts": s.attempts,
+                    "accepted": s.accepted,
+                    "accept_rate": round(s.accepted / s.attempts, 3) if s.attempts else None,
+                    "accepted_per_call": round(s.accepted / s.calls, 3) if s.calls else None,
+                    "mean_latency_s": round(s.seconds / s.attempts, 2) if s.attempts else None,
+                    "top_failure": s.failures.most_common(1)[0][0] if s.failures else None,
+                })
+        return sorted(rows, key=lambda r: r["accepted_per_call"] or 0, reverse=True)
+
+    def export_state(self):
+        with self._lock:
+            return {
+                "topics": {t: {"picks": s.picks, "attempts": s.attempts, "accepted": s.accepted,
+                               "calls": s.calls, "seconds": s.seconds, "failures": dict(s.failures)}
+                           for t, s in self.stats.items()},
+                "difficulty_accepted": dict(self.difficulty_accepted),
+            }
+
+    def load_state(self, state):
+        with self._lock:
+            for topic, saved in state.get("topics", {}).items():
+                stats = self.stats.setdefault(topic, TopicStats())
+                stats.picks, stats.attempts, stats.accepted = saved["picks"], saved["attempts"], saved["accepted"]
+                stats.calls, stats.seconds = saved["calls"], saved["seconds"]
+                stats.failures = collections.Counter(saved.get("failures", {}))
+            self.difficulty_accepted.update(state.get("difficulty_accepted", {}))
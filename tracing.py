@@ -0,0 +1,154 @@
+import json
+import time
+import threading
+import contextlib
+import collections
+
+# --- TRACING & LATENCY HISTOGRAMS ---
+# Spans are timed blocks ("stage", "model", "solver", ...) with a few labels.
+# Every span lands in a fixed-bucket histogram (constant memory however long the
+# run), and can optionally be appended to a JSONL trace file with its attributes.
+
+# Upper bounds in seconds (Prometheus-style, cumulative "le" buckets on export)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, pct):
+        """Estimate from the buckets (linear inside the bucket that holds the rank)."""
+        if not self.count: return None
+        rank = self.count * pct / 100
+        seen, lower = 0, 0.0
+        for bound, n in zip(self.buckets, self.counts):
+            if n and seen + n >= rank:
+                if bound == float("inf"): return lower
+                return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return lower
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class Tracer:
+    def __init__(self, trace_path=None):
+        self.trace_path = trace_path
+        self.histograms = {}                       # (name, labels) -> Histogram
+        self.counters = collections.defaultdict(float)   # (name, labels) -> value
+        self._lock = threading.Lock()
+        self._trace_file = open(trace_path, "a", encoding="utf-8") if trace_path else None
+
+    # --- RECORDING ---
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        with self._lock:
+            self.counters[(name, _label_key(labels))] += value
+
+    @contextlib.contextmanager
+    def span(self, name, **labels):
+        """Times the block. Yields a dict; anything put in it is written to the JSONL trace."""
+        attrs = {}
+        start_wall, start = time.time(), time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(name, duration, **labels)
+            if error: self.count("errors", span=name, **labels)
+            if self._trace_file:
+                record = {"span": name, **labels, "start": round(start_wall, 3),
+                          "duration_ms": round(duration * 1000, 2), **attrs}
+                if error: record["error"] = error
+                line = json.dumps(record, default=str)
+                with self._lock:
+                    self._trace_file.write(line + "\n")
+                    self._trace_file.flush()
+
+    # --- READING ---
+    def summary(self, name=None):
+        """One row per (span, labels): count, mean and p50/p95/p99 in milliseconds."""
+        with self._lock:
+            items = [(k, h) for k, h in self.histograms.items() if name is None or k[0] == name]
+            rows = []
+            for (span, labels), hist in sorted(items):
+                row = {"span": span, **dict(labels), "count": hist.count,
+                       "mean_ms": round(hist.sum / hist.count * 1000, 1) if hist.count else None}
+                for p in (50, 95, 99):
+                    value = hist.percentile(p)
+                    row[f"p{p}_ms"] = round(value * 1000, 1) if value is not None else None
+                rows.append(row)
+        return rows
+
+    def counter_values(self):
+        with self._lock:
+            return {(name, labels): value for (name, labels), value in self.counters.items()}
+
+    def to_prometheus(self, prefix="quant", gauges=None):
+        """Prometheus text exposition: histograms, counters, and optional extra gauges {name: {labels: value}}."""
+        def fmt(labels):
+            if not labels: return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            hists = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        for name in sorted({k[0] for k, _ in hists}):
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (span, labels), hist in hists:
+                if span != name: continue
+                cumulative = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{metric}_bucket{fmt(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{metric}_sum{fmt(labels)} {hist.sum}")
+                lines.append(f"{metric}_count{fmt(labels)} {hist.count}")
+
+        for name in sorted({k[0] for k, _ in counters}):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter, labels), value in counters:
+                if counter == name: lines.append(f"{metric}{fmt(labels)} {value:g}")
+
+        for name, series in sorted((gauges or {}).items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in sorted(series.items()):
+                if isinstance(value, (int, float)):
+                    lines.append(f"{metric}{fmt(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        if self._trace_file:
+            self._trace_file.close()
+            self._trace_file = None
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import threading
+import collections
+import requests
+from requests.adapters import HTTPAdapter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- BACKGROUND FORM UPLOADER ---
+# submit() writes the payload to an on-disk spool (one file per question) and
+# returns immediately. A background thread sends spooled payloads in batches
+# over one pooled HTTP session and deletes each file only after the endpoint
+# accepted it. A batch that still fails after its retries is parked (left in the
+# spool) and re-tried, ahead of newer uploads and in submission order, every
+# `park_interval` seconds (also while idle), once more on flush(), and on the next start.
+# A POST that times out after it was sent may well have been accepted, and the
+# Apps Script endpoint can't de-duplicate, so it is recorded as delivered
+# ("ambiguous") instead of retried: a missing row beats a duplicate question.
+
+class FormUploader:
+    def __init__(self, url, spool_dir=".upload_spool", batch_size=10, flush_interval=2.0,
+                 max_retries=4, backoff=1.0, timeout=15, batch_as_array=False, park_interval=60,
+                 tracer=None):
+        self.url = url
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Apps Script takes one question per POST; set this if the endpoint accepts a JSON list
+        self.batch_as_array = batch_as_array
+        self.park_interval = park_interval
+        self.tracer = tracer
+        self._parked = []
+        self._parked_at = 0.0
+        self._retry_parked = threading.Event()   # set by flush(): retry parked items now
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        self.queue = queue.Queue()
+        self.latencies = collections.deque(maxlen=500)
+        self.stats = {"submitted": 0, "uploaded": 0, "retries": 0, "failed_batches": 0, "ambiguous": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        os.makedirs(spool_dir, exist_ok=True)
+        recovered = self._recover()
+        if recovered:
+            print(f"   📬 Re-queued {recovered} spooled uploads from a previous run.")
+        self._thread = threading.Thread(target=self._run, name="form-uploader", daemon=True)
+        self._thread.start()
+
+    # --- SPOOL ---
+    def _spool(self, payload):
+        name = f"{time.time():.6f}-{uuid.uuid4().hex}.json"
+        path = os.path.join(self.spool_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return path
+
+    def _recover(self):
+        names = sorted(n for n in os.listdir(self.spool_dir) if n.endswith(".json"))
+        for name in names:
+            self.queue.put(os.path.join(self.spool_dir, name))
+        return len(names)
+
+    # --- PUBLIC API ---
+    def submit(self, payload):
+        """Durably queues one form payload; never blocks on the network."""
+        path = self._spool(payload)
+        with self._lock:
+            self.stats["submitted"] += 1
+        self.queue.put(path)
+
+    def backlog(self):
+        return self.queue.qsize()
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            lat = sorted(self.latencies)
+        out["backlog"] = self.backlog()
+        out["parked"] = len(self._parked)
+        out["spooled"] = len([n for n in os.listdir(self.spool_dir) if n.endswith(".json")])
+        if lat:
+            out["latency_p50_ms"] = round(lat[len(lat) // 2] * 1000, 1)
+            out["latency_p95_ms"] = round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 1)
+        return out
+
+    def flush(self, timeout=30):
+        """
+        Waits (up to `timeout` s) until everything submitted so far has been tried. True only
+        if it was all delivered; False while anything is still queued or parked in the spool.
+        """
+        deadline = time.monotonic() + timeout
+        if self._parked: self._retry_parked.set()
+        while ((self.queue.unfinished_tasks or self._retry_parked.is_set())
+               and time.monotonic() < deadline):
+            time.sleep(0.05)
+        return self.queue.unfinished_tasks == 0 and not self._parked
+
+    def close(self, timeout=30):
+        if not self.flush(timeout):
+            print(f"   📮 {self.backlog() + len(self._parked)} uploads not delivered (kept in spool for the next start).")
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval + 1)
+        self.session.close()
+
+    # --- WORKER ---
+    def _due_parked(self):
+        """Takes the parked paths if their retry is due, oldest submission first."""
+        if not self._parked: return []
+        if not self._retry_parked.is_set() and time.monotonic() - self._parked_at <= self.park_interval:
+            return []
+        parked, self._parked = self._parked, []
+        return sorted(parked, key=os.path.basename)   # spool names start with the submit time
+
+    def _next_batch(self):
+        """
+        Returns (retried, fresh): due parked paths and newly queued ones. Both are empty
+        after an idle `flush_interval`, so parked retries don't wait for the next submit().
+        """
+        retried = self._due_parked()
+        fresh = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(retried) + len(fresh) < self.batch_size:
+            wait = deadline - time.monotonic()
+            if wait <= 0: break
+            try:
+                fresh.append(self.queue.get(timeout=wait))
+            except queue.Empty:
+                break
+        return retried, fresh
+
+    def _post(self, payload):
+        started = time.monotonic()
+        resp = self.session.post(self.url, json=payload, timeout=self.timeout)
+        resp.raise_for_status()
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.latencies.append(elapsed)
+        if self.tracer: self.tracer.observe("upload", elapsed)
+
+    def _post_once(self, payload):
+        """Posts without ever sending the same payload twice: a read timeout counts as delivered."""
+        try:
+            self._post(payload)
+        except requests.exceptions.ReadTimeout as e:
+            # Sent but unanswered: the endpoint may have recorded it, so don't send it again
+            print(f"   ⚠️ Upload timed out after sending; counted as delivered, not retried: {e}")
+            with self._lock:
+                self.stats["ambiguous"] += 1
+            if self.tracer: self.tracer.count("upload_ambiguous")
+
+    def _send(self, paths):
+        """Sends the batch with bounded retries. Returns the paths that were delivered."""
+        payloads = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                payloads.append(json.load(f))
+
+        delivered = []
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.batch_as_array:
+                    self._post_once(payloads)
+                    return paths
+                while len(delivered) < len(paths):
+                    self._post_once(payloads[len(delivered)])
+                    delivered.append(paths[len(delivered)])
+                return delivered
+            except (requests.RequestException, OSError) as e:
+                if attempt == self.max_retries:
+                    print(f"   ⚠️ Upload failed after {attempt + 1} attempts (kept in spool): {e}")
+                    return delivered
+                with self._lock:
+                    self.stats["retries"] += 1
+                if self.tracer: self.tracer.count("upload_retries")
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+        return delivered
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            retrying = self._retry_parked.is_set()
+            if retrying and not self._parked:
+                self._retry_parked.clear()   # already retried (or delivered) since flush() asked
+                retrying = False
+            retried, fresh = self._next_batch()
+            batch = retried + fresh
+            if not batch: continue
+            try:
+                delivered = self._send(batch)
+            except (OSError, ValueError) as e:
+                print(f"   ⚠️ Unreadable spool entry skipped: {e}")
+                delivered = []
+            for path in delivered:
+                try: os.remove(path)
+                except OSError: pass
+            undelivered = [p for p in batch if p not in delivered and os.path.exists(p)]
+            if undelivered:
+                self._parked.extend(undelivered)
+                self._parked_at = time.monotonic()
+            with self._lock:
+                self.stats["uploaded"] += len(delivered)
+                if len(delivered) < len(batch): self.stats["failed_batches"] += 1
+            for _ in fresh: self.queue.task_done()
+            if retrying and retried: self._retry_parked.clear()   # flush()'s retry is done
+
+
+# --- LOCAL STUB ENDPOINT (tests / benchmarks) ---
+class StubFormEndpoint:
+    """
+    Tiny local stand-in for the Apps Script web app. Records every JSON body it receives.
+    `fail_first` requests get HTTP 503, and `delay` seconds are added to each response.
+    """
+    def __init__(self, fail_first=0, delay=0.0, port=0):
+        self.received = []
+        self.fail_first = fail_first
+        self.delay = delay
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests += 1
+                if stub.delay: time.sleep(stub.delay)
+                if stub.requests <= stub.fail_first:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                data = json.loads(body or b"null")
+                stub.received.extend(data if isinstance(data, list) else [data])
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b'{"result":"success"}')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/exec"
+        threading.Thread(target=self.server.serve_forever, name="stub-form", daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,37 +1,132 @@
 import re
+import json
+
+TIMEOUT = "TIMEOUT"  # what SolverSquad answers when an agent misses its deadline
+MODEL_ERROR = "MODEL_ERROR"  # ...and when the model call itself failed (quota, transport, safety block)
+
+NUMBER_RE = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+CATEGORIES = ["SUCCESS", "TIMEOUT", "MODEL_ERROR", "PARSING_ERROR", "HALLUCINATION", "CONSENSUS_FAILURE"]
+
+# --- STRUCTURED SOLVER OUTPUT ---
+# Solvers in structured mode answer {"working", "final_answer", "unit", "equation"} as JSON
+# (Solver A prints it as the last line of its code output). When such an object is
+# present its final_answer is the answer, and nothing in the working text is ever parsed.
+STRUCTURED_RE = re.compile(r'\{[^{}]*"final_answer"[^{}]*\}')
+FINAL_ANSWER_RE = re.compile(r"FINAL ANSWER", re.I)
+
+def parse_structured(text):
+    """The solver's answer object, or None if the text isn't structured output."""
+    if text is None: return None
+    text = str(text)   # stored answers can be JSON numbers
+    if '"final_answer"' not in text: return None
+    body = text.strip()
+    if body.startswith("```"):
+        body = body.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(body)
+    except ValueError:
+        # Code output / prose around it: the last flat object with a final_answer field
+        matches = STRUCTURED_RE.findall(body)
+        if not matches: return None
+        try:
+            data = json.loads(matches[-1])
+        except ValueError:
+            return None
+    return data if isinstance(data, dict) and "final_answer" in data else None
+
+def structured_number(data):
+    """final_answer as a float ("1,200", "12.5 km" and 12.5 all work), or None."""
+    value = data.get("final_answer")
+    if isinstance(value, bool): return None
+    if isinstance(value, (int, float)): return float(value)
+    match = NUMBER_RE.search(str(value or "").replace(",", ""))
+    return float(match.group(0)) if match else None
+
+def structured_text(text):
+    """Readable version of a structured answer (the working, then the answer line); other text unchanged."""
+    data = parse_structured(text)
+    if data is None: return text
+    answer = f"FINAL ANSWER: {data.get('final_answer')} {data.get('unit') or ''}".strip()
+    return f"{data.get('working') or ''}\n\n{answer}".strip()
 
 class StrictValidator:
+    def __init__(self, abs_tol=0.1, rel_tol=0.0):
+        # Two answers agree when |x - y| < max(abs_tol, rel_tol * max(|x|, |y|)).
+        # rel_tol suits mixed scales (24.32 L vs. 5000-rupee prices); the default is the old fixed 0.1.
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+
     def extract_number(self, text):
         if not text: return None
-        matches = re.findall(r"[-+]?\d*\.\d+|\d+", str(text))
+        matches = NUMBER_RE.findall(str(text))
         if not matches: return None
         values = [float(x) for x in matches]
         if len(values) > 1 and 1.0 in values: values.remove(1.0)
         return values[-1]
 
+    def extract_answer(self, text):
+        """
+        A solver's answer: the structured final_answer if there is one, else the first number
+        after the last "FINAL ANSWER", else extract_number's last-number heuristic.
+        """
+        if text is None: return None
+        text = str(text)   # e.g. correct_answer_numeric stored as a JSON number
+        data = parse_structured(text)
+        if data is not None: return structured_number(data)
+        if not text: return None
+        parts = FINAL_ANSWER_RE.split(text)
+        if len(parts) > 1:
+            match = NUMBER_RE.search(parts[-1].replace(",", ""))
+            if match: return float(match.group(0))
+        return self.extract_number(text)
+
+    def close(self, x, y):
+        return abs(x - y) < max(self.abs_tol, self.rel_tol * max(abs(x), abs(y)))
+
+    def agrees(self, ans_x, ans_y):
+        """True when both texts parse to numbers within tolerance."""
+        x, y = self.extract_answer(ans_x), self.extract_answer(ans_y)
+        return x is not None and y is not None and self.close(x, y)
+
+    def consensus(self, sol_a, sol_b, sol_c):
+        """The solvers' shared answer (median of the three) when they agree as validate() requires, else None."""
+        nums = [self.extract_answer(s) for s in (sol_a, sol_b, sol_c)]
+        if None in nums: return None
+        if not (self.close(nums[0], nums[1]) and self.close(nums[1], nums[2])): return None
+        return sorted(nums)[1]
+
     def validate(self, gen_ans, sol_a, sol_b, sol_c):
         """
         Returns: (IsValid (bool), ErrorCategory (str), Log (str))
-        Categories: 'SUCCESS', 'PARSING_ERROR', 'HALLUCINATION', 'CONSENSUS_FAILURE'
+        Categories: 'SUCCESS', 'TIMEOUT', 'MODEL_ERROR', 'PARSING_ERROR', 'HALLUCINATION', 'CONSENSUS_FAILURE'
         """
-        n_gen = self.extract_number(gen_ans)
-        n_a = self.extract_number(sol_a)
-        n_b = self.extract_number(sol_b)
-        n_c = self.extract_number(sol_c)
+        n_gen = self.extract_answer(gen_ans)
+        n_a = self.extract_answer(sol_a)
+        n_b = self.extract_answer(sol_b)
+        n_c = self.extract_answer(sol_c)
 
         log = (f"\n      📊 COMPARISON: Gen[{n_gen}] | Code[{n_a}] | Logic[{n_b}] | Skeptic[{n_c}]")
 
+        # 0. Deadline Check (a stuck solver is not a parsing problem)
+        late = [name for name, ans in zip("ABC", [sol_a, sol_b, sol_c]) if ans == TIMEOUT]
+        if late:
+            return False, "TIMEOUT", log + f" -> ⏱️ Fail: Solver {'/'.join(late)} timed out"
+        # ...nor is a failed model call (quota, transport, safety block)
+        failed = [name for name, ans in zip("ABC", [sol_a, sol_b, sol_c]) if ans == MODEL_ERROR]
+        if failed:
+            return False, "MODEL_ERROR", log + f" -> ⚠️ Fail: Solver {'/'.join(failed)} call failed"
+
         # 1. Parsing Check
         if None in [n_gen, n_a, n_b, n_c]:
             return False, "PARSING_ERROR", log + " -> ❌ Fail: Parsing Error"
 
         # 2. Consensus Check
-        tol = 0.1
         # Check if Solvers agree with EACH OTHER
-        solvers_agree = abs(n_a - n_b) < tol and abs(n_b - n_c) < tol
+        solvers_agree = self.close(n_a, n_b) and self.close(n_b, n_c)
         
         # Check if Solvers agree with GENERATOR
-        all_agree = solvers_agree and abs(n_gen - n_a) < tol
+        all_agree = solvers_agree and self.close(n_gen, n_a)
 
         if all_agree:
             return True, "SUCCESS", log + " -> ✅ Unanimous"
@@ -41,3 +136,84 @@ class StrictValidator:
         else:
             # Solvers disagree with each other -> Math is ambiguous
             return False, "CONSENSUS_FAILURE", log + " -> ❌ Fail: Solvers Disagree"
+
+    def validate_partial(self, gen_ans, answers, eager=False):
+        """
+        Verdict from the solvers run so far ({"a": text, ...}; missing agents not run yet),
+        or None while more solvers could still change it. Used by the validation cascade.
+        Decided early: any timeout, any unparsed answer, Logic/Skeptic or Code/Logic disagreeing
+        (the pairs validate() requires), or two such agreeing solvers against the generator.
+        eager=True also rejects as soon as a single solver contradicts the generator.
+        """
+        seen = {k: v for k, v in answers.items() if v is not None}
+        if len(seen) == 3:
+            return self.validate(gen_ans, seen["a"], seen["b"], seen["c"])
+
+        nums = {k: self.extract_answer(v) for k, v in seen.items()}
+        n_gen = self.extract_answer(gen_ans)
+        shown = " | ".join(f"{name}[{nums.get(k, '-')}]" for k, name in
+                           (("a", "Code"), ("b", "Logic"), ("c", "Skeptic")))
+        log = f"\n      📊 COMPARISON: Gen[{n_gen}] | {shown}"
+
+        late = [k.upper() for k, v in sorted(seen.items()) if v == TIMEOUT]
+        if late:
+            return False, "TIMEOUT", log + f" -> ⏱️ Fail: Solver {'/'.join(late)} timed out"
+        failed = [k.upper() for k, v in sorted(seen.items()) if v == MODEL_ERROR]
+        if failed:
+            return False, "MODEL_ERROR", log + f" -> ⚠️ Fail: Solver {'/'.join(failed)} call failed"
+        if n_gen is None or None in nums.values():
+            return False, "PARSING_ERROR", log + " -> ❌ Fail: Parsing Error"
+
+        # validate() needs A~B and B~C, so either pair disagreeing already decides it
+        for x, y in (("b", "c"), ("a", "b")):
+            if x in nums and y in nums and not self.close(nums[x], nums[y]):
+                return False, "CONSENSUS_FAILURE", log + " -> ❌ Fail: Solvers Disagree (early)"
+            if x in nums and y in nums and not self.close(n_gen, nums[y]):
+                return False, "HALLUCINATION", log + " -> ❌ Fail: Generator Hallucination (2 solvers)"
+
+        if eager and any(not self.close(n_gen, n) for n in nums.values()):
+            return False, "HALLUCINATION", log + " -> ❌ Fail: Generator contradicted (1 solver)"
+        return None
+
+    def validate_batch(self, gen_answers, sols_a, sols_b, sols_c):
+        """
+        Column version of validate() for re-scoring archives: four equal-length sequences in,
+        the same decision as validate() for every row out (minus the per-row log text).
+        Returns {"is_valid": bool[n], "category": str[n], "numbers": float[n, 4] (NaN = unparsed),
+                 "counts": {category: n}}.
+        """
+        import numpy as np
+
+        columns = [list(gen_answers), list(sols_a), list(sols_b), list(sols_c)]
+        n = len(columns[0])
+        if any(len(col) != n for col in columns):
+            raise ValueError("validate_batch: all columns must have the same length")
+
+        # Parsing stays per-string (regex), everything after it is array math
+        numbers = np.full((n, 4), np.nan)
+        parsed = {}   # archives repeat a lot of identical answers ("Error", "42", ...)
+        for j, col in enumerate(columns):
+            for i, text in enumerate(col):
+                key = text if isinstance(text, str) or text is None else str(text)
+                if key not in parsed: parsed[key] = self.extract_answer(key)
+                if parsed[key] is not None: numbers[i, j] = parsed[key]
+        gen, a, b, c = numbers.T
+
+        def close(x, y):
+            tol = np.maximum(self.abs_tol, self.rel_tol * np.maximum(np.abs(x), np.abs(y)))
+            return np.abs(x - y) < tol
+
+        timed_out = np.array([any(col[i] == TIMEOUT for col in columns[1:]) for i in range(n)], dtype=bool)
+        failed = np.array([any(col[i] == MODEL_ERROR for col in columns[1:]) for i in range(n)], dtype=bool)
+        unparsed = np.isnan(numbers).any(axis=1)
+        solvers_agree = close(a, b) & close(b, c)
+        all_agree = solvers_agree & close(gen, a)
+
+        # Same precedence as validate(): timeout, model error, parsing, unanimous, hallucination, disagreement
+        category = np.select(
+            [timed_out, failed, unparsed, all_agree, solvers_agree],
+            ["TIMEOUT", "MODEL_ERROR", "PARSING_ERROR", "SUCCESS", "HALLUCINATION"],
+            default="CONSENSUS_FAILURE",
+        ).astype("<U17")
+        counts = {cat: int((category == cat).sum()) for cat in CATEGORIES}
+        return {"is_valid": category == "SUCCESS", "category": category, "numbers": numbers, "counts": counts}
@@ -0,0 +1,171 @@
+import os
+import json
+import queue
+import threading
+import collections
+from researcher import read_source_bytes
+from pipeline import DISCARDED
+
+# --- BACKGROUND GENERATION WORKER (for the Streamlit UI) ---
+# Research + run_pipeline run on one background thread, so a script run never
+# blocks on the model. Every result is appended to a JSONL file (the session's
+# storage) and published on a thread-safe queue; the UI polls with poll(),
+# keeps a bounded window of recent results, and pages older ones from the file.
+
+class GenerationWorker:
+    def __init__(self, orch, results_path, recent_size=10):
+        self.orch = orch
+        self.results_path = results_path
+        self.events = queue.Queue()
+        self.recent = collections.deque(maxlen=recent_size)   # latest results, newest last
+        self.status = "idle"   # idle / researching / running / paused / stopping / done / stopped / error
+        self.error = None
+        self.target = 0
+        self.started_with = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.research_progress = None   # (sections done, total) while researching a document
+
+        self._offsets = []     # byte offset of every accepted record in results_path
+        self._lock = threading.Lock()
+        self._stop_requested = False
+        self._thread = None
+
+        os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+        self._load_offsets()
+
+    def _load_offsets(self):
+        """Indexes accepted records already in the file (e.g. after a page reload)."""
+        if not os.path.exists(self.results_path): return
+        with open(self.results_path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if record is not None:
+                    if "failure_type" in record:
+                        self.rejected += 1
+                    else:
+                        self._offsets.append(offset)
+                        self.accepted += 1
+                offset += len(line)
+
+    # --- CONTROL ---
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, target, custom_file=None, workers=None):
+        """Starts generating `target` more accepted questions. False if a run is already active."""
+        if self.active: return False
+        # Read the upload now: Streamlit's UploadedFile belongs to the script run that created it
+        source = read_source_bytes(custom_file) if custom_file is not None else None
+        self.target = target
+        self.started_with = self.accepted
+        self.error = None
+        self._stop_requested = False
+        self._thread = threading.Thread(
+            target=self._run, args=(target, source, workers), name="generation-worker", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    @property
+    def progress(self):
+        """Fraction of the current run's target accepted so far."""
+        if not self.target: return 0.0
+        return min(1.0, (self.accepted - self.started_with) / self.target)
+
+    def pause(self):
+        if self.status == "running" and self.orch.pause_pipeline():
+            self._set_status("paused")
+
+    def resume(self):
+        if self.status == "paused":
+            self.orch.resume_pipeline()
+            self._set_status("running")
+
+    def stop(self):
+        """No new questions are started; the ones in flight still finish and are recorded."""
+        self._stop_requested = True
+        if self.active:
+            self._set_status("stopping")
+            self.orch.stop_pipeline()
+
+    def join(self, timeout=None):
+        if self._thread is not None: self._thread.join(timeout)
+
+    # --- BACKGROUND THREAD ---
+    def _set_status(self, status):
+        self.status = status
+        self.events.put({"type": "status", "status": status})
+
+    def _run(self, target, source, workers):
+        try:
+            if source is not None or not self.orch.research_findings:
+                self._set_status("researching")
+                self.research_progress = None
+                findings = self.orch.perform_research(custom_file=source, progress=self._on_research_progress)
+                self.events.put({"type": "research", "findings": findings})
+            self.orch.init_generator()
+            if self._stop_requested:
+                self._set_status("stopped")
+                return
+            self._set_status("running")
+            self.orch.run_pipeline(target, workers=workers, on_result=self._on_result)
+            self._set_status("stopped" if self._stop_requested else "done")
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self._set_status("error")
+
+    def _on_research_progress(self, done, total):
+        self.research_progress = (done, total)
+        self.events.put({"type": "research_progress", "done": done, "total": total})
+
+    def _on_result(self, result):
+        # Left over when the target was reached: not an attempt (the question store keeps it)
+        if result.get("failure_type") == DISCARDED: return
+        line = (json.dumps(result, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self.results_path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            if "failure_type" in result:
+                self.rejected += 1
+            else:
+                self._offsets.append(offset)
+                self.accepted += 1
+        self.events.put({"type": "result", "result": result, "stats": dict(self.orch.stats)})
+
+    # --- UI SIDE ---
+    def poll(self, max_events=200):
+        """Drains pending events into `recent`. Returns (new results, latest stats or None)."""
+        results, stats = [], None
+        for _ in range(max_events):
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event["type"] == "result":
+                results.append(event["result"])
+                self.recent.append(event["result"])
+                stats = event["stats"]
+        return results, stats
+
+    def page(self, page, page_size=10):
+        """Accepted questions from storage, newest first: page 0 is the most recent `page_size`."""
+        with self._lock:
+            end = len(self._offsets) - page * page_size
+            offsets = self._offsets[max(0, end - page_size):max(0, end)]
+        records = []
+        if offsets:
+            with open(self.results_path, "rb") as f:
+                for offset in reversed(offsets):
+                    f.seek(offset)
+                    records.append(json.loads(f.readline()))
+        return records
+
+    def page_count(self, page_size=10):
+        return max(1, -(-len(self._offsets) // page_size))